@@ -4,8 +4,22 @@ import time
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 
+# bot імпортується під час завантаження модуля, а не в першому запиті: на
+# Vercel це відбувається під час ініціалізації інстансу, і таблиця хендлерів
+# будується один раз ще до першого апдейта.
+from bot import process_update, ensure_started
+
 app = FastAPI()
 
+@app.on_event("startup")
+async def startup():
+    # З TELEGRAM_BOT_USERNAME це без мережевих запитів (див. identity.py)
+    try:
+        await ensure_started()
+    except Exception as e:
+        # Наприклад, без TELEGRAM_BOT_USERNAME і без мережі: повторимо на першому апдейті
+        print("⚠️ Telegram application start deferred:", e)
+
 @app.get("/api/health")
 async def health():
     return {
@@ -25,9 +39,9 @@ async def telegram_webhook(request: Request):
         import json
         update_json = json.loads(text)
 
-        # Динамічний імпорт — тільки при запиті
-        from bot import process_update
-
+        # На Vercel функція заморожується одразу після відповіді, тому фонова
+        # черга (dispatch.UpdateDispatcher, див. server.py) тут не
+        # використовується — апдейт обробляється до відповіді.
         await process_update(update_json)
         return JSONResponse({"ok": True})
     except Exception as e:
@@ -0,0 +1,135 @@
+"""Локальний фейковий OpenAI‑сумісний сервер для перевірки `transport.py`.
+
+Відповідає на `POST /v1/chat/completions` (звичайні та потокові запити) з
+налаштовуваною затримкою і часткою помилок, тож можна відтворити 429 з
+`Retry-After`, 5xx, повільні «хвости» латентності та повну недоступність
+апстріму, не витрачаючи токени справжньої моделі.
+
+Запуск із кореня репозиторію:
+
+    python bench/fake_openai.py --port 8100 --latency 0.3 --slow-rate 0.05 --error-rate 0.1
+
+і далі бот (або `bench/transport_bench.py`) з `OPENAI_BASE_URL=http://127.0.0.1:8100/v1`.
+`GET /stats` повертає кількість отриманих запитів і згенерованих помилок.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def create_app(latency=0.2, slow_rate=0.0, slow_latency=5.0, error_rate=0.0, error_status=500,
+               retry_after=None, chunks=20, answer="Це тестова відповідь фейкового сервера.", echo=False):
+    """Створює застосунок фейкового сервера.
+
+    Args:
+        latency (float): Звичайна затримка до першого байта відповіді, секунди.
+        slow_rate (float): Частка «повільних» запитів (для перевірки хеджування).
+        slow_latency (float): Затримка повільного запиту, секунди.
+        error_rate (float): Частка запитів, що завершуються помилкою.
+        error_status (int): HTTP‑статус помилки (наприклад, 429 або 503).
+        retry_after (float | None): Значення заголовка `Retry-After` для помилок.
+        chunks (int): На скільки фрагментів ділити потокову відповідь.
+        answer (str): Текст відповіді.
+        echo (bool): Дописувати до відповіді останнє повідомлення користувача —
+            так навантажувальний тест перевіряє, що відповідь дійшла у свій чат.
+    """
+    app = FastAPI()
+    counters = {"requests": 0, "errors": 0, "slow": 0, "streams": 0}
+
+    def completion(model, content):
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    def chunk(model, content, finish_reason=None):
+        delta = {"content": content} if content else {}
+        return "data: " + json.dumps({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }, ensure_ascii=False) + "\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        counters["requests"] += 1
+        model = body.get("model", "fake")
+        delay = latency
+        if random.random() < slow_rate:
+            counters["slow"] += 1
+            delay = slow_latency
+        await asyncio.sleep(delay)
+        content = answer
+        if echo:
+            users = [m.get("content") for m in body.get("messages", ()) if m.get("role") == "user"]
+            if users and isinstance(users[-1], str):
+                content = f"{answer} [{users[-1]}]"
+        if random.random() < error_rate:
+            counters["errors"] += 1
+            headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+            return JSONResponse({"error": {"message": "fake upstream error", "type": "server_error"}},
+                                status_code=error_status, headers=headers)
+        if not body.get("stream"):
+            return JSONResponse(completion(model, content))
+
+        counters["streams"] += 1
+        step = max(1, len(content) // max(1, chunks))
+
+        async def events():
+            for i in range(0, len(content), step):
+                yield chunk(model, content[i:i + step])
+                await asyncio.sleep(0.02)
+            yield chunk(model, None, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return counters
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--echo", action="store_true")
+    args = parser.parse_args()
+    app = create_app(
+        latency=args.latency,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        chunks=args.chunks,
+        echo=args.echo,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Локальний фейковий Bot API для бенчмарків без справжнього Telegram.
+
+Відповідає на `POST /bot<token>/<method>` так, як очікує `python-telegram-bot`:
+`getMe` повертає користувача‑бота, методи `send*`/`edit*` — повідомлення в
+тому самому чаті (для `sendPhoto` — із `file_id`), решта — `true`. Затримку
+відповіді можна налаштувати, щоб відтворити мережевий round trip до Bot API,
+а частку відповідей 429 — щоб перевірити `ratelimit.SendScheduler`.
+
+Запуск із кореня репозиторію:
+
+    python bench/fake_telegram.py --port 8200 --latency 0.05 --rate-limit-rate 0.01
+
+і далі бот з `TELEGRAM_BASE_URL=http://127.0.0.1:8200/bot`.
+`GET /stats` повертає кількість викликів кожного методу та кількість 429.
+Для навантажувальних тестів (`bench/loadtest.py`) виклики можна записувати в
+`Recorder` і чекати на відповіді бота конкретному чату.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+from urllib.parse import parse_qs
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+_MULTIPART_FIELD = re.compile(rb'name="(chat_id|text|caption)"\r\n\r\n(.*?)\r\n--', re.S)
+
+
+class Recorder:
+    """Журнал викликів Bot API з очікуванням нових викликів за чатом.
+
+    Атрибути:
+        calls (list): Усі виклики як `(час perf_counter, метод, chat_id, текст)`.
+        by_chat (dict): Ті самі записи, згруповані за `chat_id`.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.by_chat = {}
+        self._events = {}
+
+    def record(self, method, chat_id, text) -> None:
+        entry = (time.perf_counter(), method, chat_id, text)
+        self.calls.append(entry)
+        self.by_chat.setdefault(chat_id, []).append(entry)
+        event = self._events.pop(chat_id, None)
+        if event is not None:
+            event.set()
+
+    async def wait(self, chat_id, count, timeout) -> bool:
+        """Чекає, доки чат отримає більше ніж `count` викликів.
+
+        Returns:
+            bool: `False`, якщо за `timeout` секунд нових викликів не було.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while len(self.by_chat.get(chat_id, ())) <= count:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            event = self._events.setdefault(chat_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+
+def _fields(body, content_type) -> dict:
+    if content_type.startswith("multipart/"):
+        return {name.decode(): value.decode("utf-8", "replace") for name, value in _MULTIPART_FIELD.findall(body)}
+    if content_type.startswith("application/json"):
+        return {key: str(value) for key, value in json.loads(body or b"{}").items()}
+    return {key: values[0] for key, values in parse_qs(body.decode("utf-8", "replace")).items()}
+
+
+def create_app(latency=0.0, username="fake_bot", rate_limit_rate=0.0, retry_after=1, recorder=None):
+    """Створює застосунок фейкового Bot API.
+
+    Args:
+        latency (float): Затримка кожної відповіді, секунди.
+        username (str): Username бота у відповіді `getMe`.
+        rate_limit_rate (float): Частка викликів `send*`/`edit*`, що отримують 429.
+        retry_after (int): Значення `retry_after` у відповіді 429, секунди.
+        recorder (Recorder | None): Куди записувати прийняті виклики.
+    """
+    app = FastAPI()
+    calls = {"throttled": 0}
+    message_ids = itertools.count(1)
+
+    def message(method, chat_id, text):
+        result = {
+            "message_id": next(message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text or "fake",
+        }
+        if method == "sendPhoto":
+            result["photo"] = [{"file_id": "fake-photo", "file_unique_id": "fake-photo", "width": 1, "height": 1}]
+        return result
+
+    @app.post("/bot{token}/{method}")
+    async def call(token: str, method: str, request: Request):
+        calls[method] = calls.get(method, 0) + 1
+        fields = _fields(await request.body(), request.headers.get("content-type", ""))
+        chat_id = int(fields["chat_id"]) if fields.get("chat_id", "").lstrip("-").isdigit() else None
+        text = fields.get("text") or fields.get("caption")
+        if latency:
+            await asyncio.sleep(latency)
+        sends = method.startswith(("send", "edit"))
+        if sends and rate_limit_rate and random.random() < rate_limit_rate:
+            calls["throttled"] += 1
+            # Як і справжній Bot API — HTTP 429: python-telegram-bot перетворює його на RetryAfter
+            return JSONResponse({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after},
+            }, status_code=429)
+        if recorder is not None:
+            recorder.record(method, chat_id, text)
+        if method == "getMe":
+            result = {"id": int(token.split(":", 1)[0]), "is_bot": True, "first_name": username,
+                      "username": username}
+        elif sends:
+            result = message(method, chat_id or 1, text)
+        else:
+            result = True
+        return {"ok": True, "result": result}
+
+    @app.get("/stats")
+    async def stats():
+        return calls
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+    app = create_app(latency=args.latency, rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+"""Наскрізний навантажувальний тест `server.py` з фейковими Telegram і OpenAI.
+
+Піднімає в одному процесі `bench/fake_telegram.py` (записує всі виклики Bot API
+і може відповідати 429) та `bench/fake_openai.py` (затримка, потокові
+відповіді, відлуння повідомлення користувача), запускає `uvicorn server:app`
+окремим процесом і надсилає на `/api/webhook` синтетичні апдейти від `--users`
+користувачів. Кожен користувач проходить сценарії всіх режимів — `/start`,
+`/gpt`, `/date` з кнопкою, `/message` з кнопкою, `/profile`, `/opener` — і
+надсилає наступний апдейт, лише коли бот відповів на попередній. Загальний
+темп апдейтів обмежує `--rps`.
+
+Звіт: пропускна здатність, p50/p95/p99 часу до першої відповіді та до кінця
+відповіді (загалом і за режимами), ріст RSS процесу сервера, а також
+коректність: кожен крок отримав відповідь, відповідь моделі дійшла у свій чат
+і жоден чат не отримав тексту іншого користувача.
+
+Запуск із кореня репозиторію:
+
+    python bench/loadtest.py --users 100 --rounds 2 --rps 50 --telegram-429-rate 0.01
+"""
+
+import argparse
+import asyncio
+import collections
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_openai  # noqa: E402
+import fake_telegram  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "123456:LOADTEST"
+MODES = ("start", "gpt", "date", "message", "profile", "opener")
+FIRST_CHAT_ID = 10_001
+TEXT_TOKEN = re.compile(r"\bu(\d+)r\d+s\d+\b")
+
+# Крок сценарію: текст або callback, чи має бот відповісти, і чий токен
+# має повернутися у відповіді моделі (фейковий OpenAI дописує його відлунням)
+Step = collections.namedtuple("Step", "kind payload expects echo", defaults=(True, None))
+
+
+def scenario(mode, chat_id, round_no) -> list:
+    """Повертає кроки сценарію режиму `mode` для одного користувача."""
+
+    def token(n):
+        return f"u{chat_id}r{round_no}s{n}"
+
+    if mode == "start":
+        return [Step("text", "/start")]
+    if mode == "gpt":
+        return [Step("text", "/gpt"), Step("text", token(1), echo=token(1))]
+    if mode == "date":
+        return [
+            Step("text", "/date"),
+            Step("callback", "date_grande"),
+            Step("text", token(1), echo=token(1)),
+            Step("text", token(2), echo=token(2)),
+        ]
+    if mode == "message":
+        return [
+            Step("text", "/message"),
+            Step("text", token(1), expects=False),
+            Step("text", token(2), expects=False),
+            Step("callback", "message_next", echo=token(2)),
+        ]
+    # /profile і /opener: п'ять відповідей, остання запускає генерацію
+    answers = [Step("text", token(n)) for n in range(1, 5)]
+    return [Step("text", "/" + mode), *answers, Step("text", token(5), echo=token(5))]
+
+
+def build_update(update_id, chat_id, step) -> dict:
+    user = {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}"}
+    chat = {"id": chat_id, "type": "private"}
+    if step.kind == "callback":
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": user,
+                "chat_instance": str(chat_id),
+                "data": step.payload,
+                "message": {"message_id": 1, "date": int(time.time()), "chat": chat, "text": "menu"},
+            },
+        }
+    message = {"message_id": update_id, "date": int(time.time()), "chat": chat, "from": user, "text": step.payload}
+    if step.payload.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(step.payload)}]
+    return {"update_id": update_id, "message": message}
+
+
+def rss_mb(pid):
+    """RSS процесу в МБ з `/proc` або `None`, якщо його не прочитати (не Linux)."""
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float("nan")
+
+
+class Pacer:
+    """Рівномірно розподіляє апдейти всіх користувачів: не більше `rate` за секунду."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        now = time.perf_counter()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class LoadTest:
+    """Стан одного прогону: відправлені апдейти, затримки та порушення коректності."""
+
+    def __init__(self, args, client, recorder):
+        self.args = args
+        self.client = client
+        self.recorder = recorder
+        self.pacer = Pacer(args.rps)
+        self.update_ids = iter(range(1, 10**9))
+        self.posted = 0
+        self.rejected = 0
+        self.first = collections.defaultdict(list)
+        self.done = collections.defaultdict(list)
+        self.unanswered = []
+        self.missing_echo = []
+
+    async def post(self, chat_id, step) -> bool:
+        await self.pacer.wait()
+        response = await self.client.post("/api/webhook", json=build_update(next(self.update_ids), chat_id, step))
+        self.posted += 1
+        if response.status_code != 200:
+            self.rejected += 1
+            return False
+        return True
+
+    async def run_step(self, mode, chat_id, step) -> None:
+        calls = self.recorder.by_chat.setdefault(chat_id, [])
+        seen = len(calls)
+        sent = time.perf_counter()
+        if not await self.post(chat_id, step) or not step.expects:
+            return
+        if not await self.recorder.wait(chat_id, seen, self.args.timeout):
+            self.unanswered.append((chat_id, mode, step.payload))
+            return
+        self.first[mode].append(calls[seen][0] - sent)
+        # Відповідь завершена, коли бот замовк на `quiet` секунд (і повернув токен кроку)
+        deadline = sent + self.args.timeout
+        while True:
+            echoed = step.echo is None or any(step.echo in (text or "") for _, _, _, text in calls[seen:])
+            quiet = self.args.quiet if echoed else max(0.0, deadline - time.perf_counter())
+            if not await self.recorder.wait(chat_id, len(calls), quiet):
+                break
+        if not echoed:
+            self.missing_echo.append((chat_id, mode, step.echo))
+        self.done[mode].append(calls[-1][0] - sent)
+
+    async def run_user(self, index) -> None:
+        chat_id = FIRST_CHAT_ID + index
+        for round_no in range(self.args.rounds):
+            for offset in range(len(self.args.modes)):
+                mode = self.args.modes[(index + round_no + offset) % len(self.args.modes)]
+                for step in scenario(mode, chat_id, round_no):
+                    await self.run_step(mode, chat_id, step)
+
+    def leaks(self) -> tuple:
+        """Повертає виклики з чужими токенами та виклики в невідомі чати."""
+        users = range(FIRST_CHAT_ID, FIRST_CHAT_ID + self.args.users)
+        foreign, stray = [], []
+        for _, method, chat_id, text in self.recorder.calls:
+            if chat_id is None or chat_id == 1:  # answerCallbackQuery і розігрів
+                continue
+            if chat_id not in users:
+                stray.append((method, chat_id))
+            for owner in TEXT_TOKEN.findall(text or ""):
+                if int(owner) != chat_id:
+                    foreign.append((method, chat_id, int(owner)))
+        return foreign, stray
+
+
+async def serve(app, port):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            await task  # помилка запуску (наприклад, зайнятий порт)
+        await asyncio.sleep(0.02)
+    return server, task
+
+
+async def wait_healthy(client, process, timeout) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server.py exited with code {process.returncode}")
+        try:
+            if (await client.get("/api/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("server.py did not become healthy")
+
+
+def server_env(args, workdir) -> dict:
+    return dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN=TOKEN,
+        TELEGRAM_BOT_USERNAME="loadtest_bot",
+        TELEGRAM_BASE_URL=f"http://127.0.0.1:{args.telegram_port}/bot",
+        TELEGRAM_GLOBAL_RATE=str(args.telegram_global_rate),
+        OPENAI_API_KEY="loadtest",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{args.openai_port}/v1",
+        OPENAI_STREAMING="0" if args.no_streaming else "1",
+        # Кеші, стан і журнали — у тимчасовому каталозі, щоб не змішувати з робочими
+        PHOTO_CACHE_PATH=os.path.join(workdir, "photo_ids.json"),
+        MENU_CACHE_PATH=os.path.join(workdir, "menus.sqlite3"),
+        RESPONSE_CACHE_PATH=os.path.join(workdir, "responses.sqlite3"),
+        HISTORY_PATH=os.path.join(workdir, "history.sqlite3"),
+        STATE_PATH=os.path.join(workdir, "state.sqlite3"),
+        TRACING_CONFIG_PATH=os.path.join(workdir, "tracing.json"),
+        DEDUP_PATH="",
+    )
+
+
+async def run(args, workdir):
+    recorder = fake_telegram.Recorder()
+    telegram_app = fake_telegram.create_app(
+        latency=args.telegram_latency, rate_limit_rate=args.telegram_429_rate, recorder=recorder
+    )
+    openai_app = fake_openai.create_app(
+        latency=args.openai_latency, error_rate=args.openai_error_rate, chunks=args.openai_chunks, echo=True
+    )
+    fakes = [await serve(telegram_app, args.telegram_port), await serve(openai_app, args.openai_port)]
+
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(args.port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=server_env(args, workdir), stdout=log, stderr=subprocess.STDOUT,
+    )
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=30)
+    try:
+        await wait_healthy(client, process, 60)
+        test = LoadTest(args, client, recorder)
+        # Розігрів: перший апдейт ініціалізує застосунок і завантажує ресурси
+        await test.run_step("warmup", 1, Step("text", "/start"))
+        test.first.clear()
+        test.done.clear()
+
+        samples = []
+
+        async def sample_rss():
+            while True:
+                samples.append(rss_mb(process.pid))
+                await asyncio.sleep(0.5)
+
+        sampler = asyncio.create_task(sample_rss())
+        calls_before = len(recorder.calls)
+        started = time.perf_counter()
+        await asyncio.gather(*(test.run_user(i) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+        samples.append(rss_mb(process.pid))
+
+        health = (await client.get("/api/health")).json()
+        report(test, elapsed, len(recorder.calls) - calls_before, samples, health.get("telegram") or {})
+        for name in ("dispatcher", "telegram", "openai_transport"):
+            if name in health:
+                print(f"{name}: {health[name]}")
+        print("fake telegram:", (await client.get(f"http://127.0.0.1:{args.telegram_port}/stats")).json())
+        print("fake openai:", (await client.get(f"http://127.0.0.1:{args.openai_port}/stats")).json())
+    except Exception:
+        log.flush()
+        with open(log.name, "r", encoding="utf-8", errors="replace") as f:
+            print(f.read()[-3000:], file=sys.stderr)
+        raise
+    finally:
+        await client.aclose()
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+        for server, task in fakes:
+            server.should_exit = True
+            await task
+
+
+def report(test, elapsed, bot_calls, samples, telegram) -> None:
+    args = test.args
+    steps = sum(len(v) for v in test.done.values())
+    print(f"users={args.users} rounds={args.rounds} target_rps={args.rps or 'unlimited'} elapsed={elapsed:.2f}s")
+    print(f"updates posted={test.posted} rejected={test.rejected} throughput={test.posted / elapsed:.1f} updates/s "
+          f"bot calls={bot_calls} ({bot_calls / elapsed:.1f}/s)")
+    rows = [("all", [x for v in test.first.values() for x in v], [x for v in test.done.values() for x in v])]
+    rows += [(mode, test.first[mode], test.done[mode]) for mode in args.modes]
+    for name, first, done in rows:
+        print(f"{name:>8}: steps={len(done):<6} first p50={pct(first, 0.5):.3f}s p95={pct(first, 0.95):.3f}s "
+              f"p99={pct(first, 0.99):.3f}s | done p50={pct(done, 0.5):.3f}s p95={pct(done, 0.95):.3f}s "
+              f"p99={pct(done, 0.99):.3f}s")
+    print(f"telegram 429: retried={telegram.get('retries', 0)} throttled={telegram.get('throttled', 0)}")
+    rss = [x for x in samples if x is not None]
+    if rss:
+        print(f"server RSS: start={rss[0]:.1f}MB peak={max(rss):.1f}MB end={rss[-1]:.1f}MB "
+              f"growth={rss[-1] - rss[0]:+.1f}MB")
+    else:
+        print("server RSS: n/a (no /proc)")
+
+    foreign, stray = test.leaks()
+    ok = not (test.unanswered or test.missing_echo or foreign or stray)
+    print(f"correctness: {'OK' if ok else 'FAILED'} answered={steps} unanswered={len(test.unanswered)} "
+          f"missing answers={len(test.missing_echo)} foreign texts={len(foreign)} stray chats={len(stray)}")
+    for name, items in (("unanswered", test.unanswered), ("missing answer", test.missing_echo),
+                        ("foreign text", foreign), ("stray chat", stray)):
+        for item in items[:5]:
+            print(f"  {name}: {item}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=1, help="скільки разів кожен користувач проходить усі режими")
+    parser.add_argument("--modes", default=",".join(MODES), help="режими через кому")
+    parser.add_argument("--rps", type=float, default=50.0, help="максимум апдейтів за секунду (0 — без обмеження)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="скільки чекати на відповідь кроку, с")
+    parser.add_argument("--quiet", type=float, default=1.5,
+                        help="тиша після останнього виклику Bot API, що означає кінець відповіді, с")
+    parser.add_argument("--connections", type=int, default=100)
+    parser.add_argument("--port", type=int, default=8300)
+    parser.add_argument("--telegram-port", type=int, default=8200)
+    parser.add_argument("--telegram-latency", type=float, default=0.02)
+    parser.add_argument("--telegram-429-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-global-rate", type=float, default=1000.0,
+                        help="TELEGRAM_GLOBAL_RATE сервера; справжній ліміт Telegram — 30")
+    parser.add_argument("--openai-port", type=int, default=8100)
+    parser.add_argument("--openai-latency", type=float, default=0.3)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-chunks", type=int, default=20)
+    parser.add_argument("--no-streaming", action="store_true", help="OPENAI_STREAMING=0 для сервера")
+    args = parser.parse_args()
+    args.modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = set(args.modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        asyncio.run(run(args, workdir))
+
+
+if __name__ == "__main__":
+    main()
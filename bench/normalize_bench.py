@@ -0,0 +1,106 @@
+"""Мікро‑бенчмарк нормалізації вхідних апдейтів.
+
+Порівнює попередній підхід (рекурсивний `normalize_dict` + повна NFKC
+нормалізація з encode/decode для кожного рядка апдейта) з поточним
+`util.normalize_update()`, який нормалізує лише текст користувача й має
+швидкий шлях для ASCII та вже нормалізованих рядків.
+
+Запуск із кореня репозиторію:
+
+    python bench/normalize_bench.py [--number 20000]
+"""
+
+import argparse
+import copy
+import os
+import sys
+import timeit
+import unicodedata
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util import normalize_update  # noqa: E402
+
+
+def legacy_normalize_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", errors="replace")
+    if not isinstance(value, str):
+        value = str(value)
+    value = unicodedata.normalize("NFKC", value)
+    return value.encode("utf-8", errors="replace").decode("utf-8", errors="replace")
+
+
+def legacy_normalize_dict(d):
+    if isinstance(d, dict):
+        return {k: legacy_normalize_dict(v) for k, v in d.items()}
+    elif isinstance(d, list):
+        return [legacy_normalize_dict(v) for v in d]
+    elif isinstance(d, str):
+        return legacy_normalize_text(d)
+    else:
+        return d
+
+
+CHAT = {"id": 123456789, "first_name": "Олена", "last_name": "Коваленко", "username": "olena_k", "type": "private"}
+USER = {"id": 123456789, "is_bot": False, "first_name": "Олена", "last_name": "Коваленко",
+        "username": "olena_k", "language_code": "uk"}
+
+SAMPLES = {
+    "command": {
+        "update_id": 1,
+        "message": {
+            "message_id": 10, "date": 1700000000, "chat": CHAT, "from": USER, "text": "/start",
+            "entities": [{"offset": 0, "length": 6, "type": "bot_command"}],
+        },
+    },
+    "text_uk": {
+        "update_id": 2,
+        "message": {
+            "message_id": 11, "date": 1700000001, "chat": CHAT, "from": USER,
+            "text": "Привіт! Як щодо кави в суботу? Я знаю чудове місце на Подолі ☕️",
+        },
+    },
+    "callback": {
+        "update_id": 3,
+        "callback_query": {
+            "id": "4382", "chat_instance": "-8712", "data": "date_grande", "from": USER,
+            "message": {
+                "message_id": 12, "date": 1700000002, "chat": CHAT,
+                "from": {"id": 42, "is_bot": True, "first_name": "TinderBolt", "username": "tinderbolt_bot"},
+                "text": "Оберіть, з ким хочете піти на побачення",
+                "reply_markup": {"inline_keyboard": [
+                    [{"text": "Аріана Гранде", "callback_data": "date_grande"}],
+                    [{"text": "Марго Роббі", "callback_data": "date_robbie"}],
+                    [{"text": "Зендея", "callback_data": "date_zendaya"}],
+                    [{"text": "Райан Гослінг", "callback_data": "date_gosling"}],
+                    [{"text": "Том Харді", "callback_data": "date_hardy"}],
+                ]},
+            },
+        },
+    },
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000, help="кількість ітерацій на зразок")
+    args = parser.parse_args()
+
+    print(f"{'update':<10} {'legacy, µs':>12} {'current, µs':>12} {'saved':>8}")
+    for name, sample in SAMPLES.items():
+        # normalize_update змінює словник на місці, тож кожна ітерація отримує
+        # власну копію, підготовлену заздалегідь (поза виміром часу).
+        copies = iter([copy.deepcopy(sample) for _ in range(args.number)])
+        legacy = timeit.timeit(lambda: legacy_normalize_dict(sample), number=args.number)
+        current = timeit.timeit(lambda: normalize_update(next(copies)), number=args.number)
+        legacy_us = legacy / args.number * 1e6
+        current_us = current / args.number * 1e6
+        saved = 1 - current_us / legacy_us if legacy_us else 0.0
+        print(f"{name:<10} {legacy_us:>12.2f} {current_us:>12.2f} {saved:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
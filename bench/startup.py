@@ -0,0 +1,126 @@
+"""Бенчмарк холодного старту: час імпорту `bot` і час до першої відповіді.
+
+Кожен прогін — окремий процес Python (як холодний старт функції на Vercel):
+він імпортує `bot`, обробляє апдейт `/start` і повідомляє, скільки тривав
+імпорт і скільки — обробка першого апдейта (разом з `application.initialize()`).
+Bot API підміняє `bench/fake_telegram.py` із затримкою `--latency`, тож видно
+ціну запиту `getMe`. Прогони виконуються у двох режимах: без
+`TELEGRAM_BOT_USERNAME` (звичайний `getMe`) і з ним (див. `identity.py`).
+
+Запуск із кореня репозиторію:
+
+    python bench/startup.py --runs 5 --latency 0.1
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import create_app  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "123456:BENCH"
+
+CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+import bot
+imported = time.perf_counter()
+
+async def main():
+    update = {
+        "update_id": 1,
+        "message": {
+            "message_id": 1, "date": int(time.time()), "text": "/start",
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Bench"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+    begun = time.perf_counter()
+    await bot.process_update(update)
+    print(json.dumps({"import": imported - started, "first_response": time.perf_counter() - begun}))
+
+asyncio.run(main())
+"""
+
+
+def top_imports(stderr, limit):
+    """Повертає найдовші імпорти верхнього рівня з виводу `-X importtime`."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if cumulative.strip().isdigit() and len(name) - len(name.lstrip()) == 1:
+            rows.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def run_child(base_url, username, workdir):
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN=TOKEN,
+        TELEGRAM_BOT_USERNAME=username,
+        TELEGRAM_BASE_URL=base_url,
+        OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "bench"),
+        # Кеші й журнали — у тимчасовому каталозі, щоб не змішувати з робочими
+        PHOTO_CACHE_PATH=os.path.join(workdir, "photo_ids.json"),
+        MENU_CACHE_PATH=os.path.join(workdir, "menus.sqlite3"),
+        RESPONSE_CACHE_PATH=os.path.join(workdir, "responses.sqlite3"),
+        HISTORY_PATH=os.path.join(workdir, "history.sqlite3"),
+        STATE_BACKEND="memory",
+        DEDUP_PATH="",
+    )
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    return timings, result.stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.1, help="затримка фейкового Bot API, с")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--top", type=int, default=8, help="скільки найдовших імпортів показати")
+    args = parser.parse_args()
+
+    server = uvicorn.Server(uvicorn.Config(create_app(latency=args.latency), port=args.port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    base_url = f"http://127.0.0.1:{args.port}/bot"
+
+    stderr = ""
+    with tempfile.TemporaryDirectory() as workdir:
+        for label, username in (("getMe", ""), ("preset identity", "bench_bot")):
+            imports, responses = [], []
+            for _ in range(args.runs):
+                timings, stderr = run_child(base_url, username, workdir)
+                imports.append(timings["import"])
+                responses.append(timings["first_response"])
+            print(f"{label:>16}: import median={statistics.median(imports):.3f}s "
+                  f"first response median={statistics.median(responses):.3f}s "
+                  f"total={statistics.median(imports) + statistics.median(responses):.3f}s")
+
+    print("slowest top-level imports (last run):")
+    for seconds, name in top_imports(stderr, args.top):
+        print(f"  {seconds:7.3f}s  {name}")
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Навантажувальна перевірка `ChatGptService` проти фейкового OpenAI‑сервера.
+
+Запускає `--requests` одноразових запитів (`--concurrency` одночасно) і
+друкує розподіл затримок, кількість помилок та лічильники
+`TransportPolicy` (повтори, хедж‑спроби, стан запобіжника).
+
+Запуск із кореня репозиторію (у сусідньому терміналі має працювати
+`bench/fake_openai.py`):
+
+    python bench/transport_bench.py --base-url http://127.0.0.1:8100/v1 --hedge
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gpt import ChatGptService  # noqa: E402
+from transport import CircuitBreaker, TransportPolicy  # noqa: E402
+
+
+async def run(args):
+    transport = TransportPolicy(
+        max_retries=args.retries,
+        hedge=args.hedge,
+        hedge_min_delay=args.hedge_min_delay,
+        breaker=CircuitBreaker(failure_threshold=args.breaker_threshold, reset_timeout=args.breaker_reset),
+    )
+    service = ChatGptService(token="fake", base_url=args.base_url, timeout=args.timeout, transport=transport)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = {}
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                # Різний текст — щоб не спрацювало об’єднання однакових запитів
+                await service.send_question("You are a benchmark.", f"request {i}")
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    await service.close()
+
+    latencies.sort()
+
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else float("nan")
+
+    print(f"requests={args.requests} ok={len(latencies)} errors={errors} elapsed={elapsed:.2f}s")
+    print(f"p50={pct(0.5):.3f}s p95={pct(0.95):.3f}s p99={pct(0.99):.3f}s max={pct(1.0):.3f}s")
+    print("transport:", transport.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8100/v1")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--hedge", action="store_true")
+    parser.add_argument("--hedge-min-delay", type=float, default=0.5)
+    parser.add_argument("--breaker-threshold", type=int, default=5)
+    parser.add_argument("--breaker-reset", type=float, default=30.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -13,29 +13,111 @@
 - /profile — генерація профілю
 - /opener — генерація першого повідомлення
 
-Примітка: модуль покладається на глобальні об’єкти `dialog` (стан діалогу) та
-`chatgpt` (сервіс взаємодії з OpenAI), визначені наприкінці файлу. Логіка коду не
-змінюється — додано лише докстрінги.
+Примітка: стан діалогу зберігається окремо для кожного чату у сховищі
+`sessions` (ключ — `effective_chat.id`); кожен хендлер отримує свою сесію через
+`sessions.get(...)` у локальну змінну `dialog`. Сервіс взаємодії з OpenAI —
+глобальний об’єкт `chatgpt`, визначений наприкінці файлу.
 """
 print(">>> bot.py LOADED")
+import asyncio
+import hashlib
+import math
 import os
+import time
 import telegram
-from telegram import Update
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ApplicationBuilder, MessageHandler, filters, CallbackQueryHandler, CommandHandler
 from dotenv import load_dotenv
 
 from gpt import *
 from util import *
+from session import SessionStore
+from dedup import UpdateDeduplicator
+from dispatch import update_chat_id
+from generations import GenerationTracker
+from transport import CircuitBreaker, TransportPolicy, api_errors
+from fair import FairScheduler, QuotaExceeded
+from state import MemoryBackend, SQLiteBackend
+from history import HistoryLog
+from identity import PresetIdentityBot, identity_from_token
+from metrics import handler_metrics
+from ratelimit import MeteredRequest
+from tracing import Tracer, mark, span
 
 load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "").strip()
 if TELEGRAM_BOT_TOKEN == "":
     print("⚠️ TELEGRAM_BOT_TOKEN is missing — running in limited mode")
+# Якщо username відомий, старт обходиться без запиту getMe (див. identity.py)
+TELEGRAM_BOT_USERNAME = os.getenv("TELEGRAM_BOT_USERNAME", "").strip()
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL", "https://api.telegram.org/bot").strip()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
 if OPENAI_API_KEY == "":
     print("⚠️ OPENAI_API_KEY is missing — GPT features disabled")
 
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", DEFAULT_BASE_URL).strip()
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_MAX_INFLIGHT = int(os.getenv("OPENAI_MAX_INFLIGHT", "32"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "32"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+
+# Бюджет токенів моделі на чат за ковзне вікно (див. fair.py)
+USER_TOKEN_BUDGET = int(os.getenv("USER_TOKEN_BUDGET", "50000"))
+USER_BUDGET_WINDOW = float(os.getenv("USER_BUDGET_WINDOW", "3600"))
+
+SESSION_TTL = float(os.getenv("SESSION_TTL", "86400"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "100000"))
+# sqlite — спільний стан для кількох воркерів на одній машині
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").strip().lower()
+STATE_PATH = os.getenv("STATE_PATH", ".cache/state.sqlite3").strip()
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "0.05"))
+STATE_LOCK_TTL = float(os.getenv("STATE_LOCK_TTL", "15"))
+# Кількість воркерів uvicorn (`WEB_CONCURRENCY` — і значення `--workers` за замовчуванням)
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Журнал історій чатів, що переживає перезапуск; порожній шлях — вимкнено
+HISTORY_PATH = os.getenv("HISTORY_PATH", "").strip()
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.2"))
+HISTORY_COMPACT_THRESHOLD = int(os.getenv("HISTORY_COMPACT_THRESHOLD", "200"))
+# Трасування апдейтів (див. tracing.py); файл TRACING_CONFIG_PATH змінює це під час роботи
+TRACE_SAMPLE = float(os.getenv("TRACE_SAMPLE", "0"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "0")) or None
+PROFILE_EVERY = int(os.getenv("PROFILE_EVERY", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".cache/profiles").strip()
+TRACING_CONFIG_PATH = os.getenv("TRACING_CONFIG_PATH", ".cache/tracing.json").strip() or None
+DEDUP_WINDOW = float(os.getenv("DEDUP_WINDOW", "86400"))
+DEDUP_PATH = os.getenv("DEDUP_PATH", "").strip() or (STATE_PATH if STATE_BACKEND == "sqlite" else None)
+
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", "3600"))
+CONVERSATION_MAX = int(os.getenv("CONVERSATION_MAX", "50000"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_KEEP_RECENT = int(os.getenv("CONTEXT_KEEP_RECENT", "6"))
+CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "400"))
+OPENAI_STREAMING = os.getenv("OPENAI_STREAMING", "1").strip() not in ("0", "false", "no")
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+RESPONSE_CACHE_MAX = int(os.getenv("RESPONSE_CACHE_MAX", "10000"))
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o").strip()
+GENERATION_PROFILES_PATH = os.getenv("GENERATION_PROFILES_PATH", "resources/generation_profiles.json").strip() or None
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "8"))
+OPENAI_HEDGE = os.getenv("OPENAI_HEDGE", "0").strip() in ("1", "true", "yes")
+OPENAI_HEDGE_MIN_DELAY = float(os.getenv("OPENAI_HEDGE_MIN_DELAY", "2"))
+OPENAI_BREAKER_THRESHOLD = int(os.getenv("OPENAI_BREAKER_THRESHOLD", "5"))
+OPENAI_BREAKER_RESET = float(os.getenv("OPENAI_BREAKER_RESET", "30"))
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "").strip() or None
+
+def question_key(prompt_name, message_text) -> str:
+    """Короткий ключ одноразового запиту для callback‑даних кнопки (ліміт Telegram — 64 байти)."""
+    return hashlib.sha1(f"{prompt_name}\n{message_text}".encode("utf-8")).hexdigest()[:16]
+
+def regenerate_markup(prompt_name, message_text):
+    """Кнопка під кешованою відповіддю: генерує новий варіант саме цього запиту в обхід кешу."""
+    key = question_key(prompt_name, message_text)
+    return InlineKeyboardMarkup([[InlineKeyboardButton("🔄 Інший варіант", callback_data=f"regenerate:{key}")]])
+
+@handler_metrics
 async def start(update, context):
   """Обробник команди /start: показує головне меню та вимикає режим ChatGPT.
 
@@ -45,10 +127,11 @@ async def start(update, context):
           `python-telegram-bot`.
 
   Side Effects:
-      - Оновлює глобальний стан `dialog.mode` на `None`.
+      - Оновлює стан сесії чату `dialog.mode` на `None`.
       - Надсилає фото та кілька текстових повідомлень у чат.
       - Встановлює команди бота та відображає головне меню з кнопками.
   """
+  dialog = sessions.get(update.effective_chat.id)
   dialog.mode = None
   await send_text(update, context, "Режим ChatGPT вимкнено. Ви у головному меню ✅")
 
@@ -65,6 +148,7 @@ async def start(update, context):
       "gpt": "Задати питання ChatGPT \U0001F9E0",
   })
 
+@handler_metrics
 async def gpt(update, context):
     """Активує режим «gpt» і показує інструкції користувачу.
 
@@ -76,11 +160,13 @@ async def gpt(update, context):
         - Встановлює `dialog.mode = "gpt"`.
         - Надсилає зображення та текст із ресурсу `messages/gpt.txt`.
     """
+    dialog = sessions.get(update.effective_chat.id)
     dialog.mode = "gpt"
     await send_photo(update, context, "gpt")
     msg = load_message("gpt")
     await send_text(update, context, msg)
 
+@handler_metrics
 async def gpt_dialog(update, context):
     """Діалоговий хендлер для режиму «gpt» — надсилає питання до ChatGPT.
 
@@ -93,12 +179,26 @@ async def gpt_dialog(update, context):
 
     Side Effects:
         - Відповідає у чаті текстом, згенерованим ШІ.
+        - Якщо відповідь витіснив новіший апдейт чату, повідомляє, що її
+          скасовано.
     """
-    text = normalize_text(update.message.text)
+    text = update.message.text
     prompt = load_prompt("gpt")
-    answer = await chatgpt.send_question(prompt, text)
-    await send_text(update, context, answer)
 
+    async def reply():
+        try:
+            answer = await chatgpt.send_question(prompt, text, prompt_name="gpt", chat_id=update.effective_chat.id)
+        except asyncio.CancelledError:
+            # Заглушки тут немає, тож замість її видалення пояснюємо, куди поділася відповідь
+            await send_text(update, context, load_message("superseded"))
+            raise
+        except (*api_errors(), QuotaExceeded) as e:
+            answer = failure_message(e)
+        await send_text(update, context, answer)
+
+    await generations.run(update.effective_chat.id, update.update_id, reply())
+
+@handler_metrics
 async def date(update, context):
     """Активує режим «date» і показує вибір персонажу для діалогу.
 
@@ -111,6 +211,7 @@ async def date(update, context):
         - Надсилає фото та повідомлення з кнопками вибору (callback data
           `date_*`).
     """
+    dialog = sessions.get(update.effective_chat.id)
     dialog.mode = "date"
     msg = load_message("date")
     await send_photo(update, context, "date")
@@ -122,6 +223,7 @@ async def date(update, context):
         "date_hardy":"Том Харді",
     })
 
+@handler_metrics
 async def date_button(update, context):
     """Обробляє натискання кнопок у режимі «date».
 
@@ -135,32 +237,74 @@ async def date_button(update, context):
     Side Effects:
         - Відповідає на `callback_query`.
         - Надсилає фото.
-        - Встановлює промпт у `chatgpt` через `set_prompt()`.
+        - Починає нову розмову чату в `chatgpt` через `set_prompt()`.
     """
     query = update.callback_query.data
     await update.callback_query.answer()
     await send_photo(update, context, query)
     await send_text(update, context, "Гарний вибір. \U0001F60E Ваша задача - запросити дівчину,хлопця за п'ять повідомлень ! \U0001F525")
     prompt = load_prompt(query)
-    chatgpt.set_prompt(prompt)
+    chatgpt.set_prompt(prompt, chat_id=update.effective_chat.id, prompt_name=query)
 
 
+@handler_metrics
 async def date_dialog(update, context):
     """Діалог у режимі «date» — передає повідомлення користувача до ШІ.
 
     Показує службове повідомлення «набирає повідомлення», відправляє введений
-    текст у `ChatGptService.add_message()` (використовуючи встановлений раніше
-    системний промпт), після чого редагує службове повідомлення відповіддю.
+    текст у `ChatGptService.stream_message()` (використовуючи встановлений
+    раніше системний промпт) і поступово редагує службове повідомлення в міру
+    генерації відповіді.
 
     Args:
         update: Об’єкт `telegram.Update` з текстом повідомлення.
         context: Об’єкт контексту `ContextTypes.DEFAULT_TYPE`.
     """
-    text = normalize_text(update.message.text)
-    my_message = await send_text(update, context, "набирає повідомлення")
-    answer = await chatgpt.add_message(text)
-    await my_message.edit_text(answer)
+    text = update.message.text
+    answer = chatgpt.stream_message(text, chat_id=update.effective_chat.id)
+    await stream_reply(update, context, "набирає повідомлення", answer)
+
+async def stream_reply(update, context, placeholder, parts, reply_markup=None):
+    """Показує заглушку й поступово замінює її текстом, що генерується.
+
+    Генерація реєструється як поточна для чату в `generations`: новіший апдейт
+    цього чату (наступне повідомлення, /start, інша кнопка) скасовує її, а
+    заглушка видаляється, щоб не лишати в чаті застарілу відповідь. Якщо
+    модель недоступна або чат вичерпав бюджет токенів, заглушка замінюється
+    поясненням (див. `failure_message()`).
+
+    Args:
+        update: Об’єкт `telegram.Update`.
+        context: Об’єкт контексту `ContextTypes.DEFAULT_TYPE`.
+        placeholder (str): Службовий текст, що показується до відповіді.
+        parts: Асинхронний ітератор фрагментів відповіді.
+        reply_markup (InlineKeyboardMarkup | None): Кнопки під готовою відповіддю.
+    """
+    async def reply():
+        my_message = await send_text(update, context, placeholder)
+        try:
+            await edit_progressively(my_message, parts, STREAM_EDIT_INTERVAL, reply_markup=reply_markup)
+        except asyncio.CancelledError:
+            await delete_message(my_message)
+            raise
+        except (*api_errors(), QuotaExceeded) as e:
+            text = failure_message(e)
+            await send_scheduler.call(my_message.chat_id, lambda: my_message.edit_text(text))
+
+    await generations.run(update.effective_chat.id, update.update_id, reply())
+
+def failure_message(error) -> str:
+    """Повертає текст для користувача, якщо відповідь не вдалося згенерувати.
+
+    Args:
+        error (Exception): `QuotaExceeded`, `CircuitOpen` або помилка `openai`.
+    """
+    if isinstance(error, QuotaExceeded):
+        return load_message("quota").format(minutes=max(1, math.ceil(error.retry_after / 60)))
+    print("OpenAI request failed:", repr(error))
+    return load_message("unavailable")
 
+@handler_metrics
 async def message(update, context):
     """Активує режим «message» — підготовка до генерації реплік.
 
@@ -174,6 +318,7 @@ async def message(update, context):
           `message_date`).
         - Очищає `dialog.list` — тимчасову історію чату користувача.
     """
+    dialog = sessions.get(update.effective_chat.id)
     dialog.mode = "message"
     msg = load_message("message")
     await send_photo(update, context, "message")
@@ -183,6 +328,7 @@ async def message(update, context):
     })
     dialog.list.clear()
 
+@handler_metrics
 async def message_dialog(update, context):
     """Агрегує повідомлення користувача у режимі «message».
 
@@ -193,14 +339,16 @@ async def message_dialog(update, context):
     Side Effects:
         - Додає текст повідомлення до списку `dialog.list`.
     """
-    text = normalize_text(update.message.text)
+    dialog = sessions.get(update.effective_chat.id)
+    text = update.message.text
     dialog.list.append(text)
 
+@handler_metrics
 async def message_button(update, context):
     """Обробляє кнопки у режимі «message» і генерує відповідь ШІ.
 
     Формує промпт на основі вибраної кнопки та передає агреговану історію
-    повідомлень користувача до `ChatGptService.send_question()`.
+    повідомлень користувача до `ChatGptService.stream_question()`.
 
     Args:
         update: Об’єкт `telegram.Update` із `callback_query`.
@@ -211,16 +359,64 @@ async def message_button(update, context):
         - Показує службове повідомлення «Думаю над варіантами...», яке далі
           редагується відповіддю ШІ.
     """
+    dialog = sessions.get(update.effective_chat.id)
     query = update.callback_query.data
     await update.callback_query.answer()
 
-    prompt = load_prompt(query)
     user_chat_history = "\n\n".join(dialog.list)
+    await send_answer(update, context, query, user_chat_history, "Думаю над варіантами...")
+
+async def send_answer(update, context, prompt_name, message_text, placeholder, regenerate=False):
+    """Генерує разову відповідь за промптом із кешем і кнопкою «Інший варіант».
+
+    Запит запам’ятовується в `dialog.last_question`, щоб кнопка
+    «🔄 Інший варіант» могла повторити його в обхід кешу відповідей; ключ
+    запиту (`question_key()`) передається в callback‑даних кнопки.
+
+    Args:
+        update: Об’єкт `telegram.Update`.
+        context: Об’єкт контексту `ContextTypes.DEFAULT_TYPE`.
+        prompt_name (str): Назва промпту з `resources/prompts`.
+        message_text (str): Дані користувача для промпту.
+        placeholder (str): Службовий текст, що показується до відповіді.
+        regenerate (bool): Ігнорувати збережену відповідь і згенерувати нову.
+    """
+    dialog = sessions.get(update.effective_chat.id)
+    dialog.last_question = (prompt_name, message_text, placeholder)
 
-    my_message = await send_text(update, context, "Думаю над варіантами...")
-    answer = await chatgpt.send_question(prompt, user_chat_history)
-    await my_message.edit_text(answer)
+    answer = chatgpt.stream_question(
+        load_prompt(prompt_name), message_text, prompt_name=prompt_name, cache=True, regenerate=regenerate,
+        chat_id=update.effective_chat.id,
+    )
+    await stream_reply(update, context, placeholder, answer,
+                       reply_markup=regenerate_markup(prompt_name, message_text))
 
+@handler_metrics
+async def regenerate_button(update, context):
+    """Обробляє кнопку «🔄 Інший варіант» — повторює запит без кешу.
+
+    Сесія пам’ятає лише останній запит (`dialog.last_question`), тож кнопка
+    під старішою відповіддю (ключ у callback‑даних не збігається) нічого не
+    генерує, а лише пояснює це користувачу.
+
+    Args:
+        update: Об’єкт `telegram.Update` із `callback_query`.
+        context: Об’єкт контексту `ContextTypes.DEFAULT_TYPE`.
+    """
+    dialog = sessions.get(update.effective_chat.id)
+    _, _, key = update.callback_query.data.partition(":")
+    if dialog.last_question is None:
+        await update.callback_query.answer()
+        await send_text(update, context, "Немає запиту, який можна повторити.")
+        return
+    prompt_name, message_text, placeholder = dialog.last_question
+    if key and key != question_key(prompt_name, message_text):
+        await update.callback_query.answer("Інший варіант можна отримати лише для останньої відповіді.")
+        return
+    await update.callback_query.answer()
+    await send_answer(update, context, prompt_name, message_text, placeholder, regenerate=True)
+
+@handler_metrics
 async def profile(update, context):
     """Активує режим «profile» — збір даних для генерації профілю.
 
@@ -234,6 +430,7 @@ async def profile(update, context):
         - Очищає `dialog.user` і скидає лічильник `dialog.counter`.
         - Запитує перше поле анкети (вік).
     """
+    dialog = sessions.get(update.effective_chat.id)
     dialog.mode = "profile"
     msg = load_message("profile")
     await send_photo(update, context, "profile")
@@ -244,12 +441,13 @@ async def profile(update, context):
     await send_text(update, context, "Скільки вам років ?")
 
 
+@handler_metrics
 async def profile_dialog(update, context):
     """Покроково збирає дані профілю користувача та генерує результат.
 
     Під час кожного повідомлення збільшує лічильник кроків і заповнює
     відповідні поля у `dialog.user`. На фінальному кроці формує текст профілю
-    через `ChatGptService.send_question()` із промптом `profile`.
+    через `ChatGptService.stream_question()` із промптом `profile`.
 
     Args:
         update: Об’єкт `telegram.Update` з текстом.
@@ -260,7 +458,8 @@ async def profile_dialog(update, context):
         - Надсилає проміжні підказки.
         - Редагує службове повідомлення з готовим профілем.
     """
-    text = normalize_text(update.message.text)
+    dialog = sessions.get(update.effective_chat.id)
+    text = update.message.text
     dialog.counter += 1
 
     if dialog.counter == 1:
@@ -277,13 +476,10 @@ async def profile_dialog(update, context):
         await send_text(update, context, "Мета знайомства ?")
     if dialog.counter == 5:
         dialog.user["goals"] = text
-        prompt = load_prompt("profile")
         user_info = dialog_user_info_to_str(dialog.user)
+        await send_answer(update, context, "profile", user_info, "ChatGPT генерує ваш профіль. Зачекайте декільки секунд.")
 
-        my_message = await send_text(update, context, "ChatGPT генерує ваш профіль. Зачекайте декільки секунд.")
-        answer = await chatgpt.send_question(prompt, user_info)
-        await my_message.edit_text(answer)
-
+@handler_metrics
 async def opener(update, context):
     """Активує режим «opener» — збір даних для першого повідомлення.
 
@@ -296,6 +492,7 @@ async def opener(update, context):
         - Очищає `dialog.user`, скидає `dialog.counter`.
         - Надсилає фото, текст і запитує ім’я партнера.
     """
+    dialog = sessions.get(update.effective_chat.id)
     dialog.mode = "opener"
     msg = load_message("opener")
     await send_photo(update, context, "opener")
@@ -306,18 +503,20 @@ async def opener(update, context):
     await send_text(update, context, "Ім'я партнера ?")
 
 
+@handler_metrics
 async def opener_dialog(update, context):
     """Покроково збирає дані й формує «опенер» через ШІ.
 
     На кожному кроці заповнює одне поле в `dialog.user`. На фінальному кроці
-    викликає `ChatGptService.send_question()` із промптом `opener` і
-    редагує службове повідомлення відповіддю.
+    викликає `ChatGptService.stream_question()` із промптом `opener` і
+    поступово редагує службове повідомлення відповіддю.
 
     Args:
         update: Об’єкт `telegram.Update` з текстом.
         context: Об’єкт контексту `ContextTypes.DEFAULT_TYPE`.
     """
-    text = normalize_text(update.message.text)
+    dialog = sessions.get(update.effective_chat.id)
+    text = update.message.text
     dialog.counter += 1
 
     if dialog.counter == 1:
@@ -334,12 +533,8 @@ async def opener_dialog(update, context):
         await send_text(update, context, "Мета знайомства ?")
     if dialog.counter == 5:
         dialog.user["goals"] = text
-        prompt = load_prompt("opener")
         user_info = dialog_user_info_to_str(dialog.user)
-
-        my_message = await send_text(update, context, "ChatGPT генерує ваше повідомлення...")
-        answer = await chatgpt.send_question(prompt, user_info)
-        await my_message.edit_text(answer)
+        await send_answer(update, context, "opener", user_info, "ChatGPT генерує ваше повідомлення...")
 
 
 
@@ -353,6 +548,7 @@ async def hello(update, context):
       update: Об’єкт `telegram.Update` з текстом.
       context: Об’єкт контексту `ContextTypes.DEFAULT_TYPE`.
   """
+  dialog = sessions.get(update.effective_chat.id)
   if dialog.mode == "gpt":
     await gpt_dialog(update, context)
   elif dialog.mode == "date":
@@ -380,16 +576,101 @@ async def buttons_handler(update, context):
     elif query == "stop":
         await send_text(update, context, "Stopped")
 
-dialog = Dialog()
-dialog.mode = None
-dialog.list = []
-dialog.user = {}
-dialog.counter = 0
-
-chatgpt = ChatGptService(token=OPENAI_API_KEY)
-
-# Глобальний application, створюється один раз
-application = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+# Відсутній ресурс має зупинити старт, а не зламати діалог посередині
+resources.require("messages", [
+    "main", "gpt", "date", "message", "profile", "opener", "unavailable", "quota", "superseded",
+])
+resources.require("prompts", [
+    "gpt", "date_grande", "date_robbie", "date_zendaya", "date_gosling", "date_hardy",
+    "message_next", "message_date", "profile", "opener", "summary",
+])
+
+if STATE_BACKEND == "sqlite":
+    state_backend = SQLiteBackend(
+        STATE_PATH, flush_interval=STATE_FLUSH_INTERVAL, retention=max(SESSION_TTL, CONVERSATION_TTL),
+        lock_ttl=STATE_LOCK_TTL,
+    )
+elif STATE_BACKEND == "memory":
+    state_backend = MemoryBackend()
+else:
+    raise ValueError(f"Unknown STATE_BACKEND: {STATE_BACKEND}")
+
+if WORKERS > 1:
+    if STATE_BACKEND == "memory":
+        print(f"⚠️ {WORKERS} workers with STATE_BACKEND=memory — chat state is not shared between workers")
+    # Бекенд спільний лише для сесій, розмов і дедуплікації; решта — у пам’яті воркера
+    print(f"⚠️ {WORKERS} workers: token budgets, superseding of stale generations and Bot API rate limits "
+          "are enforced per worker")
+
+history = HistoryLog(
+    HISTORY_PATH, flush_interval=HISTORY_FLUSH_INTERVAL, compact_threshold=HISTORY_COMPACT_THRESHOLD
+) if HISTORY_PATH else None
+
+sessions = SessionStore(Dialog, ttl=SESSION_TTL, max_size=SESSION_MAX, backend=state_backend, namespace="sessions",
+                        history=history)
+dedup = UpdateDeduplicator(window=DEDUP_WINDOW, path=DEDUP_PATH)
+generations = GenerationTracker()
+tracer = Tracer(
+    sample=TRACE_SAMPLE,
+    slow_ms=TRACE_SLOW_MS,
+    profile_every=PROFILE_EVERY,
+    profile_dir=PROFILE_DIR,
+    config_path=TRACING_CONFIG_PATH,
+    check_interval=float(os.getenv("RESOURCE_RELOAD_INTERVAL", "5")),
+)
+
+chatgpt = ChatGptService(
+    token=OPENAI_API_KEY,
+    base_url=OPENAI_BASE_URL,
+    timeout=OPENAI_TIMEOUT,
+    max_inflight=OPENAI_MAX_INFLIGHT,
+    max_connections=OPENAI_MAX_CONNECTIONS,
+    keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+    conversation_ttl=CONVERSATION_TTL,
+    state_backend=state_backend,
+    history=history,
+    max_conversations=CONVERSATION_MAX,
+    context_window=ContextWindow(
+        budget=CONTEXT_TOKEN_BUDGET,
+        keep_recent=CONTEXT_KEEP_RECENT,
+        summary_tokens=CONTEXT_SUMMARY_TOKENS,
+    ),
+    streaming=OPENAI_STREAMING,
+    model=OPENAI_MODEL,
+    profiles=GenerationProfiles(
+        GenerationProfile(OPENAI_MODEL, timeout=OPENAI_TIMEOUT),
+        path=GENERATION_PROFILES_PATH,
+        check_interval=float(os.getenv("RESOURCE_RELOAD_INTERVAL", "5")),
+    ),
+    scheduler=FairScheduler(
+        max_inflight=OPENAI_MAX_INFLIGHT,
+        token_budget=USER_TOKEN_BUDGET or None,
+        budget_window=USER_BUDGET_WINDOW,
+    ),
+    transport=TransportPolicy(
+        max_retries=OPENAI_MAX_RETRIES,
+        backoff_base=OPENAI_BACKOFF_BASE,
+        backoff_max=OPENAI_BACKOFF_MAX,
+        hedge=OPENAI_HEDGE,
+        hedge_min_delay=OPENAI_HEDGE_MIN_DELAY,
+        breaker=CircuitBreaker(failure_threshold=OPENAI_BREAKER_THRESHOLD, reset_timeout=OPENAI_BREAKER_RESET),
+    ),
+    response_cache=ResponseCache(ttl=RESPONSE_CACHE_TTL, max_size=RESPONSE_CACHE_MAX, path=RESPONSE_CACHE_PATH),
+)
+
+# Глобальний application, створюється один раз. Пул з'єднань — як у
+# ApplicationBuilder за замовчуванням; MeteredRequest пише метрики викликів Bot API.
+bot_identity = identity_from_token(TELEGRAM_BOT_TOKEN, TELEGRAM_BOT_USERNAME)
+if bot_identity is not None:
+    application = ApplicationBuilder().bot(PresetIdentityBot(
+        TELEGRAM_BOT_TOKEN,
+        identity=bot_identity,
+        base_url=TELEGRAM_BASE_URL,
+        request=MeteredRequest(connection_pool_size=256),
+    )).build()
+else:
+    application = (ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).base_url(TELEGRAM_BASE_URL)
+                   .request(MeteredRequest(connection_pool_size=256)).build())
 
 # Реєстрація хендлерів
 application.add_handler(CommandHandler("start", start))
@@ -402,27 +683,73 @@ application.add_handler(CommandHandler("opener", opener))
 application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, hello))
 application.add_handler(CallbackQueryHandler(date_button, pattern="^date_.*"))
 application.add_handler(CallbackQueryHandler(message_button, pattern="^message_.*"))
+application.add_handler(CallbackQueryHandler(regenerate_button, pattern="^regenerate(:|$)"))
 
-async def process_update(update_json: dict):
-    """Обробка webhook‑апдейту."""
-    # Нормалізація вхідного JSON (текстових значень)
-    def normalize_dict(d):
-        if isinstance(d, dict):
-            return {k: normalize_dict(v) for k, v in d.items()}
-        elif isinstance(d, list):
-            return [normalize_dict(v) for v in d]
-        elif isinstance(d, str):
-            return normalize_text(d)
-        else:
-            return d
-
-    update_json = normalize_dict(update_json)
-    update = telegram.Update.de_json(update_json, application.bot)
-
-    # Ініціалізуємо application один раз
-    if not application.running:
-        await application.initialize()
-        await application.start()
+application_lock = asyncio.Lock()
 
-    await application.process_update(update)
+async def ensure_started():
+    """Ініціалізує й запускає `application` один раз (без гонки між апдейтами).
 
+    З `TELEGRAM_BOT_USERNAME` ініціалізація не робить мережевих запитів, тож її
+    можна викликати заздалегідь, під час старту процесу.
+    """
+    if not application.running:
+        async with application_lock:
+            if not application.running:
+                await application.initialize()
+                await application.start()
+
+async def process_update(update_json: dict):
+    """Обробка webhook‑апдейту.
+
+    Повторні доставки того самого `update_id` (у тому числі ті, що прийшли,
+    поки перша ще обробляється) відкидаються через `dedup`. Апдейти одного
+    чату обробляються під блокуванням `state_backend`: сесія й розмова чату
+    підтягуються зі сховища перед обробкою і зберігаються після неї, тож
+    кілька воркерів бачать той самий стан. Чат, якого немає в пам’яті (перший
+    апдейт після перезапуску), відновлюється з журналу `history`.
+    """
+    update_id = update_json.get("update_id")
+    if update_id is not None and not await dedup.begin(update_id):
+        print(f"Duplicate update {update_id} skipped")
+        return
+
+    # Новіший апдейт чату робить незавершену генерацію для нього застарілою
+    chat_id = update_chat_id(update_json)
+    generations.supersede(chat_id, update_id)
+
+    ok = False
+    try:
+        async with tracer.trace(update_id, chat_id):
+            # Нормалізація тексту користувача — єдина на шляху апдейта
+            with span("normalize"):
+                update_json = normalize_update(update_json)
+            with span("de_json"):
+                update = telegram.Update.de_json(update_json, application.bot)
+
+            with span("start"):
+                await ensure_started()
+
+            if chat_id is None:
+                with span("handle"):
+                    await application.process_update(update)
+            else:
+                locking = time.perf_counter()
+                async with state_backend.lock("chat", chat_id):
+                    mark("lock", locking)
+                    with span("load_state"):
+                        await sessions.refresh(chat_id)
+                        await chatgpt.conversations.refresh(chat_id)
+                        await sessions.rehydrate(chat_id)
+                        await chatgpt.conversations.rehydrate(chat_id)
+                    try:
+                        with span("handle"):
+                            await application.process_update(update)
+                    finally:
+                        with span("persist"):
+                            sessions.persist(chat_id)
+                            chatgpt.conversations.persist(chat_id)
+        ok = True
+    finally:
+        if update_id is not None:
+            await dedup.finish(update_id, ok)
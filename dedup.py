@@ -0,0 +1,174 @@
+"""Ідемпотентна обробка апдейтів: відсікання повторних доставок за `update_id`.
+
+Telegram повторно доставляє апдейт, якщо webhook відповів помилкою або не
+встиг відповісти. Без захисту така повторна доставка запускає ще одну дорогу
+генерацію і дублює відповідь у чаті. `UpdateDeduplicator` пам’ятає:
+
+- апдейти, що зараз обробляються (in‑flight) — дублікат, який прийшов під час
+  обробки, відкидається одразу;
+- успішно оброблені апдейти протягом `window` секунд (обмежено `max_entries`).
+
+Якщо обробка завершилась помилкою, `update_id` забувається, щоб наступна
+доставка могла спробувати ще раз.
+
+За потреби стан дублюється у SQLite‑файлі (`path`), і тоді дедуплікація
+працює між кількома процесами‑воркерами на одній машині: право на обробку
+апдейта атомарно «захоплюється» вставкою рядка. Файл відкривається під час
+першого апдейта, а запити до нього виконуються у фоновому потоці
+(`asyncio.to_thread`), тож очікування на блокування SQLite не зупиняє цикл
+подій.
+
+Використання (псевдокод):
+
+    dedup = UpdateDeduplicator(window=86400, path=".cache/updates.sqlite3")
+    if await dedup.begin(update_id):
+        try:
+            await handle(update)
+            await dedup.finish(update_id, ok=True)
+        except Exception:
+            await dedup.finish(update_id, ok=False)
+            raise
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class UpdateDeduplicator:
+    """Обмежена множина побачених `update_id` із часовим вікном.
+
+    Атрибути:
+        window (float): Скільки секунд пам’ятати оброблений апдейт.
+        max_entries (int): Ліміт записів у пам’яті.
+        inflight_timeout (float): Через скільки секунд «завислий» in‑flight
+            запис у SQLite (наприклад, після падіння воркера) можна перехопити.
+        duplicates (int): Скільки повторних доставок відкинуто.
+    """
+
+    def __init__(self, window=86400.0, max_entries=100_000, inflight_timeout=300.0, path=None, clock=time.time):
+        """Ініціалізує дедуплікатор.
+
+        Args:
+            window (float): Часове вікно дедуплікації, секунди.
+            max_entries (int): Ліміт записів у пам’яті.
+            inflight_timeout (float): Таймаут in‑flight запису в SQLite, секунди.
+            path (str | None): Шлях до SQLite‑файлу для спільного стану між
+                процесами; `None` — лише пам’ять процесу.
+            clock (callable): Джерело часу (для тестів).
+        """
+        self.path = path
+        self.window = window
+        self.max_entries = max_entries
+        self.inflight_timeout = inflight_timeout
+        self._clock = clock
+        self._seen = OrderedDict()
+        self._inflight = set()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._claims = 0
+        self.duplicates = 0
+
+    async def begin(self, update_id) -> bool:
+        """Намагається захопити апдейт на обробку.
+
+        Returns:
+            bool: `True`, якщо апдейт треба обробити; `False` для дубліката.
+        """
+        now = self._clock()
+        self._expire(now)
+        if update_id in self._inflight or update_id in self._seen:
+            self.duplicates += 1
+            return False
+        # Позначаємо до очікування SQLite: дублікат, що прийде тим часом, відсічеться в пам’яті
+        self._inflight.add(update_id)
+        if self.path:
+            try:
+                claimed = await asyncio.to_thread(self._claim, update_id, now)
+            except BaseException:
+                self._inflight.discard(update_id)
+                raise
+            if not claimed:
+                self._inflight.discard(update_id)
+                self.duplicates += 1
+                return False
+        return True
+
+    async def finish(self, update_id, ok=True) -> None:
+        """Завершує обробку апдейта.
+
+        Args:
+            update_id: Ідентифікатор апдейта, захопленого через `begin()`.
+            ok (bool): Чи успішно завершилась обробка. Невдалий апдейт
+                забувається, щоб повторна доставка могла його обробити.
+        """
+        self._inflight.discard(update_id)
+        now = self._clock()
+        if ok:
+            self._seen[update_id] = now
+            if len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+        if self.path:
+            await asyncio.to_thread(self._release, update_id, ok, now)
+
+    def _connect(self):
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS updates ("
+                "update_id INTEGER PRIMARY KEY, state TEXT NOT NULL, ts REAL NOT NULL)"
+            )
+            self._db = db
+        return self._db
+
+    def _release(self, update_id, ok, now) -> None:
+        with self._db_lock:
+            db = self._connect()
+            if ok:
+                db.execute("UPDATE updates SET state = 'done', ts = ? WHERE update_id = ?", (now, update_id))
+            else:
+                db.execute("DELETE FROM updates WHERE update_id = ?", (update_id,))
+
+    def _claim(self, update_id, now) -> bool:
+        with self._db_lock:
+            return self._insert(self._connect(), update_id, now)
+
+    def _insert(self, db, update_id, now) -> bool:
+        self._claims += 1
+        if self._claims % 1000 == 0:
+            db.execute("DELETE FROM updates WHERE state = 'done' AND ts < ?", (now - self.window,))
+        cursor = db.execute(
+            "INSERT OR IGNORE INTO updates (update_id, state, ts) VALUES (?, 'inflight', ?)", (update_id, now)
+        )
+        if cursor.rowcount == 1:
+            return True
+        # Запис уже є: перехоплюємо лише застарілий (вікно минуло або воркер «завис»)
+        cursor = db.execute(
+            "UPDATE updates SET state = 'inflight', ts = ? WHERE update_id = ? AND "
+            "((state = 'done' AND ts < ?) OR (state = 'inflight' AND ts < ?))",
+            (now, update_id, now - self.window, now - self.inflight_timeout),
+        )
+        return cursor.rowcount == 1
+
+    def _expire(self, now) -> None:
+        seen = self._seen
+        while seen:
+            update_id, ts = next(iter(seen.items()))
+            if now - ts < self.window:
+                break
+            del seen[update_id]
+
+    def stats(self) -> dict:
+        """Повертає розмір множин і кількість відкинутих дублікатів."""
+        return {
+            "seen": len(self._seen),
+            "inflight": len(self._inflight),
+            "duplicates": self.duplicates,
+        }
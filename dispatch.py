@@ -0,0 +1,203 @@
+"""Фонова черга обробки апдейтів Telegram.
+
+Webhook лише розбирає апдейт, кладе його в `UpdateDispatcher` і одразу
+відповідає 200, а генерація відповіді відбувається у пулі асинхронних
+воркерів. Тож тривалість запиту до моделі більше не тримає webhook‑з’єднання
+Telegram відкритим.
+
+Гарантії черги:
+
+- апдейти одного чату обробляються строго по черзі, у порядку надходження;
+- апдейти різних чатів обробляються паралельно (до `workers` одночасно);
+- загальна кількість апдейтів, що очікують, обмежена `max_pending`. Коли
+  черга заповнена, `submit()` чекає на вільне місце до `enqueue_timeout`
+  секунд, після чого застосовує політику перевантаження: `reject` (апдейт
+  не приймається — webhook повертає 503, і Telegram доставить його пізніше)
+  або `drop` (апдейт підтверджується, але відкидається).
+
+Використання (псевдокод):
+
+    dispatcher = UpdateDispatcher(process_update, workers=32)
+    dispatcher.start()
+    accepted = await dispatcher.submit(update_json)
+    ...
+    await dispatcher.drain(timeout=25)
+"""
+
+import asyncio
+from collections import deque
+
+_MESSAGE_KEYS = ("message", "edited_message", "channel_post", "edited_channel_post")
+_USER_KEYS = ("inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query")
+_CHAT_KEYS = ("my_chat_member", "chat_member", "chat_join_request")
+
+
+def update_chat_id(update_json: dict):
+    """Повертає ідентифікатор чату з сирого JSON апдейта або `None`."""
+    for key in _MESSAGE_KEYS:
+        message = update_json.get(key)
+        if message:
+            return message.get("chat", {}).get("id")
+    query = update_json.get("callback_query")
+    if query:
+        message = query.get("message")
+        if message:
+            return message.get("chat", {}).get("id")
+        return query.get("from", {}).get("id")
+    for key in _CHAT_KEYS:
+        event = update_json.get(key)
+        if event:
+            return event.get("chat", {}).get("id")
+    for key in _USER_KEYS:
+        event = update_json.get(key)
+        if event:
+            return event.get("from", {}).get("id")
+    return None
+
+
+class UpdateDispatcher:
+    """Обмежена черга апдейтів із впорядкуванням у межах чату.
+
+    Атрибути:
+        handler (callable): Корутина, що обробляє один апдейт.
+        workers (int): Кількість воркерів (максимум паралельних апдейтів).
+        max_pending (int): Ліміт апдейтів у черзі та в обробці.
+        overload (str): Політика перевантаження: `reject` або `drop`.
+        enqueue_timeout (float): Скільки секунд `submit()` чекає на місце.
+        pending (int): Кількість прийнятих, але ще не оброблених апдейтів.
+        accepted, rejected, dropped, processed, failed (int): Лічильники.
+    """
+
+    def __init__(self, handler, workers=32, max_pending=1000, overload="reject", enqueue_timeout=0.5,
+                 key=update_chat_id):
+        """Ініціалізує диспетчер (воркери запускаються в `start()`).
+
+        Args:
+            handler (callable): `async def handler(item)`.
+            workers (int): Розмір пулу воркерів.
+            max_pending (int): Ліміт апдейтів, що очікують або обробляються.
+            overload (str): `reject` або `drop`.
+            enqueue_timeout (float): Час очікування місця в черзі, секунди.
+            key (callable): Повертає ключ впорядкування (чат) для апдейта.
+        """
+        if overload not in ("reject", "drop"):
+            raise ValueError(f"Unknown overload policy: {overload}")
+        self.handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self.overload = overload
+        self.enqueue_timeout = enqueue_timeout
+        self.key = key
+        self.pending = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.processed = 0
+        self.failed = 0
+        self._chats = {}
+        self._ready = asyncio.Queue()
+        self._space = asyncio.Condition()
+        self._tasks = []
+        self._closing = False
+
+    def start(self) -> None:
+        """Запускає воркери в поточному циклі подій."""
+        if not self._tasks:
+            self._closing = False
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, item) -> bool:
+        """Ставить апдейт у чергу його чату.
+
+        Args:
+            item: Апдейт (сирий JSON або об’єкт — те, що приймає `handler`).
+
+        Returns:
+            bool: `False`, якщо апдейт не прийнято (перевантаження з політикою
+            `reject` або диспетчер зупиняється); `True` в усіх інших випадках.
+        """
+        if self._closing:
+            self.rejected += 1
+            return False
+        if self.pending >= self.max_pending and self.enqueue_timeout > 0:
+            async with self._space:
+                try:
+                    await asyncio.wait_for(
+                        self._space.wait_for(lambda: self.pending < self.max_pending),
+                        self.enqueue_timeout,
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        if self.pending >= self.max_pending:
+            if self.overload == "drop":
+                self.dropped += 1
+                return True
+            self.rejected += 1
+            return False
+
+        key = self.key(item)
+        if key is None:
+            key = object()  # апдейти без чату не впорядковуються між собою
+        queue = self._chats.get(key)
+        if queue is None:
+            self._chats[key] = deque((item,))
+            self._ready.put_nowait(key)
+        else:
+            queue.append(item)
+        self.pending += 1
+        self.accepted += 1
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            queue = self._chats[key]
+            item = queue.popleft()
+            try:
+                await self.handler(item)
+            except Exception as e:
+                self.failed += 1
+                print("Update processing error:", repr(e))
+            finally:
+                self.pending -= 1
+                self.processed += 1
+                if queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+                async with self._space:
+                    self._space.notify()
+
+    async def drain(self, timeout=25.0) -> bool:
+        """Перестає приймати апдейти, дочікується обробки черги й зупиняє воркери.
+
+        Args:
+            timeout (float): Скільки секунд чекати на обробку черги.
+
+        Returns:
+            bool: `True`, якщо всі апдейти встигли обробитися.
+        """
+        self._closing = True
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.pending and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        drained = self.pending == 0
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        return drained
+
+    def stats(self) -> dict:
+        """Повертає глибину черги та лічильники диспетчера."""
+        return {
+            "pending": self.pending,
+            "chats": len(self._chats),
+            "workers": len(self._tasks),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
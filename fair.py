@@ -0,0 +1,205 @@
+"""Справедливий розподіл слотів моделі між чатами.
+
+Усі чати ділять одну квоту апстріму, тож один активний користувач `/date` або
+скрипт, що засипає бота повідомленнями, може зайняти всі слоти й змусити
+решту чекати. `FairScheduler` стоїть перед кожним зверненням до моделі:
+
+- обмежує кількість одночасних запитів до моделі (`max_inflight`);
+- видає вільні слоти за зваженою справедливою чергою (start‑time fair
+  queueing): кожен запит отримує «віртуальний час старту», що залежить від
+  того, скільки вже отримав його чат, тож чат із довгою чергою запитів не
+  відсуває запити інших чатів — вони обслуговуються по черзі між чатами;
+- рахує витрачені токени кожного чату у вікні `budget_window` і відхиляє
+  нові запити понад `token_budget` винятком `QuotaExceeded`;
+- збирає статистику очікування в черзі (p50/p95/p99).
+
+Використання (псевдокод):
+
+    scheduler = FairScheduler(max_inflight=32, token_budget=50_000, budget_window=3600)
+    scheduler.check(chat_id)  # QuotaExceeded, якщо ліміт вичерпано
+    async with scheduler.slot(chat_id):
+        completion = await client.chat.completions.create(...)
+    scheduler.charge(chat_id, completion.usage.total_tokens)
+"""
+
+import asyncio
+import contextlib
+import heapq
+import time
+from collections import deque
+
+
+class QuotaExceeded(Exception):
+    """Чат вичерпав бюджет токенів у поточному вікні.
+
+    Атрибути:
+        retry_after (float): Через скільки секунд бюджет відновиться.
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(f"token budget exceeded, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class _Owner:
+    __slots__ = ("finish", "used", "window_start")
+
+    def __init__(self, now):
+        self.finish = 0.0
+        self.used = 0
+        self.window_start = now
+
+
+class FairScheduler:
+    """Глобальний ліміт одночасних запитів зі справедливою чергою та бюджетами.
+
+    Атрибути:
+        max_inflight (int): Максимум одночасних запитів до моделі.
+        token_budget (int | None): Бюджет токенів чату на вікно; `None` — без ліміту.
+        budget_window (float): Тривалість вікна бюджету, секунди.
+        inflight (int): Скільки запитів виконується зараз.
+        queued (int): Скільки запитів чекає на слот.
+        granted, over_quota (int): Лічильники виданих слотів і відхилених запитів.
+    """
+
+    def __init__(self, max_inflight=32, token_budget=None, budget_window=3600.0, clock=time.monotonic,
+                 wait_samples=1000):
+        """Ініціалізує планувальник.
+
+        Args:
+            max_inflight (int): Глобальний ліміт одночасних запитів.
+            token_budget (int | None): Бюджет токенів одного чату на вікно.
+            budget_window (float): Вікно бюджету, секунди.
+            clock (callable): Джерело монотонного часу (для тестів).
+            wait_samples (int): Скільки останніх очікувань тримати для перцентилів.
+        """
+        self.max_inflight = max_inflight
+        self.token_budget = token_budget
+        self.budget_window = budget_window
+        self._clock = clock
+        self._owners = {}
+        self._heap = []
+        self._vtime = 0.0
+        self._seq = 0
+        self._waits = deque(maxlen=wait_samples)
+        self.inflight = 0
+        self.queued = 0
+        self.granted = 0
+        self.over_quota = 0
+
+    def check(self, owner) -> None:
+        """Перевіряє, чи чат ще має бюджет токенів.
+
+        Raises:
+            QuotaExceeded: Якщо бюджет поточного вікна вичерпано.
+        """
+        if not self.token_budget:
+            return
+        state = self._owners.get(owner)
+        if state is None:
+            return
+        now = self._clock()
+        self._roll(state, now)
+        if state.used >= self.token_budget:
+            self.over_quota += 1
+            raise QuotaExceeded(state.window_start + self.budget_window - now)
+
+    def charge(self, owner, tokens) -> None:
+        """Списує витрачені токени з бюджету чату."""
+        if not self.token_budget:
+            return
+        now = self._clock()
+        state = self._owner(owner, now)
+        self._roll(state, now)
+        state.used += tokens
+
+    @contextlib.asynccontextmanager
+    async def slot(self, owner, cost=1.0, weight=1.0):
+        """Займає слот моделі на час блоку `async with`.
+
+        Args:
+            owner: Чат (або користувач), від імені якого виконується запит.
+            cost (float): Вартість запиту в одиницях черги.
+            weight (float): Вага чату: більша вага — більша частка слотів.
+        """
+        started = self._clock()
+        await self._acquire(owner, cost, weight)
+        self._waits.append(self._clock() - started)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, owner, cost, weight) -> None:
+        state = self._owner(owner, self._clock())
+        start = max(self._vtime, state.finish)
+        state.finish = start + cost / weight
+        self.granted += 1
+        if self.granted % 1000 == 0:
+            self._sweep()
+        if self.inflight < self.max_inflight and not self.queued:
+            self.inflight += 1
+            self._vtime = start
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._heap, (start, self._seq, future))
+        self.queued += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self.queued -= 1  # запис лишається в купі й буде пропущений
+            else:
+                self._release()  # слот уже видали, але задачу скасовано
+            raise
+
+    def _release(self) -> None:
+        self.inflight -= 1
+        heap = self._heap
+        while heap and self.inflight < self.max_inflight:
+            start, _, future = heapq.heappop(heap)
+            if future.done():
+                continue
+            self.queued -= 1
+            self.inflight += 1
+            self._vtime = start
+            future.set_result(None)
+
+    def _owner(self, owner, now) -> _Owner:
+        state = self._owners.get(owner)
+        if state is None:
+            state = self._owners[owner] = _Owner(now)
+        return state
+
+    def _roll(self, state, now) -> None:
+        if now - state.window_start >= self.budget_window:
+            state.window_start = now
+            state.used = 0
+
+    def _sweep(self) -> None:
+        # Прибираємо чати, що вже не випереджають віртуальний час і не мають
+        # витрат у поточному вікні: їхній стан не відрізняється від нового.
+        now = self._clock()
+        idle = [owner for owner, state in self._owners.items()
+                if state.finish <= self._vtime and (state.used == 0 or now - state.window_start >= self.budget_window)]
+        for owner in idle:
+            del self._owners[owner]
+
+    def stats(self) -> dict:
+        """Повертає завантаженість і перцентилі очікування в черзі (секунди)."""
+        waits = sorted(self._waits)
+
+        def percentile(q):
+            return waits[min(len(waits) - 1, int(q * len(waits)))] if waits else 0.0
+
+        return {
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "owners": len(self._owners),
+            "granted": self.granted,
+            "over_quota": self.over_quota,
+            "wait_p50": percentile(0.5),
+            "wait_p95": percentile(0.95),
+            "wait_p99": percentile(0.99),
+        }
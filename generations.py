@@ -0,0 +1,101 @@
+"""Відстеження поточної генерації відповіді в кожному чаті.
+
+Користувач часто надсилає наступне повідомлення (або перемикає режим через
+/start, /date тощо), поки бот ще генерує відповідь на попереднє. Без
+скасування обидві генерації доходять до кінця: модель витрачає токени на
+відповідь, яку вже ніхто не чекає, а стара заглушка редагується поверх нової
+розмови. `GenerationTracker` тримає для кожного чату одну поточну генерацію
+та скасовує її, щойно в чаті з’являється новіший апдейт.
+
+Генерація виконується в окремій задачі, тож скасування не зачіпає воркер,
+який обробляє апдейт, а лише перериває саму генерацію (і звільняє слот
+`ChatGptService.inflight`).
+
+Використання (псевдокод):
+
+    generations = GenerationTracker()
+
+    # у хендлері
+    await generations.run(chat_id, update.update_id, reply())
+
+    # при отриманні нового апдейта чату
+    generations.supersede(chat_id, update_id)
+"""
+
+import asyncio
+
+
+class GenerationTracker:
+    """Поточні генерації за ідентифікатором чату.
+
+    Атрибути:
+        started (int): Скільки генерацій було запущено.
+        superseded (int): Скільки генерацій скасовано новішими апдейтами.
+    """
+
+    def __init__(self):
+        """Ініціалізує порожній реєстр генерацій."""
+        self._running = {}
+        self.started = 0
+        self.superseded = 0
+
+    async def run(self, chat_id, update_id, coro):
+        """Виконує `coro` як поточну генерацію чату.
+
+        Попередня генерація цього чату (від старішого апдейта) скасовується.
+
+        Args:
+            chat_id: Ідентифікатор чату.
+            update_id (int | None): Апдейт, що запустив генерацію.
+            coro: Корутина генерації. При скасуванні в неї кидається
+                `asyncio.CancelledError`, тож вона може прибрати за собою
+                (наприклад, видалити заглушку).
+
+        Returns:
+            Результат `coro` або `None`, якщо генерацію витіснив новіший апдейт.
+        """
+        self.supersede(chat_id, update_id)
+        task = asyncio.ensure_future(coro)
+        entry = (update_id, task)
+        self._running[chat_id] = entry
+        self.started += 1
+        try:
+            return await task
+        except asyncio.CancelledError:
+            current = asyncio.current_task()
+            if current is not None and current.cancelling():
+                raise  # скасовано сам хендлер (зупинка сервера), а не новіший апдейт
+            return None
+        finally:
+            if self._running.get(chat_id) is entry:
+                del self._running[chat_id]
+
+    def supersede(self, chat_id, update_id=None) -> bool:
+        """Скасовує поточну генерацію чату, якщо вона належить старішому апдейту.
+
+        Повторна доставка того самого (або старішого) апдейта генерацію не
+        скасовує.
+
+        Args:
+            chat_id: Ідентифікатор чату.
+            update_id (int | None): Новий апдейт; `None` — скасувати безумовно.
+
+        Returns:
+            bool: `True`, якщо генерацію було скасовано.
+        """
+        entry = self._running.get(chat_id)
+        if entry is None:
+            return False
+        running_id, task = entry
+        if update_id is not None and running_id is not None and update_id <= running_id:
+            return False
+        del self._running[chat_id]
+        if task.done():
+            return False
+        task.cancel()
+        self.superseded += 1
+        return True
+
+    def stats(self) -> dict:
+        """Повертає кількість активних генерацій і лічильники."""
+        return {"running": len(self._running), "started": self.started, "superseded": self.superseded}
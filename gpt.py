@@ -7,109 +7,969 @@
 Використання (псевдокод):
 
     service = ChatGptService(token="<OPENAI_API_KEY>")
-    service.set_prompt("You are helpful assistant")
-    await service.add_message("Hello!")
-    # або одноразове питання
+    service.set_prompt("You are helpful assistant", chat_id=42)
+    await service.add_message("Hello!", chat_id=42)
+    # або одноразове питання (без збереження історії)
     await service.send_question("You are helpful assistant", "Explain TCP/IP in simple terms")
 
+Тексти промптів і повідомлень користувача очікуються вже нормалізованими
+(`util.normalize_text()` на межі системи); нормалізується лише відповідь
+моделі.
+
 Примітка: методи, що звертаються до API, є асинхронними (`async`) і
-очікують виклику через `await` усередині асинхронного контексту.
+очікують виклику через `await` усередині асинхронного контексту. Сервіс
+використовує `openai.AsyncOpenAI` поверх спільного пулу з'єднань `httpx`
+(обидва створюються під час першого звернення до моделі), тож
+генерація не блокує цикл подій, а паралельні запити від різних чатів
+виконуються одночасно (у межах ліміту `max_inflight`, який справедливо
+ділиться між чатами — див. `fair.FairScheduler`).
 """
 
-import openai
-from openai import OpenAI
-from util import normalize_text
+import asyncio
+import contextlib
+import fnmatch
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+from fair import FairScheduler
+from metrics import OPENAI_ERRORS, OPENAI_FIRST_CHUNK_SECONDS, OPENAI_SECONDS, OPENAI_TOKENS
+from session import SessionStore
+from tracing import mark, span
+from transport import TransportPolicy, api_errors
+from util import normalize_text, load_prompt
+
+DEFAULT_BASE_URL = "https://openai.javarush.com/v1"
+DEFAULT_MAX_TOKENS = 3000
+DEFAULT_TEMPERATURE = 0.9
+
+
+def _estimate_tokens(messages, answer) -> int:
+    # Та сама евристика, що й у ContextWindow без tiktoken: ~3 символи на токен
+    return (sum(len(m["content"]) for m in messages) + len(answer or "")) // 3 + 1
+
+
+def _drop_turn(messages, turn) -> None:
+    """Прибирає з історії репліку `turn`, на яку так і не надійшла відповідь."""
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i] is turn:
+            del messages[i]
+            return
+
+
+class Conversation:
+    """Історія розмови одного чату.
+
+    Повідомлення зберігаються як прості словники
+    `{"role": "system|user|assistant", "content": str}` — без об’єктів
+    `ChatCompletionMessage`, які займають у рази більше пам’яті.
+
+    Атрибути:
+        messages (list): Історія повідомлень у форматі Chat Completions;
+            першим іде системний промпт.
+        summary (str): Накопичений підсумок старих реплік, що вже не
+            зберігаються дослівно (див. `ContextWindow`).
+        profile (str | None): Назва профілю генерації (зазвичай назва промпта).
+        touched (float): Час останнього звернення (заповнює `SessionStore`).
+    """
+    __slots__ = ("messages", "summary", "profile", "touched")
+
+    def __init__(self):
+        self.messages = []
+        self.summary = ""
+        self.profile = None
+        self.touched = 0.0
+
+    def to_state(self) -> dict:
+        """Повертає JSON‑сумісний стан розмови (для `state.StateBackend`)."""
+        return {"messages": self.messages, "summary": self.summary, "profile": self.profile}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "Conversation":
+        """Відновлює розмову зі стану, збереженого `to_state()`."""
+        conversation = cls()
+        conversation.messages = state.get("messages", [])
+        conversation.summary = state.get("summary", "")
+        conversation.profile = state.get("profile")
+        return conversation
+
+
+class GenerationProfile:
+    """Параметри генерації для одного сценарію.
+
+    Атрибути:
+        model (str): Модель Chat Completions.
+        max_tokens (int): Ліміт довжини відповіді.
+        temperature (float): Температура семплювання.
+        timeout (float | None): Таймаут запиту, секунди; `None` — таймаут сервісу.
+        name (str): Ключ профілю у файлі (`default`, `gpt`, `date_*`) — мітка
+            режиму в метриках.
+    """
+    __slots__ = ("model", "max_tokens", "temperature", "timeout", "name")
+
+    def __init__(self, model, max_tokens=DEFAULT_MAX_TOKENS, temperature=DEFAULT_TEMPERATURE, timeout=None,
+                 name="default"):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.timeout = timeout
+        self.name = name
+
+    def merged(self, overrides: dict) -> "GenerationProfile":
+        """Повертає копію профілю з перевизначеними полями.
+
+        Raises:
+            ValueError: Якщо `overrides` містить невідоме поле.
+        """
+        unknown = set(overrides) - set(self.__slots__)
+        if unknown:
+            raise ValueError(f"Unknown generation profile fields: {', '.join(sorted(unknown))}")
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(overrides)
+        return GenerationProfile(**fields)
+
+
+class GenerationProfiles:
+    """Реєстр профілів генерації за назвою сценарію.
+
+    Профілі читаються з JSON‑файлу виду
+    `{"default": {...}, "gpt": {...}, "date_*": {...}}`: ключ — назва
+    промпта або шаблон `fnmatch`, значення — поля `GenerationProfile`, що
+    перевизначають профіль `default`. Точна назва має пріоритет над
+    шаблонами; шаблони перевіряються в порядку файлу. Змінений файл
+    перечитується не частіше ніж раз на `check_interval` секунд; файл із
+    помилкою під час перезавантаження ігнорується (лишаються старі профілі).
+
+    Атрибути:
+        path (str | None): JSON‑файл профілів; `None` — лише `default`.
+        default (GenerationProfile): Профіль для сценаріїв без власного.
+        check_interval (float | None): Період перевірки `mtime`, секунди.
+    """
+
+    def __init__(self, default, path=None, check_interval=5.0, clock=time.monotonic):
+        """Ініціалізує реєстр і завантажує файл профілів.
+
+        Args:
+            default (GenerationProfile): Базовий профіль.
+            path (str | None): Шлях до JSON‑файлу профілів.
+            check_interval (float | None): Період перевірки `mtime`, секунди;
+                `None` вимикає перезавантаження.
+            clock (callable): Джерело монотонного часу (для тестів).
+
+        Raises:
+            ValueError: Якщо файл профілів некоректний.
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self._base = default
+        self._clock = clock
+        self._mtime = None
+        self._checked_at = clock()
+        self._exact = {}
+        self._patterns = []
+        self._resolved = {}
+        self.default = default
+        if path:
+            self._load()
+
+    def _load(self) -> None:
+        self._mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        default = self._base.merged(config.pop("default", {}))
+        exact = {}
+        patterns = []
+        for name, overrides in config.items():
+            profile = default.merged(dict(overrides, name=name))
+            if any(c in name for c in "*?["):
+                patterns.append((name, profile))
+            else:
+                exact[name] = profile
+        self.default, self._exact, self._patterns, self._resolved = default, exact, patterns, {}
+
+    def reload(self) -> bool:
+        """Перечитує файл профілів, якщо він змінився.
+
+        Returns:
+            bool: `True`, якщо профілі оновлено.
+        """
+        self._checked_at = self._clock()
+        try:
+            if not self.path or os.stat(self.path).st_mtime_ns == self._mtime:
+                return False
+            self._load()
+        except (OSError, ValueError) as e:
+            print("⚠️ Generation profiles are not reloaded:", e)
+            return False
+        return True
+
+    def get(self, name) -> GenerationProfile:
+        """Повертає профіль для сценарію `name` (або `default`)."""
+        if self.check_interval is not None and self._clock() - self._checked_at >= self.check_interval:
+            self.reload()
+        profile = self._resolved.get(name)
+        if profile is None:
+            profile = self._exact.get(name)
+            if profile is None and name is not None:
+                profile = next((p for pattern, p in self._patterns if fnmatch.fnmatchcase(name, pattern)), None)
+            profile = self._resolved[name] = profile or self.default
+        return profile
+
+
+class ContextWindow:
+    """Тримає запит розмови в межах бюджету токенів.
+
+    Системний промпт і останні `keep_recent` реплік надсилаються дослівно.
+    Коли історія перевищує `budget`, старші репліки згортаються в підсумок
+    (`Conversation.summary`) окремим коротким запитом до моделі й далі
+    надсилаються лише у вигляді цього підсумку. Тож розмір запиту та час
+    відповіді лишаються сталими незалежно від довжини розмови.
+
+    Токени рахуються локально через `tiktoken`, якщо він встановлений, інакше —
+    консервативною оцінкою за довжиною тексту.
+
+    Атрибути:
+        budget (int): Максимальний розмір запиту, токени.
+        keep_recent (int): Скільки останніх реплік зберігати дослівно.
+        summary_tokens (int): Ліміт `max_tokens` для запиту‑підсумку.
+        model (str): Модель, для якої обирається токенізатор.
+    """
+
+    def __init__(self, budget=3000, keep_recent=6, summary_tokens=400, model="gpt-4o"):
+        self.budget = budget
+        self.keep_recent = keep_recent
+        self.summary_tokens = summary_tokens
+        self.model = model
+        self._encoding = None
+
+    def count(self, text: str) -> int:
+        """Повертає кількість токенів у тексті."""
+        if self._encoding is None:
+            try:
+                # Імпорт відкладено до першого підрахунку: він подовжує холодний старт.
+                # Без tiktoken підрахунок переходить на евристику.
+                import tiktoken
+                self._encoding = tiktoken.encoding_for_model(self.model)
+            except Exception:
+                self._encoding = False
+        if self._encoding:
+            return len(self._encoding.encode(text))
+        return len(text) // 3 + 1
+
+    def count_messages(self, messages: list) -> int:
+        """Повертає розмір списку повідомлень з урахуванням службових токенів."""
+        return sum(self.count(m["content"]) + 4 for m in messages) + 2
+
+    def build(self, conversation: Conversation) -> list:
+        """Формує список повідомлень для запиту: промпт, підсумок, репліки.
+
+        Якщо навіть останні репліки не вміщуються в бюджет, найстаріші з них
+        відкидаються (остання репліка лишається завжди).
+        """
+        head = self._head(conversation)
+        turns = conversation.messages[1:]
+        size = self.count_messages(head)
+        start = len(turns)
+        while start > 0:
+            size += self.count(turns[start - 1]["content"]) + 4
+            if size > self.budget and start < len(turns):
+                break
+            start -= 1
+        return head + turns[start:]
+
+    def fold_count(self, conversation: Conversation) -> int:
+        """Повертає, скільки найстаріших реплік треба згорнути в підсумок."""
+        if self.count_messages(self._head(conversation) + conversation.messages[1:]) <= self.budget:
+            return 0
+        return max(len(conversation.messages) - 1 - self.keep_recent, 0)
+
+    def _head(self, conversation: Conversation) -> list:
+        head = conversation.messages[:1]
+        if conversation.summary:
+            head = head + [{"role": "system", "content": "Підсумок попередньої розмови: " + conversation.summary}]
+        return head
+
+
+class ResponseCache:
+    """Кеш відповідей для одноразових запитів (`send_question`).
+
+    Ключ — хеш моделі, назви та вмісту промпта, тексту користувача і
+    параметрів семплювання. Оскільки до ключа входить вміст промпта, зміна
+    файлу промпта (її підхоплює `util.resources`) автоматично робить старі
+    записи недосяжними. Записи живуть `ttl` секунд і витісняються за LRU
+    понад `max_size`; за потреби дублюються в SQLite‑файлі (`path`). Файл
+    відкривається під час першого звернення, і всі звернення до нього
+    виконуються у фоновому потоці (`asyncio.to_thread`), щоб не зупиняти цикл
+    подій.
+
+    Атрибути:
+        path (str | None): SQLite‑файл кешу; `None` — лише пам’ять.
+        ttl (float): Час життя запису, секунди.
+        max_size (int): Ліміт записів у пам’яті.
+        hits (int): Кількість влучань.
+        misses (int): Кількість промахів.
+    """
+
+    def __init__(self, ttl=86400.0, max_size=10_000, path=None, clock=time.time):
+        """Ініціалізує кеш.
+
+        Args:
+            ttl (float): Час життя запису, секунди.
+            max_size (int): Ліміт записів у пам’яті.
+            path (str | None): SQLite‑файл для збереження між перезапусками.
+            clock (callable): Джерело часу (для тестів).
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model, prompt_name, prompt_text, message_text, max_tokens, temperature) -> str:
+        """Будує ключ кешу для одноразового запиту."""
+        prompt_version = hashlib.sha256(prompt_text.encode("utf-8")).hexdigest()
+        payload = json.dumps([model, prompt_name, prompt_version, message_text, max_tokens, temperature],
+                             ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key, stale=False):
+        """Повертає збережену відповідь або `None`.
+
+        Args:
+            key (str): Ключ із `ResponseCache.key()`.
+            stale (bool): Повернути й прострочений запис (запасна відповідь,
+                коли модель недоступна).
+        """
+        now = self._clock()
+        entry = self._entries.get(key)
+        if entry is None and self.path:
+            row = await asyncio.to_thread(self._execute, "SELECT answer, expires FROM responses WHERE key = ?", key)
+            if row is not None:
+                entry = (row[0], row[1])
+                self._remember(key, entry)
+        if entry is None or (entry[1] < now and not stale):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    async def put(self, key, answer) -> None:
+        """Зберігає відповідь."""
+        entry = (answer, self._clock() + self.ttl)
+        self._remember(key, entry)
+        if self.path:
+            await asyncio.to_thread(self._execute, "INSERT OR REPLACE INTO responses (key, answer, expires) VALUES (?, ?, ?)",
+                                    key, *entry)
+
+    def _execute(self, sql, *params):
+        with self._db_lock:
+            db = self._connect()
+            return None if db is None else db.execute(sql, params).fetchone()
+
+    def _connect(self):
+        if self._db is None and self.path:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, answer TEXT NOT NULL, expires REAL NOT NULL)"
+                )
+                db.execute("DELETE FROM responses WHERE expires < ?", (self._clock(),))
+                self._db = db
+            except (OSError, sqlite3.Error) as e:
+                print("⚠️ Response cache is not persisted:", e)
+                self.path = None
+        return self._db
+
+    def _remember(self, key, entry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Повертає розмір кешу та кількість влучань і промахів."""
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class _Flight:
+    __slots__ = ("task", "parts", "changed", "waiters")
+
+    def __init__(self):
+        self.task = None
+        self.parts = []
+        self.changed = asyncio.Event()
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Об’єднання однакових запитів, що виконуються одночасно.
+
+    Перший виклик із ключем запускає справжній запит у окремій задачі, а
+    виклики з тим самим ключем, що надходять до його завершення, отримують
+    той самий результат (або ту саму помилку). Скасування одного з викликачів
+    не зачіпає решту; запит скасовується лише тоді, коли на нього вже ніхто
+    не чекає.
+
+    Атрибути:
+        leaders (int): Скільки справжніх запитів було запущено.
+        coalesced (int): Скільки викликів приєдналися до вже запущеного запиту.
+    """
+
+    def __init__(self):
+        """Ініціалізує порожній реєстр запитів."""
+        self._flights = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, key, start):
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.create_task(start(flight))
+            flight.task.add_done_callback(lambda task: self._land(key, flight))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        return flight
+
+    def _leave(self, flight) -> None:
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            flight.task.cancel()
+
+    def _land(self, key, flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        flight.changed.set()
+        if not flight.task.cancelled():
+            flight.task.exception()  # помилку вже отримали викликачі
+
+    async def call(self, key, factory):
+        """Виконує `await factory()` один раз для всіх одночасних викликів.
+
+        Args:
+            key (Hashable): Ключ ідентичності запиту.
+            factory (callable): Функція без аргументів, що повертає корутину.
+
+        Returns:
+            Результат корутини.
+        """
+        async def start(flight):
+            return await factory()
+
+        flight = self._join(key, start)
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            self._leave(flight)
+
+    async def stream(self, key, factory):
+        """Потоковий варіант `call()`: усі викликачі отримують ті самі фрагменти.
+
+        Той, хто приєднався пізніше, спочатку отримує вже згенеровані
+        фрагменти, а далі — нові в міру їх надходження.
+
+        Args:
+            key (Hashable): Ключ ідентичності запиту.
+            factory (callable): Функція без аргументів, що повертає
+                асинхронний генератор фрагментів.
+
+        Yields:
+            Фрагменти, які віддає генератор `factory()`.
+        """
+        async def start(flight):
+            async with contextlib.aclosing(factory()) as parts:
+                async for part in parts:
+                    flight.parts.append(part)
+                    flight.changed.set()
+
+        flight = self._join(key, start)
+        index = 0
+        try:
+            while True:
+                if index < len(flight.parts):
+                    yield flight.parts[index]
+                    index += 1
+                elif flight.task.done():
+                    flight.task.result()
+                    return
+                else:
+                    flight.changed.clear()
+                    await flight.changed.wait()
+        finally:
+            self._leave(flight)
+
+    def stats(self) -> dict:
+        """Повертає кількість запитів у польоті та лічильники об’єднання."""
+        return {"inflight": len(self._flights), "leaders": self.leaders, "coalesced": self.coalesced}
 
 
 class ChatGptService:
     """Тонкий клієнт для OpenAI Chat Completions API.
 
-    Зберігає внутрішній список повідомлень у форматі, сумісному з Chat
-    Completions (`{"role": "system|user|assistant", "content": str}`) і надає
-    допоміжні методи для оновлення промпта, додавання повідомлень і надсилання
-    запиту до моделі.
+    Тримає окрему історію повідомлень (`Conversation`) для кожного чату у
+    сховищі з витісненням простоюючих розмов і надає допоміжні методи для
+    встановлення промпта, додавання повідомлень і одноразових запитів.
 
     Атрибути:
-        client (OpenAI): Ініціалізований клієнт OpenAI SDK.
-        message_list (list): Поточна історія повідомлень для Chat Completions.
+        client (openai.AsyncOpenAI): Асинхронний клієнт OpenAI SDK; разом із
+            пулом створюється під час першого звернення до моделі.
+        http_client (httpx.AsyncClient | None): Спільний пул HTTP‑з'єднань із
+            keep‑alive (`None`, доки клієнта не створено).
+        scheduler (FairScheduler): Справедливий розподіл слотів моделі між
+            чатами та бюджети токенів.
+        timeout (float): Таймаут одного запиту до моделі, секунди.
+        conversations (SessionStore): Історії розмов за ідентифікатором чату.
+        context_window (ContextWindow | None): Бюджет токенів для розмов.
+        streaming (bool): Чи використовувати потокову генерацію.
+        model (str): Модель Chat Completions.
+        response_cache (ResponseCache | None): Кеш одноразових відповідей.
+        flights (SingleFlight): Об’єднання однакових одночасних одноразових запитів.
+        transport (TransportPolicy): Повтори, хеджування та запобіжник запитів.
+        profiles (GenerationProfiles): Модель і параметри генерації для сценаріїв.
     """
-    client: OpenAI = None
-    message_list: list = None
+    scheduler: FairScheduler = None
+    timeout: float = None
+    conversations: SessionStore = None
+    context_window: ContextWindow = None
+    streaming: bool = True
+    model: str = None
+    response_cache: ResponseCache = None
+    flights: SingleFlight = None
+    transport: TransportPolicy = None
+    profiles: GenerationProfiles = None
 
-    def __init__(self, token):
+    def __init__(self, token, base_url=DEFAULT_BASE_URL, timeout=60.0, connect_timeout=5.0,
+                 max_inflight=32, max_connections=32, max_keepalive=16, keepalive_expiry=30.0,
+                 conversation_ttl=3600.0, max_conversations=50_000, context_window=None, streaming=True,
+                 model="gpt-4o", response_cache=None, transport=None, profiles=None, scheduler=None,
+                 state_backend=None, history=None):
         """Ініціалізує сервіс OpenAI.
 
         Args:
             token (str): API‑ключ OpenAI. Використовується для автентифікації
-                запитів. Базова URL адреса встановлена на
-                "https://openai.javarush.com/v1".
+                запитів.
+            base_url (str): Базова URL адреса OpenAI‑сумісного ендпоінта.
+            timeout (float): Таймаут одного запиту до моделі, секунди.
+            connect_timeout (float): Таймаут встановлення з'єднання, секунди.
+            max_inflight (int): Максимальна кількість одночасних запитів до
+                моделі; решта чекає на вільний слот (якщо `scheduler` не задано).
+            max_connections (int): Розмір пулу HTTP‑з'єднань.
+            max_keepalive (int): Скільки простоюючих з'єднань тримати відкритими.
+            keepalive_expiry (float): Час життя простоюючого з'єднання, секунди.
+            conversation_ttl (float): Через скільки секунд простою історія
+                розмови видаляється.
+            max_conversations (int): Максимальна кількість збережених розмов.
+            context_window (ContextWindow | None): Обмежувач розміру запиту
+                для розмов; `None` — надсилати історію повністю.
+            streaming (bool): Чи запитувати відповідь потоком у `stream_*`
+                методах; якщо `False`, вони віддають відповідь одним шматком.
+            model (str): Модель Chat Completions за замовчуванням.
+            response_cache (ResponseCache | None): Кеш одноразових відповідей.
+            transport (TransportPolicy | None): Політика повторів і запобіжник;
+                `None` — два повтори з backoff без хеджування й запобіжника.
+            profiles (GenerationProfiles | None): Профілі генерації за
+                сценаріями; `None` — усі сценарії з профілем за замовчуванням
+                (`model`, `DEFAULT_MAX_TOKENS`, `DEFAULT_TEMPERATURE`).
+            scheduler (FairScheduler | None): Розподіл слотів моделі між
+                чатами; `None` — лише ліміт `max_inflight` без бюджетів.
+            state_backend (StateBackend | None): Спільне сховище розмов для
+                кількох воркерів (простір імен `conversations`).
+            history (HistoryLog | None): Журнал довговічної історії розмов.
         """
-        self.client = openai.OpenAI(base_url="https://openai.javarush.com/v1", api_key=token)
-        self.message_list = []
+        self.http_client = None
+        self._client = None
+        # Клієнт і пул створюються лише для першого запиту до моделі (див. `client`)
+        self._client_options = {
+            "base_url": base_url,
+            "api_key": token,
+            "limits": httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            "timeout": httpx.Timeout(timeout, connect=connect_timeout),
+        }
+        self.scheduler = scheduler or FairScheduler(max_inflight)
+        self.timeout = timeout
+        self.conversations = SessionStore(Conversation, ttl=conversation_ttl, max_size=max_conversations,
+                                          backend=state_backend, namespace="conversations", history=history)
+        self.context_window = context_window
+        self.streaming = streaming
+        self.model = model
+        self.response_cache = response_cache
+        self.flights = SingleFlight()
+        self.transport = transport or TransportPolicy()
+        self.profiles = profiles or GenerationProfiles(GenerationProfile(model))
+
+    @property
+    def client(self):
+        """Клієнт OpenAI SDK; `openai` імпортується під час першого звернення."""
+        if self._client is None:
+            import openai
+
+            options = self._client_options
+            self.http_client = httpx.AsyncClient(limits=options["limits"], timeout=options["timeout"])
+            # Повтори виконує self.transport, а не SDK
+            self._client = openai.AsyncOpenAI(base_url=options["base_url"], api_key=options["api_key"],
+                                              http_client=self.http_client, max_retries=0)
+        return self._client
+
+    @client.setter
+    def client(self, value) -> None:
+        self._client = value
+
+    async def close(self) -> None:
+        """Закриває пул HTTP‑з'єднань клієнта (якщо його було створено)."""
+        if self._client is not None:
+            await self._client.close()
 
-    async def send_message_list(self) -> str:
-        """Надсилає поточну історію повідомлень до Chat Completions.
+    async def send_message_list(self, messages: list, profile=None, max_tokens=None, temperature=None,
+                                chat_id=None) -> str:
+        """Надсилає список повідомлень до Chat Completions.
 
-        Після отримання відповіді додає повідомлення асистента до
-        `message_list` і повертає його текстовий вміст.
+        Метод не змінює переданий список — збереження відповіді в історії
+        виконує викликач.
+
+        Args:
+            messages (list): Повідомлення у форматі Chat Completions.
+            profile (GenerationProfile | None): Модель і параметри генерації;
+                `None` — профіль `default`.
+            max_tokens (int | None): Перевизначає ліміт довжини відповіді.
+            temperature (float | None): Перевизначає температуру.
+            chat_id: Чат, від імені якого виконується запит (черга та бюджет
+                у `scheduler`).
 
         Returns:
             str: Вміст відповіді асистента (`message.content`).
 
         Raises:
-            Exception: Будь‑які помилки мережі/квот/автентифікації з боку SDK
-                `openai` будуть проброшені вгору.
-        """
-        completion = self.client.chat.completions.create(
-            model="gpt-4o",  # gpt-4o,  gpt-4-turbo,    gpt-3.5-turbo
-            messages=self.message_list,
-            max_tokens=3000,
-            temperature=0.9
-        )
-        message = completion.choices[0].message
-        message.content = normalize_text(message.content)
-        self.message_list.append(message)
-        return message.content
-
-    def set_prompt(self, prompt_text: str) -> None:
-        """Очищає історію і встановлює системний промпт.
+            transport.CircuitOpen: Якщо модель вважається недоступною.
+            openai.OpenAIError: Помилка SDK, якщо повтори `transport`
+                вичерпано або помилка не є тимчасовою.
+        """
+        profile = profile or self.profiles.default
+        started = time.perf_counter()
+        try:
+            with span("openai", mode=profile.name, model=profile.model):
+                # Слот займає кожна спроба (і хедж‑спроба) окремо — не паузи між повторами
+                completion = await self.transport.call(lambda: self.client.chat.completions.create(
+                    model=profile.model,
+                    messages=messages,
+                    max_tokens=max_tokens or profile.max_tokens,
+                    temperature=profile.temperature if temperature is None else temperature,
+                    timeout=profile.timeout or self.timeout,
+                ), slot=lambda: self.scheduler.slot(chat_id))
+        except Exception as e:
+            OPENAI_ERRORS.inc(profile.name, type(e).__name__)
+            raise
+        finally:
+            OPENAI_SECONDS.observe(time.perf_counter() - started, profile.name)
+        answer = completion.choices[0].message.content
+        usage = getattr(completion, "usage", None)
+        if usage:
+            OPENAI_TOKENS.inc(profile.name, "prompt", amount=usage.prompt_tokens)
+            OPENAI_TOKENS.inc(profile.name, "completion", amount=usage.completion_tokens)
+        self.scheduler.charge(chat_id, usage.total_tokens if usage else _estimate_tokens(messages, answer))
+        return normalize_text(answer)
+
+    async def stream_message_list(self, messages: list, profile=None, max_tokens=None, temperature=None,
+                                  chat_id=None):
+        """Надсилає список повідомлень і віддає відповідь частинами.
+
+        Асинхронний генератор: кожен елемент — черговий фрагмент тексту
+        відповіді в міру його надходження від моделі. Слот `scheduler`
+        займається на кожну спробу встановити потік і після успішної
+        утримується, доки потік не буде вичитано або закрито.
+
+        Args:
+            messages (list): Повідомлення у форматі Chat Completions.
+            profile (GenerationProfile | None): Модель і параметри генерації.
+            max_tokens (int | None): Перевизначає ліміт довжини відповіді.
+            temperature (float | None): Перевизначає температуру.
+            chat_id: Чат, від імені якого виконується запит.
+
+        Yields:
+            str: Фрагменти тексту відповіді, кожен уже нормалізований
+            `normalize_text()` — споживачам досить їх з’єднати.
+        """
+        profile = profile or self.profiles.default
+        if not self.streaming:
+            yield await self.send_message_list(messages, profile, max_tokens=max_tokens, temperature=temperature,
+                                               chat_id=chat_id)
+            return
+        parts = []
+        async with contextlib.AsyncExitStack() as held:
+
+            async def connect():
+                # Слот займає кожна спроба; після встановлення потоку він
+                # утримується, доки потік не вичитано, а паузи між повторами — без нього
+                async with contextlib.AsyncExitStack() as attempt:
+                    await attempt.enter_async_context(self.scheduler.slot(chat_id))
+                    stream = await self.client.chat.completions.create(
+                        model=profile.model,
+                        messages=messages,
+                        max_tokens=max_tokens or profile.max_tokens,
+                        temperature=profile.temperature if temperature is None else temperature,
+                        timeout=profile.timeout or self.timeout,
+                        stream=True,
+                    )
+                    held.push_async_exit(attempt.pop_all())
+                return stream
+
+            started = time.perf_counter()
+            try:
+                # Повторюється лише встановлення потоку: вже показані фрагменти не дублюються
+                stream = await self.transport.call(connect, hedge=False)
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if not parts:
+                            OPENAI_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - started, profile.name)
+                            mark("openai.first_chunk", started, mode=profile.name, model=profile.model)
+                        part = normalize_text(chunk.choices[0].delta.content)
+                        parts.append(part)
+                        yield part
+            except Exception as e:
+                OPENAI_ERRORS.inc(profile.name, type(e).__name__)
+                raise
+            finally:
+                OPENAI_SECONDS.observe(time.perf_counter() - started, profile.name)
+                # Фаза охоплює і час, поки викликач обробляв отримані фрагменти
+                mark("openai.stream", started, mode=profile.name, model=profile.model)
+                # Потік без `usage`: списуємо оцінку (обірваний потік — за фактом)
+                prompt_tokens = _estimate_tokens(messages, "")
+                completion_tokens = _estimate_tokens((), "".join(parts))
+                OPENAI_TOKENS.inc(profile.name, "prompt", amount=prompt_tokens)
+                OPENAI_TOKENS.inc(profile.name, "completion", amount=completion_tokens)
+                self.scheduler.charge(chat_id, prompt_tokens + completion_tokens)
+
+    def set_prompt(self, prompt_text: str, chat_id=None, prompt_name=None) -> None:
+        """Починає нову розмову чату з вказаним системним промптом.
 
         Args:
             prompt_text (str): Текст системного повідомлення (`role="system"`).
+            chat_id: Ідентифікатор чату, чия розмова скидається.
+            prompt_name (str | None): Назва промпта — визначає профіль генерації
+                відповідей у цій розмові.
         """
-        prompt_text = normalize_text(prompt_text)
-        self.message_list.clear()
-        self.message_list.append({"role": "system", "content": prompt_text})
+        conversation = self.conversations.get(chat_id)
+        conversation.messages = [{"role": "system", "content": prompt_text}]
+        conversation.summary = ""
+        conversation.profile = prompt_name
+
+    async def add_message(self, message_text: str, chat_id=None) -> str:
+        """Додає повідомлення користувача до розмови чату й отримує відповідь.
 
-    async def add_message(self, message_text: str) -> str:
-        """Додає повідомлення користувача й отримує відповідь моделі.
+        Якщо під час очікування відповіді розмову було скинуто через
+        `set_prompt()`, відповідь потрапляє лише у стару (вже відкинуту)
+        історію і не змішується з новою. Якщо відповіді немає (скасування чи
+        помилка), повідомлення користувача прибирається з історії, щоб у ній
+        не опинилися дві репліки `user` поспіль.
 
         Args:
             message_text (str): Текст користувача, що додається з роллю `user`.
+            chat_id: Ідентифікатор чату.
 
         Returns:
             str: Текст відповіді асистента після звернення до API.
         """
-        message_text = normalize_text(message_text)
-        self.message_list.append({"role": "user", "content": message_text})
-        return await self.send_message_list()
+        self.scheduler.check(chat_id)
+        conversation = self.conversations.get(chat_id)
+        messages = conversation.messages
+        turn = {"role": "user", "content": message_text}
+        messages.append(turn)
+        try:
+            profile = self.profiles.get(conversation.profile)
+            request = await self._build_request(conversation, chat_id)
+            answer = await self.send_message_list(request, profile, chat_id=chat_id)
+        except BaseException:
+            _drop_turn(messages, turn)
+            raise
+        messages.append({"role": "assistant", "content": answer})
+        return answer
+
+    async def stream_message(self, message_text: str, chat_id=None):
+        """Потоковий варіант `add_message()`.
+
+        Відповідь додається до історії розмови лише після того, як потік
+        вичитано повністю; якщо потік обірвано (скасування, помилка),
+        повідомлення користувача теж прибирається з історії.
 
-    async def send_question(self, prompt_text: str, message_text: str) -> str:
+        Args:
+            message_text (str): Текст користувача, що додається з роллю `user`.
+            chat_id: Ідентифікатор чату.
+
+        Yields:
+            str: Фрагменти тексту відповіді.
+        """
+        self.scheduler.check(chat_id)
+        conversation = self.conversations.get(chat_id)
+        messages = conversation.messages
+        turn = {"role": "user", "content": message_text}
+        messages.append(turn)
+        parts = []
+        try:
+            profile = self.profiles.get(conversation.profile)
+            request = await self._build_request(conversation, chat_id)
+            async for part in self.stream_message_list(request, profile, chat_id=chat_id):
+                parts.append(part)
+                yield part
+        except BaseException:  # зокрема скасування застарілої генерації і закриття потоку
+            _drop_turn(messages, turn)
+            raise
+        messages.append({"role": "assistant", "content": "".join(parts)})
+
+    async def _build_request(self, conversation: Conversation, chat_id=None) -> list:
+        if self.context_window is None:
+            return list(conversation.messages)
+        await self._fold_history(conversation, chat_id)
+        return self.context_window.build(conversation)
+
+    async def _fold_history(self, conversation: Conversation, chat_id=None) -> None:
+        """Згортає старі репліки розмови в підсумок, якщо бюджет перевищено."""
+        window = self.context_window
+        count = window.fold_count(conversation)
+        if count == 0:
+            return
+        messages = conversation.messages
+        folded = messages[1:1 + count]
+        lines = "\n".join(m["role"] + ": " + m["content"] for m in folded)
+        request = [
+            {"role": "system", "content": load_prompt("summary")},
+            {"role": "user", "content": "Попередній підсумок: " + conversation.summary + "\n\nНові репліки:\n" + lines},
+        ]
+        summary = await self.send_message_list(request, self.profiles.get("summary"), max_tokens=window.summary_tokens,
+                                               chat_id=chat_id)
+        # Поки чекали на підсумок, розмову могли скинути через set_prompt().
+        if conversation.messages is messages:
+            del messages[1:1 + count]
+            conversation.summary = summary
+
+    async def send_question(self, prompt_text: str, message_text: str, prompt_name=None,
+                            cache=False, regenerate=False, chat_id=None) -> str:
         """Виконує одноразовий запит із вказаним системним промптом.
 
-        Очищає історію, додає системний промпт і повідомлення користувача, після
-        чого надсилає запит до моделі.
+        Запит не торкається історій розмов, тому безпечний для паралельного
+        виклику з будь-яких чатів. Однакові запити, що виконуються одночасно
+        (наприклад, подвійне натискання кнопки) з однаковими `cache` і
+        `regenerate`, обслуговуються одним зверненням до моделі через `flights`.
+        Якщо модель недоступна, а кеш увімкнено, повертається навіть
+        прострочена збережена відповідь.
 
         Args:
             prompt_text (str): Текст системного промпта (`role="system").
             message_text (str): Повідомлення користувача (`role="user").
+            prompt_name (str | None): Назва промпта: визначає профіль генерації
+                і входить до ключа кешу.
+            cache (bool): Чи брати відповідь із `response_cache` і зберігати її там.
+            regenerate (bool): Згенерувати нову відповідь в обхід кешу (вона
+                замінить збережену).
+            chat_id: Чат, від імені якого виконується запит (черга та бюджет
+                токенів у `scheduler`; відповідь із кешу бюджет не витрачає).
 
         Returns:
             str: Текст відповіді асистента.
+
+        Raises:
+            fair.QuotaExceeded: Якщо чат вичерпав бюджет токенів.
+        """
+        profile = self.profiles.get(prompt_name)
+        key = self._question_key(prompt_text, message_text, prompt_name, profile)
+        cache = cache and self.response_cache is not None
+        if cache and not regenerate:
+            answer = await self.response_cache.get(key)
+            if answer is not None:
+                return answer
+        self.scheduler.check(chat_id)
+
+        async def generate():
+            answer = await self.send_message_list([
+                {"role": "system", "content": prompt_text},
+                {"role": "user", "content": message_text},
+            ], profile, chat_id=chat_id)
+            if cache:
+                await self.response_cache.put(key, answer)
+            return answer
+
+        try:
+            # Режим кешу входить до ключа: «Інший варіант» не отримає відповідь
+            # звичайного запиту, а запит без кешу не пропустить збереження в кеш
+            return await self.flights.call(("send", key, cache, regenerate), generate)
+        except api_errors():
+            answer = await self.response_cache.get(key, stale=True) if cache else None
+            if answer is None:
+                raise
+            return answer
+
+    async def stream_question(self, prompt_text: str, message_text: str, prompt_name=None,
+                              cache=False, regenerate=False, chat_id=None):
+        """Потоковий варіант `send_question()`.
+
+        Відповідь із кешу віддається одним фрагментом; нова відповідь
+        потрапляє до кешу лише після того, як потік вичитано повністю.
+        Одночасні однакові запити ділять один потік.
+
+        Args:
+            prompt_text (str): Текст системного промпта (`role="system").
+            message_text (str): Повідомлення користувача (`role="user").
+            prompt_name (str | None): Назва промпта: визначає профіль генерації
+                і входить до ключа кешу.
+            cache (bool): Чи використовувати `response_cache`.
+            regenerate (bool): Згенерувати нову відповідь в обхід кешу.
+            chat_id: Чат, від імені якого виконується запит.
+
+        Yields:
+            str: Фрагменти тексту відповіді.
         """
-        prompt_text = normalize_text(prompt_text)
-        message_text = normalize_text(message_text)
-        self.message_list.clear()
-        self.message_list.append({"role": "system", "content": prompt_text})
-        self.message_list.append({"role": "user", "content": message_text})
-        return await self.send_message_list()
+        profile = self.profiles.get(prompt_name)
+        key = self._question_key(prompt_text, message_text, prompt_name, profile)
+        cache = cache and self.response_cache is not None
+        if cache and not regenerate:
+            answer = await self.response_cache.get(key)
+            if answer is not None:
+                yield answer
+                return
+        self.scheduler.check(chat_id)
+
+        async def generate():
+            parts = []
+            async for part in self.stream_message_list([
+                {"role": "system", "content": prompt_text},
+                {"role": "user", "content": message_text},
+            ], profile, chat_id=chat_id):
+                parts.append(part)
+                yield part
+            if cache:
+                await self.response_cache.put(key, "".join(parts))
+
+        streamed = False
+        try:
+            async with contextlib.aclosing(self.flights.stream(("stream", key, cache, regenerate), generate)) as parts:
+                async for part in parts:
+                    streamed = True
+                    yield part
+        except api_errors():
+            answer = await self.response_cache.get(key, stale=True) if cache and not streamed else None
+            if answer is None:
+                raise
+            yield answer
+
+    def _question_key(self, prompt_text, message_text, prompt_name, profile):
+        return ResponseCache.key(profile.model, prompt_name, prompt_text, message_text,
+                                 profile.max_tokens, profile.temperature)
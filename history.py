@@ -0,0 +1,331 @@
+"""Довговічна історія чатів: журнал змін лише на дописування.
+
+Історії розмов `/date` (`Conversation.messages`) і зібране листування
+`/message` (`Dialog.list`) живуть у пам’яті й зникають після перезапуску.
+`HistoryLog` записує їхні зміни в SQLite‑журнал:
+
+- після кожного апдейта `track()` порівнює стан об’єкта з попередньо
+  записаним і ставить у чергу лише різницю: нові елементи списків
+  (`append`), змінені скалярні поля (`meta`) або, якщо список замінено чи
+  змінено не дописуванням, повний знімок (`snapshot`);
+- фоновий потік пише чергу пакетами в одній транзакції, тож відповідь
+  користувачу не чекає на диск;
+- записаний знімок робить попередні записи потоку зайвими, тож у тій самій
+  транзакції вони видаляються; якщо ж після останнього знімка накопичується
+  понад `compact_threshold` дописувань, журнал потоку ущільнюється до
+  одного знімка;
+- після перезапуску чат «оживає» ліниво — під час першого апдейта
+  `load()` відтворює стан із журналу в окремому потоці (`asyncio.to_thread`).
+
+Використання (псевдокод):
+
+    history = HistoryLog(".cache/history.sqlite3")
+    state = await history.load(chat_id, "dialog", max_age=86400)
+    ...
+    history.track(chat_id, "dialog", dialog)
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Marker:
+    __slots__ = ("lists", "scalars")
+
+    def __init__(self, lists, scalars):
+        self.lists = lists
+        self.scalars = scalars
+
+
+def _extends(logged, value) -> bool:
+    """Чи лише дописано в список `value` після запису, описаного `logged`.
+
+    Для того самого об’єкта списку порівнює довжину та перший і останній
+    записані елементи: видалення всередині списку (`del messages[1:3]` під час
+    згортання історії) зсуває їх, і тоді потрібен повний знімок. Якщо список
+    замінено новим об’єктом (наприклад, `refresh()` відтворив сесію зі
+    сховища стану), порівнюється вміст записаної частини.
+    """
+    items, known, first, last = logged
+    if len(value) < known:
+        return False
+    if items is not value:
+        return len(items) == known and value[:known] == items
+    return known == 0 or (value[0] is first and value[known - 1] is last)
+
+
+def replay(records):
+    """Відтворює стан із послідовності записів журналу `(op, payload)`.
+
+    Returns:
+        dict | None: Стан у форматі `to_state()` або `None`, якщо в записах
+        немає знімка.
+    """
+    state = None
+    for op, payload in records:
+        if op == "snapshot":
+            state = payload
+        elif state is None:
+            continue
+        elif op == "append":
+            state.setdefault(payload["field"], []).extend(payload["items"])
+        elif op == "meta":
+            state.update(payload)
+    return state
+
+
+class HistoryLog:
+    """Журнал змін станів чатів у SQLite із фоновим пакетним записом.
+
+    Атрибути:
+        path (str): Шлях до SQLite‑файлу журналу.
+        flush_interval (float): Період пакетного запису, секунди.
+        compact_threshold (int): Скільки записів після знімка запускають ущільнення.
+        max_tracked (int): Скільки потоків тримати в пам’яті для обчислення різниці.
+        appended, flushes, compactions, pruned, restored (int): Лічильники
+            (`pruned` — записи, видалені як застарілі після нового знімка).
+    """
+
+    def __init__(self, path, flush_interval=0.2, compact_threshold=200, max_tracked=100_000, clock=time.time):
+        """Відкриває журнал і запускає фоновий потік запису.
+
+        Args:
+            path (str): Шлях до SQLite‑файлу.
+            flush_interval (float): Період пакетного запису, секунди.
+            compact_threshold (int): Поріг записів для ущільнення потоку.
+            max_tracked (int): Ліміт потоків із відомим записаним станом.
+            clock (callable): Джерело часу.
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.compact_threshold = compact_threshold
+        self.max_tracked = max_tracked
+        self._clock = clock
+        self._markers = OrderedDict()
+        self._queue = []
+        self._mutex = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._counts = {}
+        self.appended = 0
+        self.flushes = 0
+        self.compactions = 0
+        self.pruned = 0
+        self.restored = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = self._connect()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id TEXT NOT NULL, "
+            "stream TEXT NOT NULL, op TEXT NOT NULL, payload TEXT NOT NULL, ts REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS history_stream ON history (chat_id, stream, id)")
+        db.close()
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def track(self, chat_id, stream, item) -> None:
+        """Ставить у чергу зміни об’єкта з моменту попереднього `track()`.
+
+        Не звертається до диска. Об’єкт має надавати `to_state()`; поля‑списки
+        дописуються інкрементально, решта полів записується при зміні.
+
+        Args:
+            chat_id: Ідентифікатор чату.
+            stream (str): Назва потоку (`dialog`, `conversation`).
+            item: Об’єкт із методом `to_state()`.
+        """
+        state = item.to_state()
+        name = (str(chat_id), stream)
+        lists = {field: value for field, value in state.items() if isinstance(value, list)}
+        scalars = {field: json.dumps(value, ensure_ascii=False)
+                   for field, value in state.items() if not isinstance(value, list)}
+        marker = self._markers.get(name)
+        records = []
+        if marker is None or any(
+            field not in marker.lists or not _extends(marker.lists[field], value) for field, value in lists.items()
+        ):
+            records.append(("snapshot", state))
+        else:
+            for field, value in lists.items():
+                known = marker.lists[field][1]
+                if len(value) > known:
+                    records.append(("append", {"field": field, "items": value[known:]}))
+            changed = {field: state[field] for field, encoded in scalars.items() if marker.scalars.get(field) != encoded}
+            if changed:
+                records.append(("meta", changed))
+        self._mark(name, lists, scalars)
+        if not records:
+            return
+        now = self._clock()
+        # Кодуємо одразу: об’єкт може змінитися до запису фоновим потоком
+        encoded = [(name[0], stream, op, json.dumps(payload, ensure_ascii=False), now) for op, payload in records]
+        with self._mutex:
+            self._queue.extend(encoded)
+        self.appended += len(encoded)
+        self._wake.set()
+
+    def _mark(self, name, lists, scalars) -> None:
+        self._markers[name] = _Marker(
+            {field: (value, len(value), value[0] if value else None, value[-1] if value else None)
+             for field, value in lists.items()},
+            scalars,
+        )
+        self._markers.move_to_end(name)
+        if len(self._markers) > self.max_tracked:
+            self._markers.popitem(last=False)
+
+    async def load(self, chat_id, stream, max_age=None):
+        """Відтворює стан потоку чату з журналу (у фоновому потоці).
+
+        Args:
+            chat_id: Ідентифікатор чату.
+            stream (str): Назва потоку.
+            max_age (float | None): Не відновлювати потік, останній запис якого
+                старший за `max_age` секунд.
+
+        Журнал читається лише раз на потік за час життя процесу: після
+        `load()` або `track()` актуальним вважається стан у пам’яті.
+
+        Returns:
+            dict | None: Стан у форматі `to_state()` або `None`.
+        """
+        name = (str(chat_id), stream)
+        if name in self._markers:
+            return None  # потік уже відомий цьому процесу: пам’ять актуальніша за журнал
+        with self._mutex:
+            pending = [(op, json.loads(payload)) for cid, s, op, payload, _ in self._queue if (cid, s) == name]
+        rows, last_ts = await asyncio.to_thread(self._read, name)
+        if pending:
+            last_ts = self._clock()
+        state = replay(rows + pending)
+        if state is None or (max_age is not None and last_ts < self._clock() - max_age):
+            self._mark(name, {}, {})  # наступні апдейти чату не читатимуть журнал
+            return None
+        self.restored += 1
+        return state
+
+    def _read(self, name):
+        db = self._connect()
+        try:
+            rows = db.execute(
+                "SELECT op, payload, ts FROM history WHERE chat_id = ? AND stream = ? AND id >= COALESCE("
+                "(SELECT MAX(id) FROM history WHERE chat_id = ? AND stream = ? AND op = 'snapshot'), 0) ORDER BY id",
+                (*name, *name),
+            ).fetchall()
+        finally:
+            db.close()
+        last_ts = rows[-1][2] if rows else None
+        return [(op, json.loads(payload)) for op, payload, _ in rows], last_ts
+
+    def remember(self, chat_id, stream, item) -> None:
+        """Позначає відновлений об’єкт як уже записаний (без нового знімка)."""
+        state = item.to_state()
+        self._mark(
+            (str(chat_id), stream),
+            {field: value for field, value in state.items() if isinstance(value, list)},
+            {field: json.dumps(value, ensure_ascii=False) for field, value in state.items() if not isinstance(value, list)},
+        )
+
+    def _run(self) -> None:
+        writer = self._connect()
+        while True:
+            self._wake.wait()
+            if not self._stopped:
+                time.sleep(self.flush_interval)  # збираємо пакет
+            self._wake.clear()
+            try:
+                self._flush(writer)
+            except sqlite3.Error as e:
+                print("⚠️ History flush failed:", e)
+                self._wake.set()
+                time.sleep(1.0)
+            if self._stopped:
+                writer.close()
+                return
+
+    def _flush(self, writer) -> None:
+        with self._mutex:
+            batch, self._queue = self._queue, []
+        if not batch:
+            return
+        snapshots = {(chat_id, stream) for chat_id, stream, op, _, _ in batch if op == "snapshot"}
+        writer.execute("BEGIN IMMEDIATE")
+        try:
+            writer.executemany("INSERT INTO history (chat_id, stream, op, payload, ts) VALUES (?, ?, ?, ?, ?)", batch)
+            pruned = 0
+            for name in snapshots:
+                # Усе до останнього знімка потоку вже не потрібне для відтворення
+                pruned += writer.execute(
+                    "DELETE FROM history WHERE chat_id = ? AND stream = ? AND id < ("
+                    "SELECT MAX(id) FROM history WHERE chat_id = ? AND stream = ? AND op = 'snapshot')",
+                    (*name, *name),
+                ).rowcount
+            writer.execute("COMMIT")
+        except BaseException:
+            writer.execute("ROLLBACK")
+            with self._mutex:
+                self._queue[:0] = batch
+            raise
+        self.flushes += 1
+        self.pruned += pruned
+        counts = self._counts
+        for chat_id, stream, op, _, _ in batch:
+            name = (chat_id, stream)
+            counts[name] = 1 if op == "snapshot" else counts.get(name, 0) + 1
+        for name in [name for name, count in counts.items() if count > self.compact_threshold]:
+            self._compact(writer, name)
+            del counts[name]
+        if len(counts) > self.max_tracked:
+            counts.clear()  # лічильники приблизні: забуті потоки ущільняться пізніше
+
+    def _compact(self, writer, name) -> None:
+        writer.execute("BEGIN IMMEDIATE")
+        try:
+            rows = writer.execute(
+                "SELECT id, op, payload, ts FROM history WHERE chat_id = ? AND stream = ? ORDER BY id", name
+            ).fetchall()
+            state = replay((op, json.loads(payload)) for _, op, payload, _ in rows)
+            if state is not None:
+                last_id, last_ts = rows[-1][0], rows[-1][3]
+                writer.execute("DELETE FROM history WHERE chat_id = ? AND stream = ? AND id <= ?", (*name, last_id))
+                writer.execute(
+                    "INSERT INTO history (chat_id, stream, op, payload, ts) VALUES (?, ?, 'snapshot', ?, ?)",
+                    (*name, json.dumps(state, ensure_ascii=False), last_ts),
+                )
+            writer.execute("COMMIT")
+        except BaseException:
+            writer.execute("ROLLBACK")
+            raise
+        self.compactions += 1
+
+    def close(self) -> None:
+        """Дописує чергу й зупиняє фоновий потік."""
+        self._stopped = True
+        self._wake.set()
+        self._thread.join(timeout=5.0)
+
+    def stats(self) -> dict:
+        """Повертає глибину черги та лічильники журналу."""
+        with self._mutex:
+            queued = len(self._queue)
+        return {
+            "queued": queued,
+            "appended": self.appended,
+            "flushes": self.flushes,
+            "compactions": self.compactions,
+            "pruned": self.pruned,
+            "restored": self.restored,
+        }
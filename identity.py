@@ -0,0 +1,60 @@
+"""Заздалегідь відома ідентичність бота для швидкого холодного старту.
+
+`Application.initialize()` викликає `Bot.initialize()`, який робить запит
+`getMe`, щоб дізнатися id та username бота. На Vercel це окремий мережевий
+round trip на кожному холодному старті, і його чекає перший користувач.
+
+Id бота — це числовий префікс токена (`123456:ABC…`), а username відомий
+заздалегідь, тож `PresetIdentityBot` повертає з `get_me()` готовий об’єкт
+`User` без звернення до Bot API. Ціна — токен не перевіряється під час
+старту: якщо він недійсний, помилку поверне перший справжній запит.
+
+Використання (псевдокод):
+
+    identity = identity_from_token(token, "my_bot")
+    bot = PresetIdentityBot(token, identity=identity)
+    application = ApplicationBuilder().bot(bot).build()
+"""
+
+from telegram import User
+from telegram.ext import ExtBot
+
+
+def identity_from_token(token, username, first_name=None):
+    """Будує `User` бота з токена та username.
+
+    Args:
+        token (str): Токен Bot API (`<id>:<секрет>`).
+        username (str): Username бота без `@`.
+        first_name (str | None): Ім’я бота; за замовчуванням — username.
+
+    Returns:
+        User | None: Ідентичність бота або `None`, якщо username не задано чи
+        токен не містить числового id.
+    """
+    username = (username or "").strip().lstrip("@")
+    prefix = token.split(":", 1)[0]
+    if not username or not prefix.isdigit():
+        return None
+    return User(id=int(prefix), first_name=first_name or username, is_bot=True, username=username)
+
+
+class PresetIdentityBot(ExtBot):
+    """`ExtBot`, що не робить запит `getMe`, якщо ідентичність задано наперед."""
+
+    def __init__(self, token, *args, identity=None, **kwargs):
+        """Ініціалізує бота.
+
+        Args:
+            token (str): Токен Bot API.
+            identity (User | None): Готова ідентичність бота; `None` — звичайний `getMe`.
+            *args, **kwargs: Решта параметрів `ExtBot`.
+        """
+        super().__init__(token, *args, **kwargs)
+        self._identity = identity
+
+    async def get_me(self, *args, **kwargs):
+        if self._identity is None:
+            return await super().get_me(*args, **kwargs)
+        self._bot_user = self._identity
+        return self._identity
@@ -0,0 +1,224 @@
+"""Метрики процесу у текстовому форматі Prometheus.
+
+Модуль без зовнішніх залежностей: лічильники й гістограми — це словники за
+кортежем значень міток, а запис — кілька операцій зі словником і `bisect`,
+тож інструментація може працювати в продакшні постійно. Бот виконується в
+одному циклі подій, тому блокувань немає.
+
+Крім власних метрик, `Registry.collect()` підключає готові `stats()`
+компонентів (черги, кеші, планувальники): їхні числові значення читаються
+лише під час рендерингу `/api/metrics` і нічого не коштують між запитами.
+
+Використання (псевдокод):
+
+    LATENCY = histogram("openai_request_seconds", "Тривалість запиту до моделі", ("mode",))
+    with LATENCY.time("gpt"):
+        ...
+    REGISTRY.collect("dispatcher", dispatcher.stats)
+    text = REGISTRY.render()
+"""
+
+import bisect
+import contextlib
+import functools
+import time
+
+from tracing import span
+
+PREFIX = "bot_"
+
+# Межі кошиків гістограм затримок, секунди
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Монотонний лічильник із мітками.
+
+    Атрибути:
+        name (str): Повна назва метрики (з префіксом).
+        help (str): Опис для `# HELP`.
+        labelnames (tuple): Назви міток.
+    """
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1) -> None:
+        """Збільшує лічильник для значень міток `labels`."""
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    """Гістограма з фіксованими кошиками та мітками.
+
+    Атрибути:
+        name (str): Повна назва метрики (з префіксом).
+        help (str): Опис для `# HELP`.
+        labelnames (tuple): Назви міток.
+        buckets (tuple): Верхні межі кошиків (без `+Inf`).
+    """
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, value, *labels) -> None:
+        """Записує одне спостереження для значень міток `labels`."""
+        series = self._series.get(labels)
+        if series is None:
+            # [лічильники кошиків..., +Inf, сума]
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, *labels):
+        """Вимірює тривалість блоку `with` (і тоді, коли він завершився винятком)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labelnames + ("le",)
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(names, labels + (_number(bound),))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Registry:
+    """Набір метрик і колекторів `stats()`, що рендеряться разом."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        """Додає метрику до реєстру й повертає її."""
+        self._metrics.append(metric)
+        return metric
+
+    def collect(self, name, stats) -> None:
+        """Підключає `stats()` компонента як набір метрик `bot_<name>_<ключ>`.
+
+        Числові значення (у тому числі вкладених словників) стають метриками
+        типу `untyped`; рядки та `None` пропускаються. Якщо словник містить
+        `hits` і `misses`, додається частка влучань `hit_ratio`.
+
+        Args:
+            name (str): Назва компонента в назвах метрик.
+            stats (callable): Функція, що повертає словник статистики.
+        """
+        self._collectors.append((name, stats))
+
+    def render(self) -> str:
+        """Повертає всі метрики в текстовому форматі Prometheus 0.0.4."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, stats in self._collectors:
+            try:
+                values = stats()
+            except Exception as e:  # метрики не повинні ламатися через один компонент
+                print(f"⚠️ Metrics collector {name} failed:", repr(e))
+                continue
+            self._flatten(lines, PREFIX + name, values)
+        lines.append("")
+        return "\n".join(lines)
+
+    def _flatten(self, lines, prefix, values) -> None:
+        if not isinstance(values, dict):
+            return
+        for key, value in values.items():
+            name = f"{prefix}_{key}"
+            if isinstance(value, dict):
+                self._flatten(lines, name, value)
+            elif isinstance(value, (int, float)):
+                lines.append(f"# TYPE {name} untyped")
+                lines.append(f"{name} {_number(value)}")
+        hits, misses = values.get("hits"), values.get("misses")
+        if isinstance(hits, int) and isinstance(misses, int):
+            lines.append(f"# TYPE {prefix}_hit_ratio gauge")
+            lines.append(f"{prefix}_hit_ratio {_number(hits / (hits + misses) if hits + misses else 0.0)}")
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help, labelnames=()) -> Counter:
+    """Створює лічильник `bot_<name>` у глобальному реєстрі."""
+    return REGISTRY.register(Counter(PREFIX + name, help, labelnames))
+
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+    """Створює гістограму `bot_<name>` у глобальному реєстрі."""
+    return REGISTRY.register(Histogram(PREFIX + name, help, labelnames, buckets))
+
+
+HANDLER_SECONDS = histogram("handler_seconds", "Тривалість обробки апдейта хендлером", ("handler",))
+HANDLER_ERRORS = counter("handler_errors_total", "Хендлери, що завершилися винятком", ("handler", "error"))
+OPENAI_SECONDS = histogram("openai_request_seconds", "Тривалість запиту до моделі (з повторами та очікуванням слота)", ("mode",))
+OPENAI_FIRST_CHUNK_SECONDS = histogram("openai_first_chunk_seconds", "Час до першого фрагмента потокової відповіді",
+                                       ("mode",))
+OPENAI_TOKENS = counter("openai_tokens_total", "Токени моделі (для потокових відповідей — оцінка)", ("mode", "kind"))
+OPENAI_ERRORS = counter("openai_errors_total", "Невдалі запити до моделі", ("mode", "error"))
+TELEGRAM_SECONDS = histogram("telegram_request_seconds", "Тривалість виклику Bot API", ("method",))
+TELEGRAM_RESPONSES = counter("telegram_responses_total", "Відповіді Bot API за HTTP‑статусом", ("method", "status"))
+
+
+def handler_metrics(handler):
+    """Декоратор хендлера: кількість і тривалість викликів, помилки за типом.
+
+    Кількість викликів — це `bot_handler_seconds_count{handler="..."}`.
+    Виклик також стає фазою `handler.<назва>` у трасі апдейта.
+    """
+    name = handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with span("handler." + name):
+                return await handler(*args, **kwargs)
+        except Exception as e:
+            HANDLER_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+
+    return wrapper
@@ -0,0 +1,177 @@
+"""Long polling для власного сервера — без вебсервера й вебхука.
+
+`LongPoller` забирає апдейти пачками через `getUpdates` і передає їх у
+`UpdateDispatcher` (див. `dispatch.py`): апдейти різних чатів обробляються
+паралельно (до `DISPATCH_WORKERS` одночасно), апдейти одного чату — по черзі.
+Обробка — той самий `process_update`, що й у вебхука, з тими самими хендлерами
+з `bot.py`, дедуплікацією та блокуваннями чатів.
+
+Коли черга диспетчера заповнена, поллер не підтверджує решту пачки й
+запитує її знову пізніше — Telegram зберігає непідтверджені апдейти.
+На SIGINT/SIGTERM поллер перестає забирати нові апдейти, дочікується обробки
+черги (`DISPATCH_DRAIN_TIMEOUT`) і підтверджує оброблене.
+
+Запуск:
+
+    python polling.py
+"""
+
+import asyncio
+import os
+import signal
+
+from telegram.error import NetworkError, RetryAfter
+
+from bot import process_update, ensure_started, application, chatgpt, generations, state_backend, history
+from dispatch import UpdateDispatcher, update_chat_id
+
+POLL_TIMEOUT = int(os.getenv("POLL_TIMEOUT", "30"))
+POLL_LIMIT = int(os.getenv("POLL_LIMIT", "100"))
+DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", "32"))
+DISPATCH_MAX_PENDING = int(os.getenv("DISPATCH_MAX_PENDING", "1000"))
+DISPATCH_ENQUEUE_TIMEOUT = float(os.getenv("DISPATCH_ENQUEUE_TIMEOUT", "0.5"))
+DISPATCH_DRAIN_TIMEOUT = float(os.getenv("DISPATCH_DRAIN_TIMEOUT", "25"))
+
+
+class LongPoller:
+    """Цикл `getUpdates` із передачею апдейтів у `UpdateDispatcher`.
+
+    Атрибути:
+        bot: Бот `python-telegram-bot`, через який виконується `getUpdates`.
+        dispatcher (UpdateDispatcher): Черга обробки апдейтів.
+        timeout (int): Тривалість одного long poll запиту, секунди.
+        limit (int): Максимум апдейтів в одній пачці (1–100).
+        offset (int | None): Наступний `update_id`, який треба забрати.
+        polls, received, deferred, errors (int): Лічильники.
+    """
+
+    def __init__(self, bot, dispatcher, timeout=30, limit=100, on_accept=None):
+        """Ініціалізує поллер.
+
+        Args:
+            bot: Бот `python-telegram-bot`.
+            dispatcher (UpdateDispatcher): Черга обробки (запускається в `run()`).
+            timeout (int): Long poll timeout, секунди.
+            limit (int): Розмір пачки.
+            on_accept (callable | None): Викликається для кожного прийнятого апдейта.
+        """
+        self.bot = bot
+        self.dispatcher = dispatcher
+        self.timeout = timeout
+        self.limit = limit
+        self.on_accept = on_accept
+        self.offset = None
+        self._stopping = asyncio.Event()
+        self.polls = 0
+        self.received = 0
+        self.deferred = 0
+        self.errors = 0
+
+    def stop(self) -> None:
+        """Просить цикл завершитися після поточного запиту."""
+        self._stopping.set()
+
+    async def run(self, drain_timeout=25.0) -> bool:
+        """Забирає й обробляє апдейти до виклику `stop()`, потім дренує чергу.
+
+        Returns:
+            bool: `True`, якщо під час зупинки черга встигла обробитися.
+        """
+        # getUpdates не працює, поки встановлено вебхук
+        await self.bot.delete_webhook()
+        self.dispatcher.start()
+        stopping = asyncio.create_task(self._stopping.wait())
+        try:
+            while not self._stopping.is_set():
+                poll = asyncio.create_task(self._poll())
+                await asyncio.wait((poll, stopping), return_when=asyncio.FIRST_COMPLETED)
+                if not poll.done():
+                    poll.cancel()  # отримані, але не прийняті апдейти Telegram віддасть знову
+                    await asyncio.gather(poll, return_exceptions=True)
+                    break
+                await poll
+        finally:
+            stopping.cancel()
+            drained = await self.dispatcher.drain(drain_timeout)
+        if self.offset is not None:
+            # Підтверджуємо останню пачку, щоб після перезапуску вона не прийшла знову
+            try:
+                await self.bot.get_updates(offset=self.offset, limit=1, timeout=0)
+            except NetworkError as e:
+                print("⚠️ Failed to confirm polled updates:", e)
+        return drained
+
+    async def _poll(self) -> None:
+        try:
+            updates = await self.bot.get_updates(
+                offset=self.offset, limit=self.limit, timeout=self.timeout, read_timeout=self.timeout + 10
+            )
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            return
+        except NetworkError as e:  # включно з TimedOut
+            self.errors += 1
+            print("⚠️ getUpdates failed:", e)
+            await asyncio.sleep(min(30.0, 2.0 ** min(self.errors, 5)))
+            return
+        self.errors = 0
+        self.polls += 1
+        for update in updates:
+            update_json = update.to_dict()
+            if not await self.dispatcher.submit(update_json):
+                # Черга переповнена: наступний getUpdates почнеться з цього апдейта
+                self.deferred += 1
+                return
+            self.received += 1
+            self.offset = update.update_id + 1
+            if self.on_accept is not None:
+                self.on_accept(update_json)
+
+    def stats(self) -> dict:
+        """Повертає лічильники поллера й диспетчера."""
+        return {
+            "polls": self.polls,
+            "received": self.received,
+            "deferred": self.deferred,
+            "offset": self.offset,
+            "dispatcher": self.dispatcher.stats(),
+        }
+
+
+async def main():
+    dispatcher = UpdateDispatcher(
+        process_update,
+        workers=DISPATCH_WORKERS,
+        max_pending=DISPATCH_MAX_PENDING,
+        overload="reject",
+        # Очікування місця в черзі — природний backpressure для циклу getUpdates
+        enqueue_timeout=DISPATCH_ENQUEUE_TIMEOUT,
+    )
+    poller = LongPoller(
+        application.bot,
+        dispatcher,
+        timeout=POLL_TIMEOUT,
+        limit=POLL_LIMIT,
+        # Апдейт чекатиме в черзі чату, доки йде стара генерація, — зупиняємо її одразу
+        on_accept=lambda update_json: generations.supersede(update_chat_id(update_json), update_json.get("update_id")),
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, poller.stop)
+
+    await ensure_started()
+    print(f"Polling started: workers={DISPATCH_WORKERS} limit={POLL_LIMIT} timeout={POLL_TIMEOUT}s")
+    try:
+        drained = await poller.run(DISPATCH_DRAIN_TIMEOUT)
+        print("Polling stopped:", "drained" if drained else "drain timed out", poller.stats())
+    finally:
+        await application.stop()
+        await application.shutdown()
+        await chatgpt.close()
+        state_backend.close()
+        if history is not None:
+            history.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
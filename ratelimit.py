@@ -0,0 +1,199 @@
+"""Планувальник вихідних викликів Bot API з обмеженням швидкості.
+
+Telegram обмежує бота приблизно 30 повідомленнями на секунду загалом і
+близько одного повідомлення на секунду в межах одного чату; перевищення
+закінчується помилкою 429 (`RetryAfter`). `SendScheduler` пропускає кожен
+виклик через два «відра токенів» — глобальне та відро конкретного чату — і:
+
+- зберігає порядок викликів у межах чату (виклики чату виконуються по черзі);
+- автоматично чекає `retry_after` і повторює виклик після 429;
+- рахує глибину черги та кількість повторів, щоб бот міг працювати на межі
+  лімітів без помилок.
+
+Використання (псевдокод):
+
+    scheduler = SendScheduler(global_rate=30, chat_rate=1, chat_burst=3)
+    await scheduler.call(chat_id, lambda: bot.send_message(chat_id=chat_id, text="Hi"))
+"""
+
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+from telegram.request import HTTPXRequest
+
+from metrics import TELEGRAM_RESPONSES, TELEGRAM_SECONDS
+from tracing import span
+
+
+class TokenBucket:
+    """Відро токенів із резервуванням наперед.
+
+    Якщо токенів немає, `reserve()` все одно списує токен (баланс стає
+    від’ємним) і повертає, скільки секунд треба зачекати. Так виклики
+    отримують слоти строго в порядку звернення.
+    """
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def is_full(self, now) -> bool:
+        """Чи відро вже повністю наповнилось (його стан можна відкинути)."""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+    def reserve(self, now) -> float:
+        """Резервує один токен і повертає необхідну затримку, секунди."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class _Lane:
+    __slots__ = ("lock", "bucket", "waiting")
+
+    def __init__(self, bucket):
+        self.lock = asyncio.Lock()
+        self.bucket = bucket
+        self.waiting = 0
+
+
+class SendScheduler:
+    """Глобальний і по‑чатовий rate limiter для викликів Bot API.
+
+    Атрибути:
+        global_rate (float): Глобальний ліміт викликів на секунду.
+        chat_rate (float): Ліміт викликів на секунду для одного чату.
+        chat_burst (int): Скільки викликів чат може зробити без пауз.
+        max_retries (int): Скільки разів повторювати виклик після 429.
+        queued (int): Скільки викликів зараз чекає своєї черги.
+        sent, retries, throttled (int): Лічильники викликів, повторів після
+            429 і викликів, яким довелося чекати на токен.
+    """
+
+    def __init__(self, global_rate=30.0, chat_rate=1.0, chat_burst=3, max_retries=3, clock=time.monotonic):
+        """Ініціалізує планувальник.
+
+        Args:
+            global_rate (float): Глобальний ліміт, викликів/с.
+            chat_rate (float): Ліміт на чат, викликів/с.
+            chat_burst (int): Ємність відра чату.
+            max_retries (int): Максимум повторів після `RetryAfter`.
+            clock (callable): Джерело монотонного часу.
+        """
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._clock = clock
+        self._global = TokenBucket(global_rate, global_rate, clock())
+        self._lanes = {}
+        self._calls = 0
+        self.queued = 0
+        self.sent = 0
+        self.retries = 0
+        self.throttled = 0
+
+    async def call(self, chat_id, request, ordered=True):
+        """Виконує виклик Bot API з дотриманням лімітів і порядку в чаті.
+
+        Args:
+            chat_id: Чат, до якого належить виклик.
+            request (callable): Функція без аргументів, що повертає корутину
+                виклику (викликається повторно після 429).
+            ordered (bool): `False` для службових викликів, що не є
+                повідомленнями (налаштування меню): вони не чекають черги чату
+                й обмежуються лише глобальним лімітом.
+
+        Returns:
+            Результат виклику Bot API.
+
+        Raises:
+            telegram.error.RetryAfter: Якщо ліміт повторів вичерпано.
+        """
+        if not ordered:
+            return await self._send(request, None)
+        self._calls += 1
+        if self._calls % 1000 == 0:
+            self._sweep()
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            lane = self._lanes[chat_id] = _Lane(TokenBucket(self.chat_rate, self.chat_burst, self._clock()))
+        lane.waiting += 1
+        self.queued += 1
+        try:
+            async with lane.lock:
+                self.queued -= 1
+                return await self._send(request, lane.bucket)
+        finally:
+            lane.waiting -= 1
+
+    async def _send(self, request, bucket):
+        attempt = 0
+        while True:
+            if bucket is not None:
+                await self._wait(bucket)
+            await self._wait(self._global)
+            try:
+                result = await request()
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(float(e.retry_after))
+                continue
+            self.sent += 1
+            return result
+
+    def _sweep(self) -> None:
+        # Прибираємо чати без черги, чиї відра вже наповнились: їхній стан
+        # не відрізняється від щойно створеного.
+        now = self._clock()
+        idle = [chat_id for chat_id, lane in self._lanes.items() if lane.waiting == 0 and lane.bucket.is_full(now)]
+        for chat_id in idle:
+            del self._lanes[chat_id]
+
+    async def _wait(self, bucket) -> None:
+        delay = bucket.reserve(self._clock())
+        if delay > 0:
+            self.throttled += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        """Повертає глибину черги та лічильники планувальника."""
+        return {
+            "queued": self.queued,
+            "chats": len(self._lanes),
+            "sent": self.sent,
+            "retries": self.retries,
+            "throttled": self.throttled,
+        }
+
+
+class MeteredRequest(HTTPXRequest):
+    """`HTTPXRequest`, що записує тривалість і HTTP‑статус кожного виклику Bot API.
+
+    Метод Bot API береться з кінця URL (`.../bot<token>/sendMessage`), тож
+    токен у мітки не потрапляє. 429 видно як `status="429"` у
+    `bot_telegram_responses_total`; помилки мережі — як `status="error"`.
+    Кожен виклик також стає фазою `telegram.<метод>` у трасі апдейта.
+    """
+
+    async def do_request(self, url, *args, **kwargs):
+        method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        status = "error"
+        try:
+            with span("telegram." + method):
+                status, payload = await super().do_request(url, *args, **kwargs)
+            return status, payload
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - started, method)
+            TELEGRAM_RESPONSES.inc(method, str(status))
@@ -1,18 +1,100 @@
+import hmac
+import os
 import time
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import uvicorn
-from bot import process_update
+from bot import process_update, ensure_started, application, chatgpt, sessions, dedup, send_scheduler, menu_cache, generations, state_backend, history, tracer
+from dispatch import UpdateDispatcher, update_chat_id
+from metrics import REGISTRY
+
+# Без токена ендпоінт /api/tracing вимкнено
+TRACING_TOKEN = os.getenv("TRACING_TOKEN", "").strip()
+DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", "32"))
+DISPATCH_MAX_PENDING = int(os.getenv("DISPATCH_MAX_PENDING", "1000"))
+DISPATCH_OVERLOAD = os.getenv("DISPATCH_OVERLOAD", "reject").strip()
+DISPATCH_ENQUEUE_TIMEOUT = float(os.getenv("DISPATCH_ENQUEUE_TIMEOUT", "0.5"))
+DISPATCH_DRAIN_TIMEOUT = float(os.getenv("DISPATCH_DRAIN_TIMEOUT", "25"))
 
 app = FastAPI()
 
+# Апдейти обробляються у фоні: webhook відповідає одразу після постановки в чергу
+dispatcher = UpdateDispatcher(
+    process_update,
+    workers=DISPATCH_WORKERS,
+    max_pending=DISPATCH_MAX_PENDING,
+    overload=DISPATCH_OVERLOAD,
+    enqueue_timeout=DISPATCH_ENQUEUE_TIMEOUT,
+)
+
+@app.on_event("startup")
+async def startup():
+    try:
+        await ensure_started()
+    except Exception as e:
+        # Наприклад, без TELEGRAM_BOT_USERNAME і без мережі: повторимо на першому апдейті
+        print("⚠️ Telegram application start deferred:", e)
+    dispatcher.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await dispatcher.drain(DISPATCH_DRAIN_TIMEOUT)
+    # Застосунок міг так і не стартувати (відкладений старт без мережі)
+    if application.running:
+        await application.stop()
+    await application.shutdown()
+    await chatgpt.close()
+    state_backend.close()
+    if history is not None:
+        history.close()
+
+# Компоненти зі stats(): їх показують і /api/health, і /api/metrics
+components = {
+    "sessions": sessions.stats,
+    "conversations": chatgpt.conversations.stats,
+    "dispatcher": dispatcher.stats,
+    "dedup": dedup.stats,
+    "telegram": send_scheduler.stats,
+    "menu_cache": menu_cache.stats,
+    "response_cache": lambda: chatgpt.response_cache.stats() if chatgpt.response_cache else None,
+    "openai_coalescing": chatgpt.flights.stats,
+    "generations": generations.stats,
+    "openai_transport": chatgpt.transport.stats,
+    "openai_scheduler": chatgpt.scheduler.stats,
+    "state": state_backend.stats,
+    "history": lambda: history.stats() if history is not None else None,
+    "tracing": tracer.stats,
+}
+for name, stats in components.items():
+    REGISTRY.collect(name, stats)
+
 @app.get("/api/health")
 async def health():
     return {
         "status": "ok",
-        "timestamp": int(time.time())
+        "timestamp": int(time.time()),
+        **{name: stats() for name, stats in components.items()},
     }
 
+@app.get("/api/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/api/tracing")
+async def configure_tracing(request: Request):
+    """Змінює налаштування трасування цього процесу без перезапуску.
+
+    Тіло — JSON із полями `sample`, `slow_ms`, `profile_every`, `profile_dir`;
+    заголовок `X-Tracing-Token` має збігатися з `TRACING_TOKEN`.
+    """
+    if not TRACING_TOKEN or not hmac.compare_digest(request.headers.get("x-tracing-token", ""), TRACING_TOKEN):
+        return JSONResponse({"ok": False}, status_code=404)
+    try:
+        tracer.configure(**await request.json())
+    except (ValueError, TypeError) as e:
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=400)
+    return {"ok": True, "tracing": tracer.stats()}
+
 @app.get("/")
 async def root():
     return {"status": "ok"}
@@ -21,11 +103,14 @@ async def root():
 async def telegram_webhook(request: Request):
     try:
         update_json = await request.json()
-        await process_update(update_json)
-        return JSONResponse({"ok": True})
     except Exception as e:
         print("Webhook error:", e)
-        return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=400)
+    if not await dispatcher.submit(update_json):
+        return JSONResponse({"ok": False, "error": "overloaded"}, status_code=503)
+    # Апдейт чекатиме в черзі чату, доки йде стара генерація, — зупиняємо її одразу
+    generations.supersede(update_chat_id(update_json), update_json.get("update_id"))
+    return JSONResponse({"ok": True})
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
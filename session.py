@@ -0,0 +1,175 @@
+"""Сховище сесій чатів із витісненням за TTL та LRU.
+
+Замість одного глобального об’єкта стану кожен чат Telegram отримує власну
+сесію, ключем якої є `effective_chat.id`. Сховище тримає сесії в
+`OrderedDict` у порядку останнього звернення, тому:
+
+- сесії, що простоювали довше за `ttl`, завжди опиняються на початку словника
+  і видаляються за амортизований O(1) під час наступних звернень;
+- при перевищенні `max_size` витісняється найдавніше використана сесія (LRU).
+
+Використання (псевдокод):
+
+    sessions = SessionStore(Dialog, ttl=3600, max_size=100_000)
+    dialog = sessions.get(update.effective_chat.id)
+    dialog.mode = "gpt"
+
+Об’єкти, що повертає `factory`, мають містити атрибут `touched` — у ньому
+сховище зберігає час останнього звернення (значення `time.monotonic()`).
+
+Якщо задано `backend` (див. `state.py`), пам’ять сховища працює як кеш
+спільного стану: `refresh()` підтягує актуальну версію сесії з бекенда перед
+обробкою апдейта, а `persist()` зберігає її після. Для цього `factory` має
+бути класом із методами `to_state()` і `from_state(state)`.
+
+Якщо задано `history` (див. `history.py`), `persist()` також дописує зміни
+сесії в журнал історії, а `rehydrate()` відновлює з нього сесію, якої немає в
+пам’яті (наприклад, після перезапуску процесу).
+"""
+
+import time
+from collections import OrderedDict
+
+
+class SessionStore:
+    """Обмежене сховище сесій з idle‑TTL та LRU‑витісненням.
+
+    Атрибути:
+        factory (callable): Створює нову порожню сесію.
+        ttl (float): Час простою, після якого сесія вважається застарілою, с.
+        max_size (int): Максимальна кількість одночасно збережених сесій.
+        created (int): Скільки сесій було створено.
+        expired (int): Скільки сесій видалено за TTL.
+        evicted (int): Скільки сесій витіснено через перевищення `max_size`.
+    """
+
+    def __init__(self, factory, ttl=3600.0, max_size=100_000, clock=time.monotonic, backend=None, namespace=None,
+                 history=None):
+        """Ініціалізує сховище.
+
+        Args:
+            factory (callable): Фабрика порожньої сесії (наприклад, `Dialog`).
+            ttl (float): Idle‑TTL сесії, секунди.
+            max_size (int): Ліміт кількості сесій.
+            clock (callable): Джерело монотонного часу (для тестів).
+            backend (StateBackend | None): Спільне сховище стану.
+            namespace (str | None): Простір імен сесій у `backend` і потік у `history`.
+            history (HistoryLog | None): Журнал довговічної історії.
+        """
+        self.factory = factory
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._items = OrderedDict()
+        self.backend = backend
+        self.namespace = namespace
+        self.history = history
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def get(self, key):
+        """Повертає сесію для ключа, створюючи її за потреби.
+
+        Args:
+            key: Ідентифікатор чату.
+
+        Returns:
+            Об’єкт сесії, позначений як щойно використаний.
+        """
+        now = self._clock()
+        self._expire(now)
+        item = self._items.get(key)
+        if item is None:
+            item = self.factory()
+            self.created += 1
+            self._items[key] = item
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._items.move_to_end(key)
+        item.touched = now
+        return item
+
+    def peek(self, key):
+        """Повертає сесію без оновлення часу звернення або `None`."""
+        return self._items.get(key)
+
+    def pop(self, key):
+        """Видаляє сесію та повертає її (або `None`, якщо її не було)."""
+        if self.backend is not None:
+            self.backend.delete(self.namespace, key)
+        return self._items.pop(key, None)
+
+    async def refresh(self, key) -> None:
+        """Замінює сесію в пам’яті актуальною версією з `backend`.
+
+        Якщо бекенд не має збереженої сесії (або її вік перевищує `ttl`),
+        лишається те, що є в пам’яті. Підтягнута версія позначається в
+        `history` як уже записана, тож `persist()` допише лише нові зміни.
+        """
+        if self.backend is None:
+            return
+        state = await self.backend.load(self.namespace, key, max_age=self.ttl)
+        if state is None:
+            return
+        item = self._install(key, self.factory.from_state(state))
+        if self.history is not None:
+            # Версія зі сховища вже записана в журнал тим, хто її зберіг
+            self.history.remember(key, self.namespace, item)
+
+    async def rehydrate(self, key) -> None:
+        """Відновлює з `history` сесію, якої немає в пам’яті.
+
+        Читання журналу виконується у фоновому потоці; якщо сесія вже є в
+        пам’яті, журнал не читається зовсім.
+        """
+        if self.history is None or key in self._items:
+            return
+        state = await self.history.load(key, self.namespace, max_age=self.ttl)
+        if state is None or key in self._items:
+            return
+        item = self._install(key, self.factory.from_state(state))
+        self.history.remember(key, self.namespace, item)
+
+    def _install(self, key, item):
+        item.touched = self._clock()
+        self._items[key] = item
+        self._items.move_to_end(key)
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evicted += 1
+        return item
+
+    def persist(self, key) -> None:
+        """Зберігає сесію з пам’яті в `backend` і `history` (відкладений запис)."""
+        item = self._items.get(key)
+        if item is None:
+            return
+        if self.backend is not None:
+            self.backend.save(self.namespace, key, item.to_state())
+        if self.history is not None:
+            self.history.track(key, self.namespace, item)
+
+    def _expire(self, now) -> None:
+        items = self._items
+        while items:
+            key, item = next(iter(items.items()))
+            if now - item.touched < self.ttl:
+                break
+            del items[key]
+            self.expired += 1
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> dict:
+        """Повертає розмір сховища та лічильники створення/витіснення."""
+        return {
+            "size": len(self._items),
+            "max_size": self.max_size,
+            "created": self.created,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
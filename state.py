@@ -0,0 +1,316 @@
+"""Сховища стану, спільного для кількох процесів‑воркерів.
+
+Сесії чатів (`Dialog`) і розмови з моделлю (`Conversation`) живуть у пам’яті
+процесу, тож `uvicorn server:app --workers N` дав би кожному воркеру власну
+версію того самого користувача. `StateBackend` — інтерфейс, через який
+`SessionStore` зберігає й підтягує стан між апдейтами:
+
+- `MemoryBackend` — стан лише в пам’яті процесу (поведінка за замовчуванням,
+  один воркер);
+- `SQLiteBackend` — спільний SQLite‑файл у режимі WAL для всіх воркерів на
+  одній машині. Записи буферизуються і пишуться фоновим потоком пакетами
+  (write‑behind), тож збереження стану не додає дискових операцій до
+  відповіді користувачу.
+
+Крім того, бекенд надає блокування за ключем (`lock()`): апдейти одного чату,
+що потрапили в різні воркери, обробляються по черзі. У `SQLiteBackend`
+блокування знімається в тій самій транзакції, що записує відкладені зміни,
+тож наступний воркер гарантовано прочитає вже збережений стан. Читання,
+захоплення й зняття блокування виконуються у фоновому потоці
+(`asyncio.to_thread`), тож конкуренція за SQLite‑файл не зупиняє цикл подій.
+Поки блокування утримується, його термін дії періодично подовжується, а
+блокування воркера, що впав, звільняється через `lock_ttl` секунд.
+
+Через бекенд проходять лише сесії й розмови. Бюджети токенів
+(`fair.FairScheduler`), скасування застарілих генерацій
+(`generations.GenerationTracker`) і ліміти Bot API (`ratelimit.SendScheduler`)
+лишаються в пам’яті кожного воркера.
+
+Використання (псевдокод):
+
+    backend = SQLiteBackend(".cache/state.sqlite3")
+    sessions = SessionStore(Dialog, backend=backend, namespace="sessions")
+
+    async with backend.lock("chat", chat_id):
+        await sessions.refresh(chat_id)
+        ...
+        sessions.persist(chat_id)
+"""
+
+import abc
+import asyncio
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class StateBackend(abc.ABC):
+    """Інтерфейс сховища стану: JSON‑значення за парою (простір імен, ключ)."""
+
+    @abc.abstractmethod
+    async def load(self, namespace, key, max_age=None):
+        """Повертає збережене значення або `None`.
+
+        Args:
+            namespace (str): Простір імен (`sessions`, `conversations`, …).
+            key: Ключ (зазвичай ідентифікатор чату).
+            max_age (float | None): Ігнорувати значення, збережені раніше
+                ніж `max_age` секунд тому.
+        """
+
+    @abc.abstractmethod
+    def save(self, namespace, key, value) -> None:
+        """Зберігає JSON‑серіалізоване значення."""
+
+    @abc.abstractmethod
+    def delete(self, namespace, key) -> None:
+        """Видаляє значення."""
+
+    @abc.abstractmethod
+    def lock(self, namespace, key):
+        """Повертає асинхронний контекстний менеджер блокування ключа."""
+
+    def close(self) -> None:
+        """Дописує відкладені зміни та звільняє ресурси."""
+
+    def stats(self) -> dict:
+        """Повертає лічильники сховища."""
+        return {}
+
+
+class MemoryBackend(StateBackend):
+    """Стан у пам’яті процесу.
+
+    Об’єкти сесій і так живуть у `SessionStore`, тому цей бекенд нічого не
+    копіює: `load()` завжди повертає `None`, а `save()` нічого не робить.
+    Блокування — звичайні `asyncio.Lock` за ключем.
+    """
+
+    def __init__(self):
+        self._locks = {}
+
+    async def load(self, namespace, key, max_age=None):
+        return None
+
+    def save(self, namespace, key, value) -> None:
+        pass
+
+    def delete(self, namespace, key) -> None:
+        pass
+
+    @contextlib.asynccontextmanager
+    async def lock(self, namespace, key):
+        name = (namespace, key)
+        entry = self._locks.get(name)
+        if entry is None:
+            entry = self._locks[name] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[name]
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "locks": len(self._locks)}
+
+
+class SQLiteBackend(StateBackend):
+    """Спільний стан у SQLite (WAL) із пакетним відкладеним записом.
+
+    Атрибути:
+        path (str): Шлях до файлу бази.
+        flush_interval (float): Як часто фоновий потік записує зміни, секунди.
+        retention (float): Скільки секунд зберігати значення без оновлень.
+        lock_ttl (float): Через скільки секунд без подовження блокування
+            вважається покинутим (наприклад, після падіння воркера).
+        flushes, written (int): Скільки пакетів і значень записано.
+    """
+
+    def __init__(self, path, flush_interval=0.05, retention=86400.0, lock_ttl=15.0, clock=time.time):
+        """Відкриває базу та запускає фоновий потік запису.
+
+        Args:
+            path (str): Шлях до SQLite‑файлу.
+            flush_interval (float): Період пакетного запису, секунди.
+            retention (float): Термін зберігання неоновлюваних значень, секунди.
+            lock_ttl (float): Термін дії блокування, секунди; утримуване
+                блокування подовжується кожні `lock_ttl / 3` секунд.
+            clock (callable): Джерело часу.
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.retention = retention
+        self.lock_ttl = lock_ttl
+        self._clock = clock
+        self._pending = {}
+        self._mutex = threading.Lock()
+        # Упорядковує пакети: старіший пакет не може перезаписати новіший
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._stopped = False
+        self.flushes = 0
+        self.written = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = self._connect()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS state (namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "updated REAL NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+        db.execute("CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+        db.close()
+        self._thread = threading.Thread(target=self._run, name="state-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _db(self):
+        """З’єднання поточного потоку пулу `asyncio.to_thread`."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = self._connect()
+        return db
+
+    async def load(self, namespace, key, max_age=None):
+        name = (namespace, str(key))
+        with self._mutex:
+            if name in self._pending:
+                value = self._pending[name]
+                return None if value is None else json.loads(value)
+        row = await asyncio.to_thread(self._read, name)
+        if row is None or (max_age is not None and row[1] < self._clock() - max_age):
+            return None
+        return json.loads(row[0])
+
+    def _read(self, name):
+        return self._db().execute("SELECT value, updated FROM state WHERE namespace = ? AND key = ?", name).fetchone()
+
+    def save(self, namespace, key, value) -> None:
+        encoded = json.dumps(value, ensure_ascii=False)
+        with self._mutex:
+            self._pending[(namespace, str(key))] = encoded
+        self._wake.set()
+
+    def delete(self, namespace, key) -> None:
+        with self._mutex:
+            self._pending[(namespace, str(key))] = None
+        self._wake.set()
+
+    @contextlib.asynccontextmanager
+    async def lock(self, namespace, key):
+        name = f"{namespace}:{key}"
+        owner = uuid.uuid4().hex
+        delay = 0.005
+        while not await asyncio.to_thread(self._acquire, name, owner):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        heartbeat = asyncio.create_task(self._heartbeat(name, owner))
+        try:
+            yield
+        finally:
+            heartbeat.cancel()
+            # Знімаємо блокування в одній транзакції зі станом, записаним під ним
+            try:
+                await asyncio.to_thread(self._release, name, owner)
+            except sqlite3.Error as e:
+                # Зміни лишилися в черзі фонового потоку, блокування звільниться через lock_ttl
+                print("⚠️ State lock release failed:", e)
+                self._wake.set()
+
+    def _acquire(self, name, owner) -> bool:
+        now = self._clock()
+        expires = now + self.lock_ttl
+        db = self._db()
+        cursor = db.execute("INSERT OR IGNORE INTO locks (name, owner, expires) VALUES (?, ?, ?)", (name, owner, expires))
+        if cursor.rowcount == 1:
+            return True
+        cursor = db.execute("UPDATE locks SET owner = ?, expires = ? WHERE name = ? AND expires < ?",
+                            (owner, expires, name, now))
+        return cursor.rowcount == 1
+
+    def _release(self, name, owner) -> None:
+        self._flush(self._db(), (name, owner))
+
+    async def _heartbeat(self, name, owner) -> None:
+        while True:
+            await asyncio.sleep(self.lock_ttl / 3)
+            try:
+                await asyncio.to_thread(self._extend, name, owner)
+            except sqlite3.Error as e:
+                print("⚠️ State lock heartbeat failed:", e)
+
+    def _extend(self, name, owner) -> None:
+        self._db().execute("UPDATE locks SET expires = ? WHERE name = ? AND owner = ?",
+                           (self._clock() + self.lock_ttl, name, owner))
+
+    def _run(self) -> None:
+        writer = self._connect()
+        while True:
+            self._wake.wait()
+            if not self._stopped:
+                time.sleep(self.flush_interval)  # збираємо пакет
+            self._wake.clear()
+            try:
+                self._flush(writer)
+            except sqlite3.Error as e:
+                print("⚠️ State flush failed:", e)
+                self._wake.set()
+                time.sleep(1.0)
+            if self._stopped:
+                writer.close()
+                return
+
+    def _flush(self, writer, release=None) -> None:
+        with self._write_lock:
+            self._write(writer, release)
+
+    def _write(self, writer, release) -> None:
+        with self._mutex:
+            pending, self._pending = self._pending, {}
+        releases = [release] if release is not None else []
+        if not pending and not releases:
+            return
+        now = self._clock()
+        upserts = [(ns, key, value, now) for (ns, key), value in pending.items() if value is not None]
+        deletes = [name for name, value in pending.items() if value is None]
+        writer.execute("BEGIN IMMEDIATE")
+        try:
+            writer.executemany("INSERT OR REPLACE INTO state (namespace, key, value, updated) VALUES (?, ?, ?, ?)",
+                               upserts)
+            writer.executemany("DELETE FROM state WHERE namespace = ? AND key = ?", deletes)
+            writer.executemany("DELETE FROM locks WHERE name = ? AND owner = ?", releases)
+            self.flushes += 1
+            if self.flushes % 1000 == 0:
+                writer.execute("DELETE FROM state WHERE updated < ?", (now - self.retention,))
+            writer.execute("COMMIT")
+        except BaseException:
+            writer.execute("ROLLBACK")
+            # Повертаємо пакет у чергу; новіші зміни тих самих ключів важливіші
+            with self._mutex:
+                for name, value in pending.items():
+                    self._pending.setdefault(name, value)
+            raise
+        self.written += len(upserts) + len(deletes)
+
+    def close(self) -> None:
+        self._stopped = True
+        self._wake.set()
+        self._thread.join(timeout=5.0)
+
+    def stats(self) -> dict:
+        with self._mutex:
+            pending = len(self._pending)
+        return {"backend": "sqlite", "pending": pending, "flushes": self.flushes, "written": self.written}
@@ -0,0 +1,64 @@
+import asyncio
+
+from dedup import UpdateDeduplicator
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_redelivery_is_skipped_while_in_flight_and_after_success():
+    async def scenario():
+        dedup = UpdateDeduplicator()
+        first = await dedup.begin(1)
+        during = await dedup.begin(1)
+        await dedup.finish(1, ok=True)
+        after = await dedup.begin(1)
+        return first, during, after, dedup
+
+    first, during, after, dedup = asyncio.run(scenario())
+    assert (first, during, after) == (True, False, False)
+    assert dedup.duplicates == 2
+
+
+def test_failed_update_can_be_retried():
+    async def scenario():
+        dedup = UpdateDeduplicator()
+        await dedup.begin(1)
+        await dedup.finish(1, ok=False)
+        return await dedup.begin(1)
+
+    assert asyncio.run(scenario())
+
+
+def test_update_is_forgotten_after_window():
+    clock = Clock()
+
+    async def scenario():
+        dedup = UpdateDeduplicator(window=60, clock=clock)
+        await dedup.begin(1)
+        await dedup.finish(1)
+        clock.now += 61
+        return await dedup.begin(1)
+
+    assert asyncio.run(scenario())
+
+
+def test_sqlite_claim_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "updates.sqlite3")
+
+    async def scenario():
+        workers = [UpdateDeduplicator(path=path), UpdateDeduplicator(path=path)]
+        claims = await asyncio.gather(*(worker.begin(5) for worker in workers))
+        winner = workers[claims.index(True)]
+        await winner.finish(5, ok=True)
+        late = UpdateDeduplicator(path=path)
+        return claims, await late.begin(5)
+
+    claims, late = asyncio.run(scenario())
+    assert sorted(claims) == [False, True]
+    assert not late
@@ -0,0 +1,96 @@
+import asyncio
+
+from dispatch import UpdateDispatcher, update_chat_id
+
+
+def message(update_id, chat_id):
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "text": str(update_id)}}
+
+
+def test_updates_of_one_chat_are_processed_in_order_and_chats_in_parallel():
+    async def scenario():
+        seen = []
+        running = set()
+        overlap = []
+
+        async def handler(update):
+            chat_id = update_chat_id(update)
+            overlap.append(chat_id in running)
+            running.add(chat_id)
+            await asyncio.sleep(0.01 if update["update_id"] % 2 else 0)
+            seen.append((chat_id, update["update_id"]))
+            running.discard(chat_id)
+
+        dispatcher = UpdateDispatcher(handler, workers=4)
+        dispatcher.start()
+        for update_id in range(1, 9):
+            assert await dispatcher.submit(message(update_id, update_id % 2))
+        drained = await dispatcher.drain(timeout=5)
+        return drained, seen, overlap, dispatcher
+
+    drained, seen, overlap, dispatcher = asyncio.run(scenario())
+    assert drained
+    assert [u for chat, u in seen if chat == 0] == [2, 4, 6, 8]
+    assert [u for chat, u in seen if chat == 1] == [1, 3, 5, 7]
+    assert not any(overlap)  # один чат ніколи не обробляється двома воркерами одночасно
+    assert dispatcher.processed == 8 and dispatcher.pending == 0
+
+
+def test_overload_rejects_or_drops_after_enqueue_timeout():
+    async def scenario(policy):
+        release = asyncio.Event()
+
+        async def handler(update):
+            await release.wait()
+
+        dispatcher = UpdateDispatcher(handler, workers=1, max_pending=2, overload=policy, enqueue_timeout=0.01)
+        dispatcher.start()
+        results = [await dispatcher.submit(message(n, n)) for n in range(3)]
+        release.set()
+        await dispatcher.drain(timeout=5)
+        return results, dispatcher
+
+    results, dispatcher = asyncio.run(scenario("reject"))
+    assert results == [True, True, False]
+    assert (dispatcher.accepted, dispatcher.rejected, dispatcher.processed) == (2, 1, 2)
+
+    results, dispatcher = asyncio.run(scenario("drop"))
+    assert results == [True, True, True]
+    assert (dispatcher.accepted, dispatcher.dropped, dispatcher.processed) == (2, 1, 2)
+
+
+def test_submit_waits_for_space_before_overload_policy():
+    async def scenario():
+        async def handler(update):
+            await asyncio.sleep(0.01)
+
+        dispatcher = UpdateDispatcher(handler, workers=1, max_pending=1, enqueue_timeout=1.0)
+        dispatcher.start()
+        results = [await dispatcher.submit(message(n, 1)) for n in range(3)]
+        await dispatcher.drain(timeout=5)
+        return results, dispatcher
+
+    results, dispatcher = asyncio.run(scenario())
+    assert results == [True, True, True]
+    assert dispatcher.rejected == 0
+
+
+def test_handler_errors_do_not_stop_the_chat_queue():
+    async def scenario():
+        seen = []
+
+        async def handler(update):
+            seen.append(update["update_id"])
+            if update["update_id"] == 1:
+                raise RuntimeError("boom")
+
+        dispatcher = UpdateDispatcher(handler, workers=1)
+        dispatcher.start()
+        for update_id in (1, 2):
+            await dispatcher.submit(message(update_id, 7))
+        await dispatcher.drain(timeout=5)
+        return seen, dispatcher
+
+    seen, dispatcher = asyncio.run(scenario())
+    assert seen == [1, 2]
+    assert dispatcher.failed == 1
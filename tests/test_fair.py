@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from fair import FairScheduler, QuotaExceeded
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_queued_requests_are_granted_round_robin_between_chats():
+    async def scenario():
+        scheduler = FairScheduler(max_inflight=1)
+        order = []
+        gate = asyncio.Event()
+
+        async def request(owner, n):
+            async with scheduler.slot(owner):
+                order.append((owner, n))
+                await gate.wait()
+
+        # Чат 1 надсилає три запити поспіль, чат 2 — два, але трохи пізніше
+        tasks = [asyncio.create_task(request(1, n)) for n in range(3)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(request(2, n)) for n in range(2)]
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(*tasks)
+        return order, scheduler
+
+    order, scheduler = asyncio.run(scenario())
+    assert order == [(1, 0), (2, 0), (1, 1), (2, 1), (1, 2)]
+    assert scheduler.inflight == 0 and scheduler.queued == 0
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        scheduler = FairScheduler(max_inflight=1)
+        release = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot("a"):
+                await release.wait()
+
+        async def waiter():
+            async with scheduler.slot("b"):
+                pass
+
+        held = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+        assert scheduler.queued == 1
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        release.set()
+        await held
+
+        async with scheduler.slot("c"):
+            assert scheduler.inflight == 1
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.inflight == 0 and scheduler.queued == 0
+
+
+def test_token_budget_is_enforced_per_window():
+    clock = Clock()
+    scheduler = FairScheduler(token_budget=100, budget_window=60, clock=clock)
+    scheduler.check("a")
+    scheduler.charge("a", 100)
+    clock.now = 15
+    with pytest.raises(QuotaExceeded) as exc:
+        scheduler.check("a")
+    assert exc.value.retry_after == pytest.approx(45)
+    scheduler.check("b")  # бюджети чатів незалежні
+
+    clock.now = 60
+    scheduler.check("a")
+    assert scheduler.over_quota == 1
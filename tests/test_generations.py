@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from generations import GenerationTracker
+
+
+def test_newer_update_cancels_running_generation():
+    async def scenario():
+        tracker = GenerationTracker()
+        started, cleaned = asyncio.Event(), asyncio.Event()
+
+        async def generation():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            finally:
+                cleaned.set()
+
+        run = asyncio.create_task(tracker.run(1, 10, generation()))
+        await started.wait()
+        assert not tracker.supersede(1, 10)  # повторна доставка того самого апдейта
+        assert not tracker.supersede(1, 9)
+        assert tracker.supersede(1, 11)
+        result = await run
+        return result, cleaned.is_set(), tracker
+
+    result, cleaned, tracker = asyncio.run(scenario())
+    assert result is None and cleaned
+    assert tracker.stats() == {"running": 0, "started": 1, "superseded": 1}
+
+
+def test_new_generation_replaces_the_previous_one_in_the_same_chat():
+    async def scenario():
+        tracker = GenerationTracker()
+
+        async def generation(value, delay):
+            await asyncio.sleep(delay)
+            return value
+
+        old = asyncio.create_task(tracker.run(1, 1, generation("old", 10)))
+        await asyncio.sleep(0)
+        other_chat = asyncio.create_task(tracker.run(2, 2, generation("other", 0.01)))
+        new = await tracker.run(1, 3, generation("new", 0))
+        return await old, await other_chat, new
+
+    assert asyncio.run(scenario()) == (None, "other", "new")
+
+
+def test_cancelling_the_handler_itself_propagates():
+    async def scenario():
+        tracker = GenerationTracker()
+        run = asyncio.create_task(tracker.run(1, 1, asyncio.sleep(10)))
+        await asyncio.sleep(0)
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run
+        return tracker
+
+    assert asyncio.run(scenario()).stats()["running"] == 0
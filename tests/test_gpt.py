@@ -0,0 +1,205 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("telegram")
+
+from gpt import ChatGptService, ContextWindow, Conversation, ResponseCache, SingleFlight  # noqa: E402
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_concurrent_calls_share_one_request():
+    async def scenario():
+        flights = SingleFlight()
+        calls = []
+        gate = asyncio.Event()
+
+        async def request():
+            calls.append(1)
+            await gate.wait()
+            return "answer"
+
+        waiters = [asyncio.create_task(flights.call("k", request)) for _ in range(5)]
+        await asyncio.sleep(0)
+        gate.set()
+        return await asyncio.gather(*waiters), calls, flights
+
+    results, calls, flights = asyncio.run(scenario())
+    assert results == ["answer"] * 5 and calls == [1]
+    assert flights.stats() == {"inflight": 0, "leaders": 1, "coalesced": 4}
+
+
+def test_error_is_delivered_to_every_waiter():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def request():
+            await asyncio.sleep(0)
+            raise RuntimeError("upstream")
+
+        return await asyncio.gather(*(flights.call("k", request) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [type(e) for e in results] == [RuntimeError] * 3
+
+
+def test_cancelling_one_waiter_keeps_the_request_for_the_rest():
+    async def scenario():
+        flights = SingleFlight()
+        gate = asyncio.Event()
+        cancelled = []
+
+        async def request():
+            try:
+                await gate.wait()
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+            return "answer"
+
+        first = asyncio.create_task(flights.call("k", request))
+        second = asyncio.create_task(flights.call("k", request))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        gate.set()
+        return first.cancelled(), await second, cancelled
+
+    assert asyncio.run(scenario()) == (True, "answer", [])
+
+
+def test_request_is_cancelled_when_the_last_waiter_leaves():
+    async def scenario():
+        flights = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def request():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiter = asyncio.create_task(flights.call("k", request))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return flights.stats()["inflight"]
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_late_stream_joiner_receives_parts_already_generated():
+    async def scenario():
+        flights = SingleFlight()
+        gate = asyncio.Event()
+
+        async def parts():
+            yield "a"
+            yield "b"
+            await gate.wait()
+            yield "c"
+
+        async def read():
+            return [part async for part in flights.stream("k", parts)]
+
+        early = asyncio.create_task(read())
+        for _ in range(5):
+            await asyncio.sleep(0)
+        late = asyncio.create_task(read())
+        await asyncio.sleep(0)
+        gate.set()
+        return await early, await late, flights
+
+    early, late, flights = asyncio.run(scenario())
+    assert early == late == ["a", "b", "c"]
+    assert flights.stats()["leaders"] == 1
+
+
+def test_response_cache_expires_entries_but_serves_stale_on_request():
+    clock = Clock()
+
+    async def scenario():
+        cache = ResponseCache(ttl=60, clock=clock)
+        await cache.put("k", "answer")
+        fresh = await cache.get("k")
+        clock.now += 61
+        return fresh, await cache.get("k"), await cache.get("k", stale=True), cache
+
+    fresh, expired, stale, cache = asyncio.run(scenario())
+    assert (fresh, expired, stale) == ("answer", None, "answer")
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_response_cache_survives_restart(tmp_path):
+    path = str(tmp_path / "cache" / "responses.sqlite3")
+
+    async def scenario():
+        await ResponseCache(path=path).put("k", "answer")
+        restarted = ResponseCache(path=path)
+        return await restarted.get("k"), await restarted.get("other")
+
+    assert asyncio.run(scenario()) == ("answer", None)
+
+
+def test_response_cache_key_changes_with_prompt_text():
+    first = ResponseCache.key("gpt-4o", "talk", "prompt v1", "hi", 100, 0.7)
+    assert first == ResponseCache.key("gpt-4o", "talk", "prompt v1", "hi", 100, 0.7)
+    assert first != ResponseCache.key("gpt-4o", "talk", "prompt v2", "hi", 100, 0.7)
+
+
+def conversation(turns, size=300):
+    result = Conversation()
+    result.messages = [{"role": "system", "content": "prompt"}]
+    for n in range(turns):
+        role = "user" if n % 2 == 0 else "assistant"
+        result.messages.append({"role": role, "content": str(n) * size})
+    return result
+
+
+def test_context_window_keeps_recent_turns_within_budget():
+    window = ContextWindow(budget=400, keep_recent=4)
+    window.count = lambda text: len(text) // 3 + 1  # стабільна оцінка незалежно від tiktoken
+    small = conversation(2, size=30)
+    assert window.fold_count(small) == 0
+    assert window.build(small) == small.messages
+
+    large = conversation(10)
+    assert window.fold_count(large) == 6
+    request = window.build(large)
+    assert request == large.messages[:1] + large.messages[-3:]
+    assert window.count_messages(request) <= window.budget
+
+
+def test_service_folds_old_turns_into_summary():
+    async def scenario():
+        requests = []
+
+        async def create(**kwargs):
+            requests.append(kwargs["messages"])
+            message = SimpleNamespace(content="підсумок" if len(requests) == 1 else "відповідь")
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+        window = ContextWindow(budget=400, keep_recent=4)
+        window.count = lambda text: len(text) // 3 + 1
+        service = ChatGptService("token", context_window=window)
+        service.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        service.conversations.get(1).messages = conversation(10).messages
+        answer = await service.add_message("питання", chat_id=1)
+        return answer, requests, service.conversations.get(1)
+
+    answer, requests, state = asyncio.run(scenario())
+    assert answer == "відповідь" and len(requests) == 2
+    assert state.summary == "підсумок"
+    assert len(state.messages) == 1 + 4 + 1  # промпт, keep_recent (з новим питанням) і відповідь
+    assert any("Підсумок попередньої розмови: підсумок" in m["content"] for m in requests[1])
@@ -0,0 +1,113 @@
+import asyncio
+import sqlite3
+import time
+
+from history import HistoryLog
+from session import SessionStore
+from state import SQLiteBackend
+
+
+class Conversation:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def to_state(self):
+        return {"messages": self.messages}
+
+
+def restore(path, chat_id, stream):
+    log = HistoryLog(path, flush_interval=0)
+    try:
+        return asyncio.run(log.load(chat_id, stream))
+    finally:
+        log.close()
+
+
+def test_fold_in_place_is_logged_as_snapshot(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    log = HistoryLog(path, flush_interval=0)
+    conversation = Conversation([{"role": "system", "content": "s"}]
+                                + [{"role": "user", "content": f"m{i}"} for i in range(1, 7)])
+    log.track(1, "conversation", conversation)
+
+    messages = conversation.messages
+    messages.append({"role": "user", "content": "new"})
+    del messages[1:2]  # згортання однієї репліки, як у ChatGptService._fold_history
+    messages.append({"role": "assistant", "content": "answer"})
+    log.track(1, "conversation", conversation)
+    log.close()
+
+    assert restore(path, 1, "conversation")["messages"] == messages
+
+
+def test_appends_are_logged_incrementally(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    log = HistoryLog(path, flush_interval=0)
+    conversation = Conversation([{"role": "system", "content": "s"}])
+    log.track(1, "conversation", conversation)
+    conversation.messages.append({"role": "user", "content": "hi"})
+    log.track(1, "conversation", conversation)
+    log.close()
+
+    assert log.appended == 2
+    assert restore(path, 1, "conversation")["messages"] == conversation.messages
+
+
+def rows(path):
+    db = sqlite3.connect(path)
+    try:
+        return db.execute("SELECT op FROM history").fetchall()
+    finally:
+        db.close()
+
+
+def test_snapshot_prunes_older_records(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    log = HistoryLog(path, flush_interval=0)
+    conversation = Conversation([{"role": "system", "content": "s"}])
+    for turn in range(300):
+        conversation.messages.append({"role": "user", "content": f"q{turn}"})
+        conversation.messages.append({"role": "assistant", "content": f"a{turn}"})
+        if len(conversation.messages) > 9:
+            del conversation.messages[1:3]  # згортання найстарішого обміну
+        log.track(1, "conversation", conversation)
+        while log.stats()["queued"]:
+            time.sleep(0.001)
+    log.close()
+
+    assert len(rows(path)) <= 2
+    assert restore(path, 1, "conversation")["messages"] == conversation.messages
+
+
+class Session(Conversation):
+    touched = 0.0
+
+    def __init__(self, messages=None):
+        super().__init__(messages if messages is not None else [])
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state["messages"])
+
+
+def test_state_refresh_appends_instead_of_snapshots(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    log = HistoryLog(path, flush_interval=0)
+    backend = SQLiteBackend(str(tmp_path / "state.sqlite3"), flush_interval=0)
+    sessions = SessionStore(Session, backend=backend, namespace="conversation", history=log)
+
+    async def updates():
+        for turn in range(100):
+            async with backend.lock("chat", 1):
+                await sessions.refresh(1)  # кожен апдейт відтворює списки зі сховища стану
+                sessions.get(1).messages.append({"role": "user", "content": f"m{turn}"})
+                sessions.persist(1)
+
+    asyncio.run(updates())
+    backend.close()
+    log.close()
+
+    ops = [op for op, in rows(path)]
+    assert ops.count("snapshot") == 1
+    assert restore(path, 1, "conversation")["messages"] == [{"role": "user", "content": f"m{turn}"}
+                                                            for turn in range(100)]
@@ -0,0 +1,114 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from transport import CircuitBreaker, CircuitOpen, TransportPolicy
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_after_threshold_and_probes_once_when_half_open():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.opened == 1
+    assert not breaker.allow()
+
+    clock.now = 30
+    assert breaker.allow()  # пробна спроба
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # друга одночасна спроба не проходить
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.opened == 2
+
+    clock.now = 60
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+    assert breaker.rejected == 2
+
+
+def test_released_probe_lets_the_next_call_probe():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=1, clock=clock)
+    breaker.record_failure()
+    clock.now = 1
+    assert breaker.allow()
+    breaker.release()  # пробну спробу скасовано без вердикту
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+
+
+def test_open_breaker_fails_fast_without_calling_upstream():
+    calls = []
+
+    async def factory():
+        calls.append(1)
+
+    breaker = CircuitBreaker(failure_threshold=1)
+    breaker.record_failure()
+    policy = TransportPolicy(breaker=breaker)
+    with pytest.raises(CircuitOpen):
+        asyncio.run(policy.call(factory))
+    assert calls == []
+
+
+def test_retries_take_the_slot_per_attempt_and_feed_the_breaker():
+    openai = pytest.importorskip("openai")
+    httpx = pytest.importorskip("httpx")
+    request = httpx.Request("POST", "http://upstream/v1/chat/completions")
+    held = []
+    during_backoff = []
+    attempts = []
+
+    @contextlib.asynccontextmanager
+    async def slot():
+        held.append(1)
+        try:
+            yield
+        finally:
+            held.pop()
+
+    async def sleep(delay):
+        during_backoff.append(len(held))
+
+    async def factory():
+        attempts.append(len(held))
+        if len(attempts) < 3:
+            raise openai.APIConnectionError(request=request)
+        return "ok"
+
+    breaker = CircuitBreaker(failure_threshold=5)
+    policy = TransportPolicy(max_retries=2, breaker=breaker, sleep=sleep, jitter=lambda: 0.0)
+    assert asyncio.run(policy.call(factory, slot=slot)) == "ok"
+    assert attempts == [1, 1, 1]
+    assert during_backoff == [0, 0]
+    assert policy.retries == 2 and breaker.state == "closed" and breaker.failures == 0
+
+
+def test_client_errors_are_not_retried():
+    openai = pytest.importorskip("openai")
+    httpx = pytest.importorskip("httpx")
+    response = httpx.Response(400, request=httpx.Request("POST", "http://upstream/v1/chat/completions"))
+    attempts = []
+
+    async def factory():
+        attempts.append(1)
+        raise openai.BadRequestError("bad request", response=response, body=None)
+
+    breaker = CircuitBreaker(failure_threshold=1)
+    policy = TransportPolicy(max_retries=2, breaker=breaker)
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(policy.call(factory))
+    assert attempts == [1]
+    assert breaker.state == "closed"
@@ -0,0 +1,269 @@
+"""Трасування апдейтів по фазах і вибірковий профайлер.
+
+Коли відповідь повільна, треба бачити, куди пішов час: нормалізація апдейта,
+`Update.de_json`, завантаження ресурсів, очікування блокування чату, запит
+до моделі чи виклики Bot API. `Tracer.trace()` відкриває трасу апдейта, а
+`span(name)` у будь‑якому місці коду (util.py, gpt.py, ratelimit.py) додає до
+неї фазу. Траса передається через `contextvars`, тож доходить і в задачі,
+створені під час обробки (`GenerationTracker`, `SingleFlight`).
+
+Після обробки траса друкується одним JSON‑рядком: для частки `sample`
+апдейтів і для кожного апдейта, довшого за `slow_ms`. Кожен `profile_every`‑й
+апдейт додатково профілюється `cProfile`, а профіль зберігається в
+`profile_dir` (`python -m pstats <файл>`). cProfile охоплює весь потік, тож у
+профіль потрапляють і апдейти, що оброблялися паралельно.
+
+Налаштування змінюються без перезапуску й редеплою: `Tracer` перечитує JSON‑файл
+`config_path` (наприклад, `{"sample": 0.1, "profile_every": 100}`) не частіше
+ніж раз на `check_interval` секунд; `configure()` змінює їх напряму.
+
+Використання (псевдокод):
+
+    tracer = Tracer(sample=0.01, slow_ms=2000)
+    async with tracer.trace(update_id, chat_id):
+        with span("de_json"):
+            update = Update.de_json(...)
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import cProfile
+import itertools
+import json
+import os
+import random
+import time
+
+_current = contextvars.ContextVar("trace", default=None)
+
+_SETTINGS = ("sample", "slow_ms", "profile_every", "profile_dir")
+
+
+class _Trace:
+    __slots__ = ("update_id", "chat_id", "started", "spans")
+
+    def __init__(self, update_id, chat_id):
+        self.update_id = update_id
+        self.chat_id = chat_id
+        self.started = time.perf_counter()
+        self.spans = []
+
+
+@contextlib.contextmanager
+def span(name, **fields):
+    """Вимірює фазу поточної траси; поза трасою майже нічого не коштує.
+
+    Args:
+        name (str): Назва фази (`de_json`, `openai`, `telegram.sendMessage`).
+        **fields: Додаткові поля фази у JSON (наприклад, `mode="gpt"`).
+    """
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.append((name, started, time.perf_counter() - started, fields))
+
+
+def mark(name, started, **fields) -> None:
+    """Додає до поточної траси фазу від `started` (`time.perf_counter()`) до зараз.
+
+    Для фаз, які незручно обгорнути в `with span(...)`, — наприклад, очікування
+    входу в `async with`.
+    """
+    trace = _current.get()
+    if trace is not None:
+        trace.spans.append((name, started, time.perf_counter() - started, fields))
+
+
+class Tracer:
+    """Траси апдейтів і вибірковий профайлер із налаштуванням під час роботи.
+
+    Атрибути:
+        sample (float): Частка апдейтів, траси яких друкуються (0 — жодного).
+        slow_ms (float | None): Друкувати трасу кожного апдейта, довшого за
+            стільки мілісекунд; `None` — не друкувати повільні окремо.
+        profile_every (int): Профілювати кожен N‑й апдейт (0 — вимкнено).
+        profile_dir (str): Каталог для файлів профілів.
+        config_path (str | None): JSON‑файл із налаштуваннями.
+        traced, emitted, profiled (int): Лічильники.
+    """
+
+    def __init__(self, sample=0.0, slow_ms=None, profile_every=0, profile_dir=".cache/profiles",
+                 config_path=None, check_interval=5.0, clock=time.monotonic):
+        """Ініціалізує трасувальник.
+
+        Args:
+            sample (float): Частка апдейтів для друку трас.
+            slow_ms (float | None): Поріг повільного апдейта, мс.
+            profile_every (int): Період профілювання, апдейтів.
+            profile_dir (str): Каталог профілів.
+            config_path (str | None): JSON‑файл налаштувань, що перечитується.
+            check_interval (float): Період перевірки `mtime` файлу, секунди.
+            clock (callable): Джерело монотонного часу (для тестів).
+        """
+        self.sample = sample
+        self.slow_ms = slow_ms
+        self.profile_every = profile_every
+        self.profile_dir = profile_dir
+        self.config_path = config_path
+        self.check_interval = check_interval
+        self._clock = clock
+        self._checked_at = None
+        self._mtime = None
+        self._counter = itertools.count(1)
+        self._profiling = False
+        self.traced = 0
+        self.emitted = 0
+        self.profiled = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.sample or self.slow_ms is not None or self.profile_every)
+
+    def configure(self, **settings) -> None:
+        """Змінює налаштування (`sample`, `slow_ms`, `profile_every`, `profile_dir`).
+
+        Значення приводяться до потрібних типів (`"0.1"` стає `0.1`); якщо хоч
+        одне некоректне, не змінюється жодне.
+
+        Raises:
+            ValueError: Якщо налаштування невідоме або має некоректне значення.
+        """
+        unknown = set(settings) - set(_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown tracing settings: {', '.join(sorted(unknown))}")
+        values = {}
+        try:
+            if "sample" in settings:
+                values["sample"] = float(settings["sample"])
+                if not 0.0 <= values["sample"] <= 1.0:
+                    raise ValueError("sample must be between 0 and 1")
+            if "slow_ms" in settings:
+                values["slow_ms"] = None if settings["slow_ms"] is None else float(settings["slow_ms"])
+            if "profile_every" in settings:
+                values["profile_every"] = int(settings["profile_every"])
+                if values["profile_every"] < 0:
+                    raise ValueError("profile_every must not be negative")
+            if "profile_dir" in settings:
+                if not isinstance(settings["profile_dir"], str) or not settings["profile_dir"]:
+                    raise ValueError("profile_dir must be a non-empty string")
+                values["profile_dir"] = settings["profile_dir"]
+        except TypeError as e:
+            raise ValueError(f"Invalid tracing setting: {e}") from e
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    def _reload(self) -> None:
+        now = self._clock()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        mtime = None
+        try:
+            mtime = os.stat(self.config_path).st_mtime_ns
+            if mtime == self._mtime:
+                return
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                settings = json.load(f)
+            self.configure(**settings)
+            self._mtime = mtime
+        except FileNotFoundError:
+            self._mtime = None
+        except (OSError, ValueError, TypeError) as e:
+            self._mtime = mtime
+            print("⚠️ Tracing settings are not reloaded:", e)
+
+    @contextlib.asynccontextmanager
+    async def trace(self, update_id=None, chat_id=None):
+        """Трасує обробку одного апдейта в блоці `async with`.
+
+        Args:
+            update_id: `update_id` апдейта (для JSON‑рядка і назви профілю).
+            chat_id: Чат апдейта.
+        """
+        trace = profiler = None
+        try:
+            if self.config_path:
+                self._reload()
+            if self.enabled:
+                trace = _Trace(update_id, chat_id)
+                if self.profile_every and not self._profiling and next(self._counter) % self.profile_every == 0:
+                    profile = cProfile.Profile()
+                    profile.enable()
+                    profiler, self._profiling = profile, True
+                self.traced += 1
+        except Exception as e:  # трасування не повинно ламати обробку апдейта
+            print("⚠️ Tracing failed:", repr(e))
+        if trace is None:
+            yield
+            return
+        token = _current.set(trace)
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            _current.reset(token)
+            try:
+                self._finish(trace, profiler, update_id, error)
+            except Exception as e:
+                print("⚠️ Tracing failed:", repr(e))
+
+    def _finish(self, trace, profiler, update_id, error) -> None:
+        duration = time.perf_counter() - trace.started
+        if profiler is not None:
+            profiler.disable()
+            self._profiling = False
+            self._dump(profiler, update_id)
+        slow = self.slow_ms is not None and duration * 1000 >= self.slow_ms
+        if slow or (self.sample and random.random() < self.sample):
+            self._emit(trace, duration, error, slow)
+
+    def _emit(self, trace, duration, error, slow) -> None:
+        self.emitted += 1
+        record = {
+            "trace": "update",
+            "update_id": trace.update_id,
+            "chat_id": trace.chat_id,
+            "ms": round(duration * 1000, 2),
+            "slow": slow,
+            "error": error,
+            "spans": [
+                dict(fields, name=name, start_ms=round((started - trace.started) * 1000, 2), ms=round(elapsed * 1000, 2))
+                for name, started, elapsed, fields in sorted(trace.spans, key=lambda s: s[1])
+            ],
+        }
+        print(json.dumps(record, ensure_ascii=False, default=str))
+
+    def _dump(self, profiler, update_id) -> None:
+        path = os.path.join(self.profile_dir, f"{int(time.time() * 1000)}-{update_id}.prof")
+
+        def dump():
+            try:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                profiler.dump_stats(path)
+            except OSError as e:
+                print("⚠️ Profile is not saved:", e)
+                return
+            self.profiled += 1
+
+        # Запис файлу — у фоновому потоці, відповідь на нього не чекає
+        asyncio.get_running_loop().run_in_executor(None, dump)
+
+    def stats(self) -> dict:
+        """Повертає поточні налаштування й лічильники."""
+        return {
+            "sample": self.sample,
+            "slow_ms": self.slow_ms,
+            "profile_every": self.profile_every,
+            "traced": self.traced,
+            "emitted": self.emitted,
+            "profiled": self.profiled,
+        }
@@ -0,0 +1,313 @@
+"""Політика надійних викликів OpenAI‑сумісного API.
+
+Проксі‑ендпоінт моделі періодично відповідає 429, 5xx або не встигає
+відповісти. Без політики кожна така помилка одразу долітає до хендлера, і
+користувач лишається із заглушкою. `TransportPolicy` обгортає кожен виклик:
+
+- повторює тимчасові помилки (429, 5xx, таймаут, розрив з’єднання) з
+  експоненційною затримкою та «повним джитером»; заголовок `Retry-After`
+  має пріоритет над розрахованою затримкою;
+- за бажанням «хеджує» запит: якщо відповідь не прийшла за p95 затримки
+  останніх запитів, паралельно запускається друга спроба, і береться та,
+  що завершиться першою (друга скасовується);
+- рахує послідовні невдачі в `CircuitBreaker`: коли апстрім лежить, виклики
+  одразу завершуються `CircuitOpen`, замість того щоб чекати таймаутів, а
+  через `reset_timeout` одна пробна спроба перевіряє, чи він піднявся.
+
+Помилки клієнта (400, 401, 404 …) не повторюються й не впливають на
+запобіжник.
+
+Пакет `openai` важкий для імпорту, тому модуль імпортує його лише тоді, коли
+треба розпізнати помилку (`is_retryable()`, `api_errors()`): апдейт, що не
+звертається до моделі, після холодного старту його не завантажує.
+
+Використання (псевдокод):
+
+    policy = TransportPolicy(max_retries=2, hedge=True, breaker=CircuitBreaker())
+    completion = await policy.call(lambda: client.chat.completions.create(...))
+"""
+
+import asyncio
+import contextlib
+import random
+import time
+from collections import deque
+
+
+class CircuitOpen(Exception):
+    """Запобіжник розімкнено: апстрім вважається недоступним."""
+
+
+def api_errors() -> tuple:
+    """Повертає типи помилок звернення до моделі: `openai.OpenAIError` і `CircuitOpen`.
+
+    Для `except api_errors():` — вираз обчислюється лише тоді, коли виняток
+    уже виник, тож `openai` не імпортується заздалегідь.
+    """
+    import openai
+    return openai.OpenAIError, CircuitOpen
+
+
+def is_retryable(error) -> bool:
+    """Чи є помилка SDK `openai` тимчасовою (варто повторити запит)."""
+    import openai
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 408 or error.status_code >= 500
+    return False
+
+
+def retry_after(error):
+    """Повертає затримку із заголовка `Retry-After` (секунди) або `None`."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None  # HTTP‑дата замість секунд: покладаємося на backoff
+
+
+class CircuitBreaker:
+    """Запобіжник за кількістю послідовних невдач.
+
+    Стани: `closed` (виклики проходять), `open` (виклики відхиляються до
+    спливання `reset_timeout`) і `half_open` (проходить одна пробна спроба).
+
+    Атрибути:
+        failure_threshold (int): Скільки невдач поспіль розмикають запобіжник.
+        reset_timeout (float): Скільки секунд запобіжник лишається розімкненим.
+        state (str): Поточний стан.
+        failures (int): Кількість невдач поспіль.
+        opened (int): Скільки разів запобіжник розмикався.
+        rejected (int): Скільки викликів відхилено без звернення до апстріму.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        """Ініціалізує запобіжник у стані `closed`.
+
+        Args:
+            failure_threshold (int): Поріг невдач поспіль.
+            reset_timeout (float): Тривалість розімкненого стану, секунди.
+            clock (callable): Джерело монотонного часу (для тестів).
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._opened_at = 0.0
+        self._probing = False
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """Чи можна зараз звертатися до апстріму."""
+        if self.state == "open":
+            if self._clock() - self._opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                self.rejected += 1
+                return False
+            self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        """Фіксує успішну відповідь апстріму."""
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        """Фіксує тимчасову помилку апстріму."""
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opened += 1
+            self.state = "open"
+            self._opened_at = self._clock()
+
+    def release(self) -> None:
+        """Звільняє пробну спробу, що завершилась без вердикту (скасування)."""
+        self._probing = False
+
+    def stats(self) -> dict:
+        """Повертає стан і лічильники запобіжника."""
+        return {"state": self.state, "failures": self.failures, "opened": self.opened, "rejected": self.rejected}
+
+
+class LatencyTracker:
+    """Ковзне вікно тривалостей успішних запитів для оцінки p95."""
+
+    __slots__ = ("samples", "min_samples")
+
+    def __init__(self, window=200, min_samples=20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def add(self, seconds) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, q):
+        """Повертає квантиль `q` або `None`, поки вибірка замала."""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class TransportPolicy:
+    """Повтори, хеджування та запобіжник для викликів апстріму.
+
+    Атрибути:
+        max_retries (int): Скільки разів повторювати тимчасову помилку.
+        backoff_base (float): Базова затримка першого повтору, секунди.
+        backoff_max (float): Верхня межа затримки, секунди.
+        hedge (bool): Чи запускати хедж‑спробу для повільних запитів.
+        hedge_min_delay (float): Мінімальна затримка перед хедж‑спробою, с.
+        breaker (CircuitBreaker | None): Запобіжник.
+        latency (LatencyTracker): Тривалості успішних спроб.
+        attempts, retries, hedged, hedge_wins, failed (int): Лічильники.
+    """
+
+    def __init__(self, max_retries=2, backoff_base=0.5, backoff_max=8.0, hedge=False, hedge_min_delay=1.0,
+                 breaker=None, clock=time.monotonic, sleep=asyncio.sleep, jitter=random.random):
+        """Ініціалізує політику.
+
+        Args:
+            max_retries (int): Ліміт повторів одного виклику.
+            backoff_base (float): Базова затримка, секунди (подвоюється з
+                кожною спробою).
+            backoff_max (float): Максимальна затримка, секунди.
+            hedge (bool): Увімкнути хедж‑спроби.
+            hedge_min_delay (float): Хедж‑спроба не запускається раніше, ніж
+                через стільки секунд, навіть якщо p95 менший.
+            breaker (CircuitBreaker | None): Запобіжник; `None` — без нього.
+            clock (callable): Джерело монотонного часу.
+            sleep (callable): Корутина очікування (для тестів).
+            jitter (callable): Джерело випадкових чисел у `[0, 1)`.
+        """
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker
+        self.latency = LatencyTracker()
+        self._clock = clock
+        self._sleep = sleep
+        self._jitter = jitter
+        self.attempts = 0
+        self.retries = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failed = 0
+
+    async def call(self, factory, hedge=True, slot=None):
+        """Виконує виклик апстріму за політикою.
+
+        Args:
+            factory (callable): Функція без аргументів, що повертає корутину
+                виклику (викликається заново для кожної спроби).
+            hedge (bool): Дозволити хедж‑спробу для цього виклику (вимикається
+                для потокових відповідей, які не можна безпечно дублювати).
+            slot (callable | None): Повертає асинхронний контекстний менеджер
+                місця в черзі (`FairScheduler.slot`). Місце займає кожна спроба
+                окремо, тож паузи між повторами його не утримують.
+
+        Returns:
+            Результат корутини.
+
+        Raises:
+            CircuitOpen: Якщо запобіжник розімкнено.
+            openai.OpenAIError: Остання помилка, якщо повтори вичерпано або
+                помилка не є тимчасовою.
+        """
+        attempt = 0
+        while True:
+            breaker = self.breaker
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpen("upstream is unavailable")
+            try:
+                if hedge and self.hedge:
+                    result = await self._hedged(factory, slot)
+                else:
+                    result = await self._attempt(factory, slot)
+            except Exception as e:
+                if not is_retryable(e):
+                    if breaker is not None:
+                        breaker.release()
+                    raise
+                if breaker is not None:
+                    breaker.record_failure()
+                if attempt >= self.max_retries:
+                    self.failed += 1
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = self._jitter() * min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                attempt += 1
+                self.retries += 1
+                await self._sleep(delay)
+                continue
+            except BaseException:
+                if breaker is not None:
+                    breaker.release()
+                raise
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+    async def _attempt(self, factory, slot=None):
+        async with slot() if slot is not None else contextlib.nullcontext():
+            self.attempts += 1
+            started = self._clock()
+            result = await factory()
+            self.latency.add(self._clock() - started)
+            return result
+
+    async def _hedged(self, factory, slot=None):
+        p95 = self.latency.percentile(0.95)
+        if p95 is None:
+            return await self._attempt(factory, slot)
+        first = asyncio.ensure_future(self._attempt(factory, slot))
+        second = None
+        try:
+            done, _ = await asyncio.wait({first}, timeout=max(p95, self.hedge_min_delay))
+            if done:
+                return first.result()
+            self.hedged += 1
+            second = asyncio.ensure_future(self._attempt(factory, slot))
+            pending = {first, second}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in (first, second):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        """Повертає лічильники спроб і стан запобіжника."""
+        return {
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "failed": self.failed,
+            "p95": self.latency.percentile(0.95),
+            "breaker": self.breaker.stats() if self.breaker is not None else None,
+        }
@@ -1,14 +1,25 @@
 """Утилітарні функції для Telegram‑бота.
 
 Надає допоміжні обгортки для відправлення повідомлень/фото/кнопок, керування
-меню команд, а також завантаження текстових ресурсів і простий клас стану
-діалогу.
+меню команд (усі виклики Bot API проходять через `send_scheduler` з
+обмеженням швидкості), а також завантаження текстових ресурсів і клас стану
+діалогу одного чату.
 
-У модулі використано стиль докстрінгів Google. Логіка коду не змінена — додано
-лише документацію.
+У модулі використано стиль докстрінгів Google.
 """
 
+import asyncio
+import contextlib
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
 import unicodedata
+from collections import OrderedDict
 from telegram import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
@@ -20,8 +31,12 @@ from telegram import (
 )
 from telegram import Update
 from telegram.constants import ParseMode
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
+from ratelimit import SendScheduler
+from tracing import span
+
 
 def dialog_user_info_to_str(user) -> str:
     """Конвертує словник даних користувача у форматований рядок.
@@ -49,7 +64,28 @@ def dialog_user_info_to_str(user) -> str:
     return result
 
 
+_SURROGATES = re.compile("[\ud800-\udfff]")
+
+_UPDATE_MESSAGE_KEYS = ("message", "edited_message", "channel_post", "edited_channel_post")
+
+
 def normalize_text(value):
+    """Приводить значення до NFKC‑нормалізованого рядка, безпечного для UTF‑8.
+
+    Нормалізація виконується один раз на межі системи: для вхідних апдейтів
+    (`normalize_update()`), текстових ресурсів (`ResourceRegistry`) і
+    відповідей моделі. Далі текст передається без повторної обробки.
+
+    ASCII‑рядки та рядки, що вже є NFKC, повертаються без копіювання; заміна
+    проблемних символів виконується лише тоді, коли в рядку є одиночні
+    сурогати.
+
+    Args:
+        value: Рядок, байти, `None` або довільне значення.
+
+    Returns:
+        str: Нормалізований рядок (`""` для `None`).
+    """
     if value is None:
         return ""
 
@@ -61,15 +97,62 @@ def normalize_text(value):
     if not isinstance(value, str):
         value = str(value)
 
+    if value.isascii():
+        return value
+
     # Нормалізація Unicode
-    value = unicodedata.normalize("NFKC", value)
+    if not unicodedata.is_normalized("NFKC", value):
+        value = unicodedata.normalize("NFKC", value)
 
-    # Повторна заміна проблемних байтів
-    value = value.encode("utf-8", errors="replace").decode("utf-8", errors="replace")
+    # Заміна одиночних сурогатів, які неможливо закодувати в UTF-8
+    if _SURROGATES.search(value):
+        value = value.encode("utf-8", errors="replace").decode("utf-8", errors="replace")
 
     return value
 
 
+def _normalize_fields(obj: dict, fields) -> None:
+    for field in fields:
+        value = obj.get(field)
+        if isinstance(value, str):
+            obj[field] = normalize_text(value)
+
+
+def normalize_update(update_json: dict) -> dict:
+    """Нормалізує на місці лише ті поля апдейту, що містять текст користувача.
+
+    Обробляються `text` і `caption` повідомлень, `data` callback‑запитів і
+    `query` inline‑запитів; службові поля (id, дати, імена, entities)
+    залишаються як є.
+
+    Args:
+        update_json (dict): Сирий JSON апдейта Telegram.
+
+    Returns:
+        dict: Той самий словник `update_json`.
+    """
+    for key in _UPDATE_MESSAGE_KEYS:
+        message = update_json.get(key)
+        if message:
+            _normalize_fields(message, ("text", "caption"))
+    query = update_json.get("callback_query")
+    if query:
+        _normalize_fields(query, ("data",))
+    inline_query = update_json.get("inline_query")
+    if inline_query:
+        _normalize_fields(inline_query, ("query",))
+    return update_json
+
+
+# Усі виклики Bot API з цього модуля проходять через спільний планувальник
+send_scheduler = SendScheduler(
+    global_rate=float(os.getenv("TELEGRAM_GLOBAL_RATE", "30")),
+    chat_rate=float(os.getenv("TELEGRAM_CHAT_RATE", "1")),
+    chat_burst=int(os.getenv("TELEGRAM_CHAT_BURST", "3")),
+    max_retries=int(os.getenv("TELEGRAM_MAX_RETRIES", "3")),
+)
+
+
 async def send_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> Message:
     """Надсилає в чат текст у режимі Markdown, із перевіркою підкреслень.
 
@@ -77,8 +160,8 @@ async def send_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: st
     користувачу повертається службове повідомлення з рекомендацією скористатися
     `send_html()`.
 
-    Перед відправкою текст проходить безпечну нормалізацію UTF-8 з `errors="replace"`, 
-    щоб уникнути помилок при наявності проблемних байтів.
+    Текст очікується вже нормалізованим (див. `normalize_text()`): ресурси,
+    відповіді моделі та введення користувача нормалізуються на межі системи.
 
     Args:
         update (telegram.Update): Апдейт з контекстом чату/повідомлення.
@@ -88,23 +171,20 @@ async def send_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: st
     Returns:
         telegram.Message: Відправлене повідомлення або службова відповідь.
     """
-    text = normalize_text(text)
     if text.count('_') % 2 != 0:
         message = f"Рядок '{text}' є невалідним з погляду markdown. Скористайтеся методом send_html()"
         print(message)
-        return await update.message.reply_text(message)
+        return await send_scheduler.call(update.effective_chat.id, lambda: update.message.reply_text(message))
 
-    # Повторна заміна проблемних байтів
-    text = str(text)
-    text = text.encode("utf-8", errors="replace").decode("utf-8", errors="replace")
-    return await context.bot.send_message(chat_id=update.effective_chat.id, text=text, parse_mode=ParseMode.MARKDOWN)
+    chat_id = update.effective_chat.id
+    return await send_scheduler.call(chat_id, lambda: context.bot.send_message(
+        chat_id=chat_id, text=text, parse_mode=ParseMode.MARKDOWN))
 
 
 async def send_html(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> Message:
     """Надсилає в чат HTML‑повідомлення.
 
-    Текст попередньо проходить безпечну нормалізацію UTF-8 з `errors="replace"` 
-    для стабільної роботи з будь-якими символами.
+    Текст очікується вже нормалізованим (див. `normalize_text()`).
 
     Args:
         update (telegram.Update): Апдейт з контекстом чату/повідомлення.
@@ -114,11 +194,9 @@ async def send_html(update: Update, context: ContextTypes.DEFAULT_TYPE, text: st
     Returns:
         telegram.Message: Відправлене повідомлення.
     """
-    text = normalize_text(text)
-    # Повторна заміна проблемних байтів
-    text = str(text)
-    text = text.encode("utf-8", errors="replace").decode("utf-8", errors="replace")
-    return await context.bot.send_message(chat_id=update.effective_chat.id, text=text, parse_mode=ParseMode.HTML)
+    chat_id = update.effective_chat.id
+    return await send_scheduler.call(chat_id, lambda: context.bot.send_message(
+        chat_id=chat_id, text=text, parse_mode=ParseMode.HTML))
 
 
 async def send_text_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, buttons: dict) -> Message:
@@ -133,21 +211,163 @@ async def send_text_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE,
     Returns:
         telegram.Message: Відповідь бота з інлайн‑кнопками.
     """
-    text = normalize_text(text)
-    # Повторна заміна проблемних байтів
-    text = str(text)
-    text = text.encode("utf-8", errors="replace").decode("utf-8", errors="replace")
     keyboard = []
     for key, value in buttons.items():
         button = InlineKeyboardButton(str(value), callback_data=str(key))
         keyboard.append([button])
     reply_markup = InlineKeyboardMarkup(keyboard)
-    return await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    return await send_scheduler.call(update.effective_chat.id, lambda: update.message.reply_text(
+        text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN))
+
+
+async def edit_progressively(message: Message, parts, min_interval: float = 1.0, reply_markup=None) -> str:
+    """Поступово редагує службове повідомлення текстом, що генерується.
+
+    Вичитує асинхронний потік фрагментів (наприклад,
+    `ChatGptService.stream_question()`) і оновлює `message` не частіше ніж раз
+    на `min_interval` секунд, щоб не впертися в ліміти Telegram на
+    редагування; перший фрагмент з’являється одразу. Редагування, що не
+    змінюють текст, пропускаються. Після завершення потоку повідомлення
+    отримує повний текст відповіді. Фрагменти очікуються вже нормалізованими
+    (див. `normalize_text()`), тож текст лише з’єднується.
+
+    Args:
+        message (telegram.Message): Службове повідомлення‑заглушка.
+        parts: Асинхронний ітератор фрагментів тексту.
+        min_interval (float): Мінімальний інтервал між редагуваннями, секунди.
+        reply_markup (InlineKeyboardMarkup | None): Кнопки, що додаються до
+            повідомлення під час фінального редагування.
+
+    Returns:
+        str: Повний текст відповіді.
+    """
+    loop = asyncio.get_running_loop()
+    shown = message.text
+    chunks = []
+    # Перший непорожній фрагмент показується одразу, наступні — не частіше min_interval
+    last_edit = -math.inf
+
+    async def edit(text, markup=None):
+        nonlocal shown, last_edit
+        if not text.strip() or (text == shown and markup is None):
+            return
+        try:
+            await send_scheduler.call(message.chat_id, lambda: message.edit_text(text, reply_markup=markup))
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+        shown = text
+        last_edit = loop.time()
+
+    async with contextlib.aclosing(parts):
+        async for part in parts:
+            chunks.append(part)
+            if loop.time() - last_edit >= min_interval:
+                await edit("".join(chunks))
+
+    text = "".join(chunks)
+    await edit(text, reply_markup)
+    return text
+
+
+async def delete_message(message: Message) -> None:
+    """Видаляє повідомлення бота (наприклад, застарілу заглушку).
+
+    Повідомлення, яке вже видалено або яке неможливо видалити, ігнорується.
+
+    Args:
+        message (telegram.Message): Повідомлення для видалення.
+    """
+    try:
+        await send_scheduler.call(message.chat_id, lambda: message.delete())
+    except BadRequest:
+        pass
+
+
+class PhotoCache:
+    """Кеш Telegram `file_id` для зображень із `resources/images/`.
+
+    Після першого завантаження файлу Telegram повертає `file_id`, за яким те
+    саме фото можна надсилати повторно без передачі байтів. Кеш запам’ятовує
+    `file_id` разом із підписом файлу (розмір і `mtime`), тож змінене
+    зображення буде завантажене наново. Вміст зберігається у JSON‑файлі й
+    переживає перезапуски та холодні старти; файл читається під час першого
+    звернення, а не під час імпорту модуля.
+
+    Атрибути:
+        path (str | None): Шлях до JSON‑файлу кешу; `None` — лише пам’ять.
+    """
+
+    def __init__(self, path=None):
+        """Ініціалізує кеш; збережені `file_id` зчитуються під час першого звернення.
+
+        Args:
+            path (str | None): Шлях до файлу кешу.
+        """
+        self.path = path
+        self._entries = None
+
+    def _loaded(self) -> dict:
+        if self._entries is None:
+            self._entries = {}
+            if self.path and os.path.exists(self.path):
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._entries = json.load(f)
+                except (OSError, ValueError) as e:
+                    print("⚠️ Photo cache is unreadable, starting empty:", e)
+        return self._entries
+
+    @staticmethod
+    def _signature(image_path):
+        try:
+            st = os.stat(image_path)
+        except OSError:
+            return None
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    def get(self, name, image_path):
+        """Повертає збережений `file_id` для зображення або `None`."""
+        entry = self._loaded().get(name)
+        if entry is None or entry["signature"] != self._signature(image_path):
+            return None
+        return entry["file_id"]
+
+    def put(self, name, image_path, file_id) -> None:
+        """Запам’ятовує `file_id` зображення і зберігає кеш на диск."""
+        self._loaded()[name] = {"file_id": file_id, "signature": self._signature(image_path)}
+        self._save()
+
+    def forget(self, name) -> None:
+        """Видаляє `file_id`, який Telegram більше не приймає."""
+        if self._loaded().pop(name, None) is not None:
+            self._save()
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print("⚠️ Photo cache is not persisted:", e)
+
+
+photo_cache = PhotoCache(os.getenv("PHOTO_CACHE_PATH", ".cache/photo_ids.json"))
 
 
 async def send_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, name: str) -> Message:
     """Відправляє фото з директорії `resources/images/` за назвою.
 
+    Якщо фото вже надсилалося раніше, замість повторного завантаження файлу
+    використовується `file_id` із `photo_cache`. Коли Telegram відхиляє
+    збережений `file_id`, фото завантажується заново.
+
     Args:
         update (telegram.Update): Апдейт із контекстом чату.
         context (ContextTypes.DEFAULT_TYPE): Контекст бота.
@@ -159,25 +379,151 @@ async def send_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, name: s
     Raises:
         FileNotFoundError: Якщо файл зображення відсутній.
     """
+    chat_id = update.effective_chat.id
     path = 'resources/images/' + name + ".jpg"
-    with open(path, 'rb') as photo:
-        return await context.bot.send_photo(chat_id=update.effective_chat.id, photo=photo)
+    file_id = photo_cache.get(name, path)
+    if file_id is not None:
+        try:
+            return await send_scheduler.call(chat_id, lambda: context.bot.send_photo(chat_id=chat_id, photo=file_id))
+        except BadRequest as e:
+            print(f"Cached file_id for '{name}' rejected, re-uploading:", e)
+            photo_cache.forget(name)
+
+    # Байти, а не файловий об’єкт: після 429 виклик повторюється з тими самими даними
+    with span("read_photo", photo=name), open(path, 'rb') as f:
+        photo = f.read()
+    message = await send_scheduler.call(chat_id, lambda: context.bot.send_photo(chat_id=chat_id, photo=photo))
+    if message.photo:
+        photo_cache.put(name, path, message.photo[-1].file_id)
+    return message
+
+
+class MenuCache:
+    """Кеш застосованих меню команд для кожного чату.
+
+    Зберігає хеш набору команд, уже встановленого в чаті, щоб не повторювати
+    `set_my_commands` і `set_chat_menu_button`, коли меню не змінилося. Записи
+    тримаються в пам’яті (LRU до `max_size`) і, якщо вказано `path`,
+    дублюються в SQLite‑файлі, тож кеш переживає перезапуски. Файл
+    відкривається під час першого звернення, а всі звернення до нього
+    виконуються у фоновому потоці (`asyncio.to_thread`), тож очікування на
+    блокування SQLite не зупиняє цикл подій.
+
+    Атрибути:
+        path (str | None): Шлях до SQLite‑файлу; `None` — лише пам’ять.
+        max_size (int): Ліміт записів у пам’яті.
+        hits (int): Скільки разів виклики Bot API було пропущено.
+        misses (int): Скільки разів меню довелося встановлювати.
+    """
+
+    def __init__(self, path=None, max_size=100_000):
+        """Ініціалізує кеш.
+
+        Args:
+            path (str | None): Шлях до SQLite‑файлу; `None` — лише пам’ять.
+            max_size (int): Ліміт записів у пам’яті.
+        """
+        self.path = path
+        self.max_size = max_size
+        self._digests = OrderedDict()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(commands: dict) -> str:
+        """Повертає хеш набору команд (з урахуванням порядку)."""
+        payload = json.dumps(list(commands.items()), ensure_ascii=False)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, chat_id):
+        """Повертає хеш меню, застосованого в чаті, або `None`."""
+        digest = self._digests.get(chat_id)
+        if digest is None and self.path:
+            row = await asyncio.to_thread(self._execute, "SELECT digest FROM menus WHERE chat_id = ?", chat_id)
+            if row is not None:
+                digest = row[0]
+                self._remember(chat_id, digest)
+        elif digest is not None:
+            self._digests.move_to_end(chat_id)
+        return digest
+
+    async def put(self, chat_id, digest) -> None:
+        """Запам’ятовує хеш меню, щойно застосованого в чаті."""
+        self._remember(chat_id, digest)
+        if self.path:
+            await asyncio.to_thread(self._execute, "INSERT OR REPLACE INTO menus (chat_id, digest) VALUES (?, ?)",
+                                    chat_id, digest)
+
+    async def forget(self, chat_id) -> None:
+        """Видаляє запис (наприклад, після приховування меню)."""
+        self._digests.pop(chat_id, None)
+        if self.path:
+            await asyncio.to_thread(self._execute, "DELETE FROM menus WHERE chat_id = ?", chat_id)
+
+    def _execute(self, sql, *params):
+        with self._db_lock:
+            db = self._connect()
+            return None if db is None else db.execute(sql, params).fetchone()
+
+    def _connect(self):
+        if self._db is None and self.path:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("CREATE TABLE IF NOT EXISTS menus (chat_id INTEGER PRIMARY KEY, digest TEXT NOT NULL)")
+                self._db = db
+            except (OSError, sqlite3.Error) as e:
+                print("⚠️ Menu cache is not persisted:", e)
+                self.path = None
+        return self._db
+
+    def _remember(self, chat_id, digest) -> None:
+        self._digests[chat_id] = digest
+        self._digests.move_to_end(chat_id)
+        if len(self._digests) > self.max_size:
+            self._digests.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Повертає розмір кешу та кількість влучань і промахів."""
+        return {"size": len(self._digests), "hits": self.hits, "misses": self.misses}
+
+
+menu_cache = MenuCache(os.getenv("MENU_CACHE_PATH", ".cache/menus.sqlite3"))
 
 
 async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, commands: dict):
     """Показує командне меню бота для поточного чату.
 
     Встановлює команди (`/start`, `/gpt`, тощо) лише в межах поточного чату,
-    а також увімкнює кнопку меню типу `MenuButtonCommands`.
+    а також увімкнює кнопку меню типу `MenuButtonCommands`. Якщо в чаті вже
+    встановлено той самий набір команд (див. `menu_cache`), виклики Bot API
+    пропускаються; інакше обидва виклики виконуються паралельно.
 
     Args:
         update (telegram.Update): Апдейт із контекстом чату.
         context (ContextTypes.DEFAULT_TYPE): Контекст бота.
         commands (dict): Відображення `команда -> опис` для меню.
     """
-    command_list = [BotCommand(key, normalize_text(value)) for key, value in commands.items()]
-    await context.bot.set_my_commands(command_list, scope=BotCommandScopeChat(chat_id=update.effective_chat.id))
-    await context.bot.set_chat_menu_button(menu_button=MenuButtonCommands(), chat_id=update.effective_chat.id)
+    chat_id = update.effective_chat.id
+    digest = MenuCache.digest(commands)
+    if await menu_cache.get(chat_id) == digest:
+        menu_cache.hits += 1
+        return
+    menu_cache.misses += 1
+
+    command_list = [BotCommand(key, value) for key, value in commands.items()]
+    await asyncio.gather(
+        send_scheduler.call(chat_id, lambda: context.bot.set_my_commands(
+            command_list, scope=BotCommandScopeChat(chat_id=chat_id)), ordered=False),
+        send_scheduler.call(chat_id, lambda: context.bot.set_chat_menu_button(
+            menu_button=MenuButtonCommands(), chat_id=chat_id), ordered=False),
+    )
+    await menu_cache.put(chat_id, digest)
 
 async def hide_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Приховує команди та кнопку меню у поточному чаті.
@@ -186,52 +532,175 @@ async def hide_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         update (telegram.Update): Апдейт із контекстом чату.
         context (ContextTypes.DEFAULT_TYPE): Контекст бота.
     """
-    await context.bot.delete_my_commands(scope=BotCommandScopeChat(chat_id=update.effective_chat.id))
-    await context.bot.set_chat_menu_button(menu_button=MenuButtonDefault(), chat_id=update.effective_chat.id)
+    chat_id = update.effective_chat.id
+    await menu_cache.forget(chat_id)
+    await asyncio.gather(
+        send_scheduler.call(chat_id, lambda: context.bot.delete_my_commands(
+            scope=BotCommandScopeChat(chat_id=chat_id)), ordered=False),
+        send_scheduler.call(chat_id, lambda: context.bot.set_chat_menu_button(
+            menu_button=MenuButtonDefault(), chat_id=chat_id), ordered=False),
+    )
+
+
+class ResourceRegistry:
+    """Попередньо завантажені текстові ресурси з `resources/messages` і `resources/prompts`.
+
+    Усі файли зчитуються й нормалізуються один раз під час створення реєстру,
+    тож пошук ресурсу — це звернення до словника. Не частіше ніж раз на
+    `check_interval` секунд реєстр перевіряє `mtime` файлів і перечитує лише
+    змінені (а також підхоплює нові й прибирає видалені). Примусово оновити
+    ресурси можна викликом `reload()`.
+
+    Атрибути:
+        root (str): Кореневий каталог ресурсів.
+        kinds (tuple): Підкаталоги, що завантажуються (`messages`, `prompts`).
+        check_interval (float | None): Як часто перевіряти `mtime`, секунди;
+            `None` вимикає автоматичне перезавантаження.
+    """
+
+    def __init__(self, root="resources", kinds=("messages", "prompts"), check_interval=5.0, clock=time.monotonic):
+        """Ініціалізує реєстр і завантажує всі ресурси.
+
+        Args:
+            root (str): Кореневий каталог ресурсів.
+            kinds (tuple): Підкаталоги з `.txt` файлами.
+            check_interval (float | None): Період перевірки `mtime`, секунди.
+            clock (callable): Джерело монотонного часу (для тестів).
+        """
+        self.root = root
+        self.kinds = kinds
+        self.check_interval = check_interval
+        self._clock = clock
+        self._texts = {}
+        self._mtimes = {}
+        self._checked_at = 0.0
+        self.reload()
+
+    def reload(self) -> int:
+        """Перечитує ресурси, `mtime` яких змінився.
+
+        Returns:
+            int: Кількість перечитаних файлів.
+        """
+        seen = set()
+        loaded = 0
+        for kind in self.kinds:
+            directory = os.path.join(self.root, kind)
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".txt"):
+                        continue
+                    key = (kind, entry.name[:-4])
+                    seen.add(key)
+                    mtime = entry.stat().st_mtime_ns
+                    if self._mtimes.get(key) == mtime:
+                        continue
+                    with open(entry.path, "r", encoding="utf-8", errors="replace") as f:
+                        self._texts[key] = normalize_text(f.read())
+                    self._mtimes[key] = mtime
+                    loaded += 1
+        for key in set(self._texts) - seen:
+            del self._texts[key]
+            del self._mtimes[key]
+        self._checked_at = self._clock()
+        return loaded
+
+    def get(self, kind, name) -> str:
+        """Повертає нормалізований текст ресурсу.
+
+        Raises:
+            KeyError: Якщо ресурсу `kind/name` не існує.
+        """
+        if self.check_interval is not None and self._clock() - self._checked_at >= self.check_interval:
+            self.reload()
+        return self._texts[(kind, name)]
+
+    def require(self, kind, names) -> None:
+        """Перевіряє наявність ресурсів; викликається під час старту.
+
+        Raises:
+            KeyError: Якщо бракує хоча б одного з ресурсів.
+        """
+        missing = [name for name in names if (kind, name) not in self._texts]
+        if missing:
+            raise KeyError(f"Missing {kind} resources: {', '.join(missing)}")
+
+
+resources = ResourceRegistry(check_interval=float(os.getenv("RESOURCE_RELOAD_INTERVAL", "5")))
 
 
 def load_message(name):
-    """Завантажує текст повідомлення з `resources/messages/`.
+    """Повертає текст повідомлення з `resources/messages/`.
 
     Args:
         name (str): Ім'я файлу без розширення (`.txt`).
 
     Returns:
-        str: Вміст файлу.
+        str: Нормалізований вміст файлу з `resources`.
     """
-    path = f"resources/messages/{name}.txt"
-    with open(path, "r", encoding="utf-8", errors="replace") as f:
-        text = f.read()
-    return normalize_text(text)
+    with span("load_resource", resource=f"messages/{name}"):
+        return resources.get("messages", name)
 
 
 def load_prompt(name):
-    """Завантажує текст промпта з `resources/prompts/`.
+    """Повертає текст промпта з `resources/prompts/`.
 
     Args:
         name (str): Ім'я файлу без розширення (`.txt`).
 
     Returns:
-        str: Вміст файлу.
+        str: Нормалізований вміст файлу з `resources`.
     """
-    path = f"resources/prompts/{name}.txt"
-    with open(path, "r", encoding="utf-8", errors="replace") as f:
-        text = f.read()
-    return normalize_text(text)
+    with span("load_resource", resource=f"prompts/{name}"):
+        return resources.get("prompts", name)
 
 
 class Dialog:
-    """Порожній контейнер для стану діалогу.
-
-    У поточній реалізації клас не має атрибутів та методів. У коді бота йому
-    динамічно додаються поля на кшталт `mode`, `list`, `user`, `counter`.
-
-    Приклад використання (псевдокод):
-
-        dialog = Dialog()
-        dialog.mode = None
-        dialog.list = []
-        dialog.user = {}
-        dialog.counter = 0
+    """Стан діалогу одного чату.
+
+    Екземпляри зберігаються у `session.SessionStore` окремо для кожного
+    `effective_chat.id`. Клас використовує `__slots__`, щоб сесія займала
+    мінімум пам’яті навіть за сотень тисяч активних чатів.
+
+    Атрибути:
+        mode (str | None): Активний режим (`gpt`, `date`, `message`, ...).
+        list (list): Зібрані повідомлення листування в режимі `message`.
+        user (dict): Відповіді анкети в режимах `profile` та `opener`.
+        counter (int): Номер поточного кроку анкети.
+        last_question (tuple | None): Останній одноразовий запит
+            `(назва промпта, текст, текст заглушки)` — для кнопки «Інший варіант».
+        touched (float): Час останнього звернення (заповнює сховище сесій).
     """
-    pass
+    __slots__ = ("mode", "list", "user", "counter", "last_question", "touched")
+
+    def __init__(self):
+        self.mode = None
+        self.list = []
+        self.user = {}
+        self.counter = 0
+        self.last_question = None
+        self.touched = 0.0
+
+    def to_state(self) -> dict:
+        """Повертає JSON‑сумісний стан діалогу (для `state.StateBackend`)."""
+        return {
+            "mode": self.mode,
+            "list": self.list,
+            "user": self.user,
+            "counter": self.counter,
+            "last_question": self.last_question,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "Dialog":
+        """Відновлює діалог зі стану, збереженого `to_state()`."""
+        dialog = cls()
+        dialog.mode = state.get("mode")
+        dialog.list = state.get("list", [])
+        dialog.user = state.get("user", {})
+        dialog.counter = state.get("counter", 0)
+        last_question = state.get("last_question")
+        dialog.last_question = tuple(last_question) if last_question else None
+        return dialog